@@ -0,0 +1,129 @@
+"""
+Benchmark reviewing all sections of a synthetic paper with one query per expert
+(language and domain expert), and with one combined query per section.
+
+Queries are made to a simulated GenAI client, with a latency that grows with the
+number of input tokens.
+
+Run with:
+    python3 -m benchmarks.benchmark_combined_reviews
+"""
+
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable
+
+from genai_latex_proofreader.genai_interface.anthropic import GenAIClient
+from genai_latex_proofreader.genai_proofreader.chunking import estimate_tokens
+from genai_latex_proofreader.genai_proofreader.proofreaders.combined import (
+    proofread_one_section_combined,
+)
+from genai_latex_proofreader.genai_proofreader.proofreaders.domain_expert import (
+    proofread_one_section_by_expert,
+)
+from genai_latex_proofreader.genai_proofreader.proofreaders.language_expert import (
+    proofread_one_section_for_language,
+)
+from genai_latex_proofreader.latex_interface.data_model import (
+    ContentReferenceBase,
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+)
+
+# Simulated latency of a query: fixed part, and per 1000 input tokens
+LATENCY_SECONDS: float = 0.05
+LATENCY_SECONDS_PER_1K_INPUT_TOKENS: float = 0.01
+
+REPORT: str = "\\begin{enumerate}\n" + "\\item An issue.\n" * 20 + "\\end{enumerate}"
+
+
+class _SimulatedClient(GenAIClient):
+    def make_query(self, system_prompt: str, user_prompt: str, label: str) -> str:
+        self._next_call_id()
+        input_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+        time.sleep(
+            LATENCY_SECONDS + LATENCY_SECONDS_PER_1K_INPUT_TOKENS * input_tokens / 1000
+        )
+
+        # answer combined queries with one report per requested persona
+        personas = re.findall(r'<reviewer name="([a-z]+)">', user_prompt)
+        response = (
+            "\n".join(f"<{p}_report>\n{REPORT}\n</{p}_report>" for p in personas)
+            if len(personas) > 0
+            else REPORT
+        )
+        self.usage.record_query(label, input_tokens, estimate_tokens(response))
+        return response
+
+
+def _synthetic_doc(nr_sections: int, lines_per_section: int) -> LatexDocument:
+    content_dict: dict[ContentReferenceBase, list[str]] = {
+        PreSectionRef(in_appendix=False): []
+    }
+    for section_idx in range(nr_sections):
+        content_dict[
+            SectionRef(
+                in_appendix=False,
+                title=f"Section {section_idx}",
+                label=None,
+                generated_label=f"sec:genai:generated:label:{section_idx}",
+            )
+        ] = [
+            f"Line {line_idx} of section {section_idx}, with some text $x^2 + y^2$."
+            for line_idx in range(lines_per_section)
+        ]
+
+    return LatexDocument(
+        pre_matter=[r"\documentclass{article}"],
+        begin_document=[],
+        content_dict=content_dict,
+        bibliography=[],
+    )
+
+
+def _per_persona(client: GenAIClient, doc: LatexDocument) -> list[Callable]:
+    return [
+        review
+        for ref in doc.content_dict.keys()
+        for review in [
+            lambda ref=ref: list(proofread_one_section_for_language(client, doc, ref)),
+            lambda ref=ref: list(proofread_one_section_by_expert(client, doc, ref)),
+        ]
+    ]
+
+
+def _combined(client: GenAIClient, doc: LatexDocument) -> list[Callable]:
+    return [
+        lambda ref=ref: list(proofread_one_section_combined(client, doc, ref))
+        for ref in doc.content_dict.keys()
+    ]
+
+
+def run_benchmarks() -> Iterable[str]:
+    doc = _synthetic_doc(nr_sections=20, lines_per_section=50)
+
+    yield (
+        f"{'mode':<12} {'queries':>8} {'input tokens':>13} {'output tokens':>14} "
+        f"{'wall time (s)':>14}"
+    )
+    for mode, reviews in [("per-persona", _per_persona), ("combined", _combined)]:
+        with tempfile.TemporaryDirectory() as log_dir:
+            client = _SimulatedClient(Path(log_dir), max_tokens=2000)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda review: review(), reviews(client, doc)))
+            wall_time = time.perf_counter() - started
+
+        yield (
+            f"{mode:<12} {client.calls:>8} {client.usage.input_tokens:>13} "
+            f"{client.usage.output_tokens:>14} {wall_time:>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    for line in run_benchmarks():
+        print(line)
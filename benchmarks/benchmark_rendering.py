@@ -0,0 +1,84 @@
+"""
+Benchmark rendering of a synthetic 10k-line LaTeX document with to_latex.
+
+Run with:
+    python3 -m benchmarks.benchmark_rendering
+"""
+
+import time
+from typing import Callable, Iterable
+
+from genai_latex_proofreader.latex_interface.data_model import (
+    ContentReferenceBase,
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+    clear_render_cache,
+    to_latex,
+)
+from genai_latex_proofreader.proofread_comments.add_comments import CommentOverlay
+
+
+def _synthetic_doc(nr_sections: int, lines_per_section: int) -> LatexDocument:
+    content_dict: dict[ContentReferenceBase, list[str]] = {
+        PreSectionRef(in_appendix=False): []
+    }
+    for section_idx in range(nr_sections):
+        content_dict[
+            SectionRef(
+                in_appendix=False,
+                title=f"Section {section_idx}",
+                label=None,
+                generated_label=f"sec:genai:generated:label:{section_idx}",
+            )
+        ] = [
+            f"Line {line_idx} of section {section_idx}, with some text $x^2 + y^2$."
+            for line_idx in range(lines_per_section)
+        ]
+
+    return LatexDocument(
+        pre_matter=[r"\documentclass{article}"],
+        begin_document=[],
+        content_dict=content_dict,
+        bibliography=[],
+    )
+
+
+def _timed(f: Callable[[], object], repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        f()
+    return (time.perf_counter() - started) / repeats
+
+
+def run_benchmarks() -> Iterable[str]:
+    repeats: int = 100
+    doc = _synthetic_doc(nr_sections=100, lines_per_section=100)
+    section_refs = list(doc.content_dict.keys())
+    overlay = CommentOverlay(doc)
+
+    def _uncached():
+        clear_render_cache()
+        to_latex(overlay.materialize())
+        object.__setattr__(doc, "_latex", None)
+
+    def _one_comment_added():
+        # a new document that differs from 'doc' by one comment
+        to_latex(overlay.add(section_refs[50], ["A comment"]).materialize())
+
+    to_latex(doc)
+    benchmarks: list[tuple[str, Callable[[], object]]] = [
+        ("render (no caches)", _uncached),
+        ("render same document", lambda: to_latex(doc)),
+        ("render with one comment added", _one_comment_added),
+    ]
+
+    yield f"{'lines':>10} {'benchmark':<32} {'ms / render':>12}"
+    nr_lines = to_latex(doc).count("\n") + 1
+    for name, f in benchmarks:
+        yield f"{nr_lines:>10} {name:<32} {1000 * _timed(f, repeats):>12.3f}"
+
+
+if __name__ == "__main__":
+    for line in run_benchmarks():
+        print(line)
@@ -0,0 +1,72 @@
+"""
+Benchmark the splitters in utils.splitters on synthetic inputs.
+
+Run with:
+    python3 -m benchmarks.benchmark_splitters
+"""
+
+import time
+from typing import Callable, Iterable, Optional
+
+from genai_latex_proofreader.utils.splitters import (
+    split_indices_at_lambda,
+    split_indices_at_lambdas,
+    split_list_at_lambda,
+    split_list_at_lambdas,
+)
+
+
+def _synthetic_lines(nr_lines: int, nr_split_points: int) -> list[str]:
+    every: int = max(nr_lines // nr_split_points, 1)
+    return [
+        r"\section{Title}" if idx % every == 0 else f"Line {idx} of the document."
+        for idx in range(nr_lines)
+    ]
+
+
+def _is_section(line: str) -> Optional[str]:
+    return line if line.startswith(r"\section") else None
+
+
+def _timed(f: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    f()
+    return time.perf_counter() - started
+
+
+def run_benchmarks() -> Iterable[str]:
+    yield f"{'lines':>10} {'splits':>8} {'function':<26} {'seconds':>8}"
+    for nr_lines in [10**5, 10**6]:
+        for nr_split_points in [1_000, 5_000]:
+            lines = _synthetic_lines(nr_lines, nr_split_points)
+            # one lambda per split point (as when splitting at a fixed sequence
+            # of markers)
+            lambdas: list[Callable[[str], Optional[str]]] = [
+                _is_section
+            ] * nr_split_points
+
+            benchmarks: list[tuple[str, Callable[[], object]]] = [
+                (
+                    "split_indices_at_lambda",
+                    lambda: split_indices_at_lambda(lines, _is_section),
+                ),
+                (
+                    "split_list_at_lambda",
+                    lambda: split_list_at_lambda(lines, _is_section),
+                ),
+                (
+                    "split_indices_at_lambdas",
+                    lambda: split_indices_at_lambdas(lines, lambdas),
+                ),
+                (
+                    "split_list_at_lambdas",
+                    lambda: split_list_at_lambdas(lines, lambdas),
+                ),
+            ]
+            for name, f in benchmarks:
+                yield f"{nr_lines:>10} {nr_split_points:>8} {name:<26} {_timed(f):>8.3f}"
+
+
+if __name__ == "__main__":
+    for line in run_benchmarks():
+        print(line)
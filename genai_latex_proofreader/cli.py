@@ -1,12 +1,33 @@
+import atexit
+import sys
 from argparse import ArgumentParser
 from pathlib import Path
 
 from .compile_latex import compile_latex, compile_latex_doc
-from .genai_interface.anthropic import GenAIClient
+from .genai_interface.anthropic import DEFAULT_ROUTING, GenAIClient
+from .genai_interface.hedging import Hedger, HedgingPolicy
+from .genai_interface.routing import load_routing_table
+from .genai_interface.spend import SpendGuard, SpendLimits
+from .genai_proofreader.budget import RunBudget
+from .genai_proofreader.context import ContextMode
+from .genai_proofreader.incremental import (
+    IncrementalReviews,
+    ProofreadState,
+    StalenessPolicy,
+    load_state,
+    save_state,
+)
 from .genai_proofreader.runner import proofread_paper
 from .latex_interface.data_model import LatexDocument, to_summary, write_latex
 from .latex_interface.parser import parse_latex_from_files
 from .utils.io import read_directory, write_directory
+from .utils.profiling import RunProfiler, stage, start_profiling, stop_profiling
+from .utils.run_store import RunStore
+from .utils.tracing import enable_tracing, span
+
+# Exit status when the report is partial (reviews skipped, shortened or refused due
+# to the deadline, budget or spend limits)
+EXIT_PARTIAL_BUDGET: int = 3
 
 
 def args():
@@ -21,21 +42,196 @@ def args():
         required=True,
         type=Path,
     )
+    parser.add_argument(
+        "--state_file",
+        required=False,
+        type=Path,
+        default=None,
+        help=(
+            "Incremental mode: reuse reviews of unchanged sections from the previous "
+            "run stored in this file, and store the reviews of this run in it."
+        ),
+    )
+    parser.add_argument(
+        "--max_stale_runs",
+        required=False,
+        type=int,
+        default=0,
+        help=(
+            "Incremental mode: number of consecutive runs that reviews using the "
+            "entire paper as context (domain expert) may be reused after other parts "
+            "of the paper changed. Default: 0 (always re-run these)."
+        ),
+    )
+    parser.add_argument(
+        "--context",
+        required=False,
+        type=str,
+        choices=[mode.value for mode in ContextMode],
+        default=ContextMode.FULL.value,
+        help=(
+            "Context for domain expert section reviews: the entire paper (full), "
+            "the section and summaries of the other sections (compressed), or the "
+            "section and an index of notation, definitions and labels (notation)."
+        ),
+    )
+    parser.add_argument(
+        "--combined_reviews",
+        action="store_true",
+        help=(
+            "Review each section by the language and domain experts with one query "
+            "(instead of one query per expert)."
+        ),
+    )
+    parser.add_argument(
+        "--structured_output",
+        action="store_true",
+        help=(
+            "Section reviews return issues as structured output (using tool use), "
+            "that are rendered to LaTeX locally. This avoids most LaTeX errors in "
+            "generated reports."
+        ),
+    )
+    parser.add_argument(
+        "--stream_check",
+        action="store_true",
+        help=(
+            "Section reviews are streamed, and checked while they are generated. "
+            "Reviews that go off-format (eg. unbalanced LaTeX environments, or "
+            "sectioning commands) are aborted early and retried."
+        ),
+    )
+    parser.add_argument(
+        "--deadline",
+        required=False,
+        type=float,
+        default=None,
+        help=(
+            "Time budget (in seconds) for proofreading. As the deadline nears, "
+            "reviews of the appendix (and then of main sections) are made with "
+            "shorter reports, and then skipped. The report notes what was skipped."
+        ),
+    )
+    parser.add_argument(
+        "--budget",
+        required=False,
+        type=int,
+        default=None,
+        help=(
+            "Token budget (input and output tokens) for proofreading. Reviews are "
+            "degraded and skipped as for --deadline."
+        ),
+    )
+    for name, value_type, description in [
+        ("--max_input_tokens", int, "input tokens"),
+        ("--max_output_tokens", int, "output tokens"),
+        ("--max_cost_usd", float, "estimated cost (in USD)"),
+    ]:
+        parser.add_argument(
+            name,
+            required=False,
+            type=value_type,
+            default=None,
+            help=(
+                f"Hard limit on the total {description} of the run. Queries that do "
+                "not fit in the remaining budget (using an estimate of their size) "
+                "are made with a smaller max_tokens, or refused. The exit status is "
+                f"{EXIT_PARTIAL_BUDGET} if the report is partial."
+            ),
+        )
+    parser.add_argument(
+        "--routing_file",
+        required=False,
+        type=Path,
+        default=None,
+        help=(
+            "JSON file with the model (and max_tokens) per query label or persona, "
+            "with optional escalation to a stronger model (see "
+            "genai_interface/routing.py). By default, LaTeX fixes are made with a "
+            "fast model, and escalated if the fix does not compile."
+        ),
+    )
+    parser.add_argument(
+        "--hedge_percentile",
+        required=False,
+        type=float,
+        default=None,
+        help=(
+            "Hedge slow queries: a query that takes longer than this percentile "
+            "(eg. 0.95) of the latencies of earlier queries is duplicated, and the "
+            "first response is used. Default: no hedging."
+        ),
+    )
+    parser.add_argument(
+        "--max_hedge_fraction",
+        required=False,
+        type=float,
+        default=HedgingPolicy().max_hedge_fraction,
+        help="Maximum fraction of queries that are hedged (to limit extra spend).",
+    )
+    parser.add_argument(
+        "--run_store",
+        required=False,
+        type=Path,
+        default=None,
+        help=(
+            "SQLite database where GenAI queries and LaTeX compiles of the run are "
+            "recorded, instead of writing a text log per query. Text logs can be "
+            "exported with 'python3 -m genai_latex_proofreader.utils.run_store'."
+        ),
+    )
+    parser.add_argument(
+        "--trace",
+        required=False,
+        type=Path,
+        default=None,
+        help=(
+            "Write a trace of the run (parsing, compiles, GenAI queries, LaTeX guard "
+            "fix-ups) to this JSON file, in Chrome trace format (eg. to open in "
+            "https://ui.perfetto.dev)."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=(
+            "Profile the run: print the top functions by cumulative time (cProfile), "
+            "the time and peak memory of each stage (tracemalloc), the number of TeX "
+            "invocations, and the bytes copied by read_directory and write_directory."
+        ),
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     print(f"--- genai-latex-proofreader ---")
+    tracer = enable_tracing() if args().trace is not None else None
+    if tracer is not None:
+        # the trace is written also if the run fails
+        atexit.register(tracer.write_chrome_trace, args().trace)
+    profiler = start_profiling(RunProfiler()) if args().profile else None
+
     input_directory: Path = args().input_latex_path.parent
     main_file: Path = args().input_latex_path.relative_to(input_directory)
 
-    files_in_scope = read_directory(input_directory)
+    with stage("read input"):
+        files_in_scope = read_directory(input_directory)
     print("Files in scope")
     for file, content in files_in_scope.items():
         print(f"{file}   ({len(content)} bytes)")
 
+    run_store = RunStore(args().run_store) if args().run_store is not None else None
+    if run_store is not None:
+        print(f"Recording queries and compiles in {args().run_store} ...")
+        # queued records are written also if the run fails (a successful run
+        # closes the run store below)
+        atexit.register(run_store.close)
+
     # Check that we can parse the main Latex file
-    output = compile_latex(files_in_scope, main_file)
+    with stage("compile input"):
+        output = compile_latex(
+            files_in_scope, main_file, run_store=run_store, label="input"
+        )
 
     # Check that input LaTeX document compiles successfully
     if output[-1].returncode == 0:
@@ -43,23 +239,28 @@ if __name__ == "__main__":
     else:
         raise Exception(
             f"Input LaTeX document {main_file} did not compile successfully [FAIL]:\n"
+            f" - status: {output[-1].status.value}\n"
             f" - returncode: {output[-1].returncode}\n"
             f" - stdout: {output[-1].stdout}\n"
             f" - stderr: {output[-1].stderr}\n"
         )
 
-    doc = parse_latex_from_files(files_in_scope, main_file)
+    with stage("parse input"):
+        doc = parse_latex_from_files(files_in_scope, main_file)
 
     print(f"Input LaTeX document {main_file} parses successfully [OK]")
     print("--- Summary ---")
     print(to_summary(doc))
 
     print(" --- Testing that parsed input LaTeX document compiles ---")
-    output = compile_latex_doc(doc, Path("report.tex"))
-    write_directory(
-        files=output[-1].output_files,
-        directory=args().output_report_filepath.parent / "compiled_input",
-    )
+    with stage("compile parsed input"):
+        output = compile_latex_doc(
+            doc, Path("report.tex"), run_store=run_store, label="parsed input"
+        )
+        write_directory(
+            files=output[-1].output_files,
+            directory=args().output_report_filepath.parent / "compiled_input",
+        )
     if output[-1].returncode == 0:
         print(
             f"Input LaTeX document {main_file} compiled successfully after parsing [OK]"
@@ -67,6 +268,7 @@ if __name__ == "__main__":
     else:
         raise Exception(
             f"Input LaTeX document {main_file} did not compile successfully after parsing. Please inspect files in <output-dir>/compiled_input [FAIL]:\n"
+            f" - status: {output[-1].status.value}\n"
             f" - returncode: {output[-1].returncode}\n"
             f" - stdout: {output[-1].stdout}\n"
             f" - stderr: {output[-1].stderr}\n"
@@ -74,27 +276,122 @@ if __name__ == "__main__":
 
     print(" - Setting up GenAI client ...")
     log_output_path: Path = args().output_report_filepath.parent / "gen-ai-queries"
-    client = GenAIClient(log_output_path=log_output_path, max_tokens=2000)
+    limits = SpendLimits(
+        max_input_tokens=args().max_input_tokens,
+        max_output_tokens=args().max_output_tokens,
+        max_cost_usd=args().max_cost_usd,
+    )
+    client = GenAIClient(
+        log_output_path=log_output_path,
+        max_tokens=2000,
+        spend=SpendGuard(limits) if limits != SpendLimits() else None,
+        routing=(
+            load_routing_table(args().routing_file)
+            if args().routing_file is not None
+            else DEFAULT_ROUTING
+        ),
+        hedging=(
+            Hedger(
+                HedgingPolicy(
+                    percentile=args().hedge_percentile,
+                    max_hedge_fraction=args().max_hedge_fraction,
+                )
+            )
+            if args().hedge_percentile is not None
+            else None
+        ),
+        run_store=run_store,
+    )
+
+    incremental = IncrementalReviews(
+        doc,
+        previous=(
+            load_state(args().state_file)
+            if args().state_file is not None
+            else ProofreadState()
+        ),
+        policy=StalenessPolicy(max_stale_runs=args().max_stale_runs),
+    )
+
+    budget = (
+        RunBudget(
+            deadline_seconds=args().deadline,
+            max_tokens=args().budget,
+            usage=client.usage,
+        )
+        if args().deadline is not None or args().budget is not None
+        else None
+    )
 
     print(" --- Starting proofreading process ---")
-    report: LatexDocument = proofread_paper(client, doc)
+    with stage("proofread"), span("proofread_paper"):
+        report: LatexDocument = proofread_paper(
+            client,
+            doc,
+            incremental,
+            context_mode=ContextMode(args().context),
+            combined_reviews=args().combined_reviews,
+            structured_output=args().structured_output,
+            stream_check=args().stream_check,
+            budget=budget,
+        ).materialize()
+    print(client.usage.summary())
+    if client.spend is not None:
+        print(client.spend.summary())
+    if client.hedging is not None:
+        print(client.hedging.summary())
+
+    if args().state_file is not None:
+        print(f" --- Writing proofreading state to {args().state_file} ---")
+        save_state(incremental.state, args().state_file)
 
     print(
         f" --- Writing report (and supporting files) to {args().output_report_filepath} ---"
     )
-    write_latex(report, args().output_report_filepath)
+    with stage("write report"):
+        write_latex(report, args().output_report_filepath)
 
     print(" --- Compiling report ---")
-    output = compile_latex_doc(report, Path(args().output_report_filepath.name))
-
-    write_directory(output[-1].output_files, args().output_report_filepath.parent)
+    with stage("compile report"):
+        output = compile_latex_doc(
+            report,
+            Path(args().output_report_filepath.name),
+            run_store=run_store,
+            label="report",
+        )
+        write_directory(output[-1].output_files, args().output_report_filepath.parent)
 
     if output[-1].returncode == 0:
         print(f"Report compiled successfully [OK]")
     else:
         raise Exception(
             f"Final report did not compile successfully [FAIL]:\n"
+            f" - status: {output[-1].status.value}\n"
             f" - returncode: {output[-1].returncode}\n"
             f" - stdout: {output[-1].stdout}\n"
             f" - stderr: {output[-1].stderr}\n"
         )
+
+    if run_store is not None:
+        # all records (including the compile of the report) are written before the
+        # summary. If records were not stored, the error ends the run (exit status 1).
+        atexit.unregister(run_store.close)
+        try:
+            run_store.close()
+        finally:
+            print(run_store.summary())
+
+    if profiler is not None:
+        stop_profiling()
+        print(profiler.summary())
+
+    if tracer is not None:
+        print(tracer.summary())
+        tracer.write_chrome_trace(args().trace)
+        print(f"Trace written to {args().trace}")
+
+    if (client.spend is not None and client.spend.partial) or (
+        budget is not None and budget.partial
+    ):
+        print("Report is partial due to the budget of the run [PARTIAL]")
+        sys.exit(EXIT_PARTIAL_BUDGET)
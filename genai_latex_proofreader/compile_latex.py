@@ -1,10 +1,19 @@
+import time
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Optional
 
 from genai_latex_proofreader.latex_interface.data_model import LatexDocument
 
 from .latex_interface.data_model import to_latex
-from .utils.run_commands import CommandResult, run_commands
+from .utils.profiling import count_tex_invocations
+from .utils.run_commands import (
+    DEFAULT_COMMAND_LIMITS,
+    CommandLimits,
+    CommandResult,
+    run_commands,
+)
+from .utils.run_store import CompileRecord, RunStore
+from .utils.tracing import span
 
 
 def _compile_commands(path: Path) -> list[str]:
@@ -26,6 +35,9 @@ def compile_latex(
     files: dict[Path, bytes],
     main_file: Path,
     compile_commands: Callable[[Path], list[str]] = _compile_commands,
+    limits: CommandLimits = DEFAULT_COMMAND_LIMITS,
+    run_store: Optional[RunStore] = None,
+    label: str = "compile",
 ) -> list[CommandResult]:
     """
     Compile a LaTeX document from the provided files.
@@ -33,18 +45,43 @@ def compile_latex(
     Args:
         files: files to create in the temp directory
         main_file: Path to the main LaTeX file
+        limits: time, memory and output limits for each compile command. These stop
+            a compile that hangs (eg. due to an infinite macro loop).
+        run_store: optional run store where the outcome of the compile is recorded
+            (with 'label')
 
     Returns:
         Output after running the compile commands (return value from run_commands).
     """
-
-    return run_commands(files, compile_commands(main_file))
+    started = time.perf_counter()
+    with span("compile_latex", label=label, main_file=main_file) as compile_span:
+        results = run_commands(files, compile_commands(main_file), limits)
+        count_tex_invocations(len(results))
+        compile_span.set(
+            status=results[-1].status.value, returncode=results[-1].returncode
+        )
+    if run_store is not None:
+        run_store.record_compile(
+            CompileRecord(
+                label=label,
+                status=results[-1].status.value,
+                returncode=results[-1].returncode,
+                succeeded=results[-1].succeeded,
+                seconds=time.perf_counter() - started,
+                stdout=results[-1].stdout,
+                stderr=results[-1].stderr,
+            )
+        )
+    return results
 
 
 def compile_latex_doc(
     doc: LatexDocument,
     doc_path: Path,
     compile_commands: Callable[[Path], list[str]] = _compile_commands,
+    limits: CommandLimits = DEFAULT_COMMAND_LIMITS,
+    run_store: Optional[RunStore] = None,
+    label: str = "compile",
 ) -> list[CommandResult]:
     return compile_latex(
         files={
@@ -53,4 +90,7 @@ def compile_latex_doc(
         },
         main_file=doc_path,
         compile_commands=compile_commands,
+        limits=limits,
+        run_store=run_store,
+        label=label,
     )
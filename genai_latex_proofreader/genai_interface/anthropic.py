@@ -1,91 +1,854 @@
+import asyncio
+import copy
 import datetime
 import json
+import threading
+import time
+from dataclasses import replace
 from pathlib import Path
+from typing import Any, Awaitable, Callable, Generator, Optional, TypeVar, cast
 
 import anthropic
 import httpx
 
+from ..genai_proofreader.chunking import estimate_tokens
+from ..utils.run_store import QueryRecord, RunStore
+from ..utils.tracing import span
+from .hedging import Hedger, QueryCancelled
+from .query_log import write_query_log
+from .routing import Route, RoutingDecision, RoutingTable
+from .single_flight import SingleFlight, prompt_key
+from .spend import Admission, SpendGuard, TokenPrices
+from .usage import UsageLedger
 
-def make_query(system_prompt: str, user_prompt: str, max_tokens: int) -> str:
+MODEL: str = "claude-3-5-sonnet-20240620"
+# MODEL: str = "claude-3-opus-20240229"
+# MODEL: str = "claude-3-haiku-20240307"  # fast testing
+
+# Fast and cheap model for mechanical tasks (eg. fixing LaTeX errors)
+FAST_MODEL: str = "claude-3-haiku-20240307"
+
+# Prices (USD per million tokens) used to estimate the cost of a run
+MODEL_PRICES: dict[str, TokenPrices] = {
+    "claude-3-5-sonnet-20240620": TokenPrices(3.0, 15.0),
+    "claude-3-opus-20240229": TokenPrices(15.0, 75.0),
+    "claude-3-haiku-20240307": TokenPrices(0.25, 1.25),
+}
+
+# LaTeX fixes are first made with the fast model, and escalated to MODEL if the
+# fixed snippet still does not compile. Other queries use MODEL.
+DEFAULT_ROUTING = RoutingTable(
+    routes={"latex-guard": Route(model=FAST_MODEL, escalate_to=MODEL)},
+    default=Route(model=MODEL),
+)
+
+
+_TIMEOUT = httpx.Timeout(pool=10.0, read=200.0, write=10.0, connect=10.0)
+
+
+def _anthropic_client() -> anthropic.Anthropic:
+    return anthropic.Anthropic(timeout=_TIMEOUT, max_retries=10)
+
+
+def _async_anthropic_client() -> anthropic.AsyncAnthropic:
+    return anthropic.AsyncAnthropic(timeout=_TIMEOUT, max_retries=10)
+
+
+def _message_params(
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int,
+    model: str,
+    tool: Optional[dict[str, Any]] = None,
+) -> dict[str, Any]:
+    # parameters of a query (with a tool that must be used, for structured output)
+    params: dict[str, Any] = dict(
+        max_tokens=max_tokens,
+        system=system_prompt,
+        messages=[
+            {
+                "role": "user",
+                "content": user_prompt,
+            }
+        ],
+        model=model,
+    )
+    if tool is not None:
+        params.update(
+            tools=[cast(anthropic.types.ToolParam, tool)],
+            tool_choice={"type": "tool", "name": tool["name"]},
+        )
+    return params
+
+
+def _check_cancelled(cancelled: Optional[threading.Event]):
+    if cancelled is not None and cancelled.is_set():
+        raise QueryCancelled()
+
+
+class _StreamedResponse:
+    """
+    Text and token usage of a streamed response, from its events (used by the sync
+    and async streaming queries).
+
+    The API reports the output tokens at the end of the response. For a response that
+    is closed before, the output tokens are estimated from the text received so far.
+    """
+
+    def __init__(
+        self,
+        on_usage: Callable[[dict], None],
+        cancelled: Optional[threading.Event],
+    ):
+        self.on_usage = on_usage
+        self.cancelled = cancelled
+        self.usage: dict = {}
+        self.parts: list[str] = []
+        self.completed: bool = False
+
+    def handle(self, event: Any) -> Optional[str]:
+        """
+        Report the usage of an event, and return its text (if any). Raises
+        QueryCancelled if the query is cancelled.
+        """
+        text: Optional[str] = None
+        if event.type == "message_start":
+            self.usage["input_tokens"] = event.message.usage.input_tokens
+            self.usage["output_tokens"] = event.message.usage.output_tokens
+            self.on_usage(dict(self.usage))
+        elif event.type == "message_delta":
+            self.usage["output_tokens"] = event.usage.output_tokens
+            self.on_usage(dict(self.usage))
+            self.completed = True
+        elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+            text = event.delta.text
+            self.parts.append(text)
+        # checked after the usage of the event is reported, so that the usage of a
+        # cancelled query is settled
+        _check_cancelled(self.cancelled)
+        return text
+
+    def close(self):
+        if not self.completed and "input_tokens" in self.usage:
+            self.usage["output_tokens"] = max(
+                self.usage["output_tokens"], estimate_tokens("".join(self.parts))
+            )
+            self.on_usage(dict(self.usage))
+        print("usage:", self.usage)  # token usage
+
+
+def _tool_input(
+    response: anthropic.types.Message,
+    tool: dict[str, Any],
+    on_usage: Callable[[dict], None],
+) -> dict[str, Any]:
+    # report the usage of a (tool) query, and return the input to the tool
+    print("usage:", response.usage)  # token usage
+    on_usage(
+        {
+            "input_tokens": response.usage.input_tokens,
+            "output_tokens": response.usage.output_tokens,
+        }
+    )
+    for content_part in response.content:
+        if content_part.type == "tool_use":
+            assert isinstance(content_part.input, dict)
+            return content_part.input
+
+    raise Exception(f"make_tool_query: response did not use tool {tool['name']}")
+
+
+def make_query(
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int,
+    on_usage: Callable[[dict], None] = lambda usage: None,
+    model: str = MODEL,
+    cancelled: Optional[threading.Event] = None,
+) -> str:
     """
     Make LLM query to Anthropic Opus API
 
+    Token usage reported by the API is passed to 'on_usage'. If 'cancelled' is set,
+    the response is closed (and QueryCancelled is raised).
+
     https://github.com/anthropics/anthropic-sdk-python
     https://support.anthropic.com/en/articles/8324991-about-claude-pro-usage
     """
-    client = anthropic.Anthropic(
-        timeout=httpx.Timeout(pool=10.0, read=200.0, write=10.0, connect=10.0),
-        max_retries=10,
+    # Note: we are using the streaming API. This seemed more stable with
+    # large input text, while the non-streaming API often failed (no
+    # connection to server??, 4/2024)
+    return "".join(
+        stream_query(
+            system_prompt,
+            user_prompt,
+            max_tokens,
+            on_usage=on_usage,
+            model=model,
+            cancelled=cancelled,
+        )
+    )
+
+
+def stream_query(
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int,
+    on_usage: Callable[[dict], None] = lambda usage: None,
+    model: str = MODEL,
+    cancelled: Optional[threading.Event] = None,
+) -> Generator[str, None, None]:
+    """
+    Make LLM query, and yield the text of the response as it is generated. Closing
+    the generator closes the response (eg. to abort a generation).
+
+    Token usage reported by the API (so far) is passed to 'on_usage' (see
+    _StreamedResponse). If 'cancelled' is set, the response is closed at the next
+    event (and QueryCancelled is raised).
+
+    https://docs.anthropic.com/en/api/messages-streaming
+    """
+    response = _StreamedResponse(on_usage, cancelled)
+    try:
+        with _anthropic_client().messages.stream(
+            **_message_params(system_prompt, user_prompt, max_tokens, model)
+        ) as stream:
+            for event in stream:
+                text = response.handle(event)
+                if text is not None:
+                    yield text
+    finally:
+        response.close()
+
+
+def make_tool_query(
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int,
+    tool: dict[str, Any],
+    on_usage: Callable[[dict], None] = lambda usage: None,
+    model: str = MODEL,
+    cancelled: Optional[threading.Event] = None,
+) -> dict[str, Any]:
+    """
+    Make LLM query where the response is the input to a tool (ie. structured output
+    following the input schema of the tool).
+
+    The query is not streamed, so it can only be cancelled (with 'cancelled') before
+    it is sent.
+
+    https://docs.anthropic.com/en/docs/build-with-claude/tool-use
+    """
+    _check_cancelled(cancelled)
+    response = _anthropic_client().messages.create(
+        **_message_params(system_prompt, user_prompt, max_tokens, model, tool)
+    )
+    return _tool_input(response, tool, on_usage)
+
+
+async def async_make_query(
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int,
+    on_usage: Callable[[dict], None] = lambda usage: None,
+    model: str = MODEL,
+    cancelled: Optional[threading.Event] = None,
+) -> str:
+    """
+    As make_query, with the async client of the SDK. Cancelling the awaiting task
+    (or setting 'cancelled') closes the response at the next event.
+    """
+    response = _StreamedResponse(on_usage, cancelled)
+    try:
+        async with _async_anthropic_client().messages.stream(
+            **_message_params(system_prompt, user_prompt, max_tokens, model)
+        ) as stream:
+            async for event in stream:
+                response.handle(event)
+    finally:
+        response.close()
+    return "".join(response.parts)
+
+
+async def async_make_tool_query(
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: int,
+    tool: dict[str, Any],
+    on_usage: Callable[[dict], None] = lambda usage: None,
+    model: str = MODEL,
+    cancelled: Optional[threading.Event] = None,
+) -> dict[str, Any]:
+    """
+    As make_tool_query, with the async client of the SDK.
+    """
+    _check_cancelled(cancelled)
+    response = await _async_anthropic_client().messages.create(
+        **_message_params(system_prompt, user_prompt, max_tokens, model, tool)
     )
+    return _tool_input(response, tool, on_usage)
+
 
-    def _get_api_response():
-        # Note: we are using the streaming API. This seemed more stable with
-        # large input text, while the non-streaming API often failed (no
-        # connection to server??, 4/2024)
-        with client.messages.with_streaming_response.create(
-            max_tokens=max_tokens,
-            system=system_prompt,
-            messages=[
-                {
-                    "role": "user",
-                    "content": user_prompt,
-                }
-            ],
-            model="claude-3-5-sonnet-20240620",
-            # model="claude-3-opus-20240229",
-            # model="claude-3-haiku-20240307",  # fast testing
-        ) as response:
-            for line_message in response.iter_lines():
-                line = json.loads(line_message)
-                print("usage:", line["usage"])  # token usage
-                for content_part in line["content"]:
-                    assert content_part["type"] == "text"
-                    yield content_part["text"]
-
-    return "\n".join(_get_api_response())
-
-
-class GenAIClient:
-    def __init__(self, log_output_path: Path, max_tokens: int):
+T = TypeVar("T")
+C = TypeVar("C", bound="_BaseClient")
+
+
+class _CallCounter:
+    def __init__(self):
         self.calls: int = 0
+        self.lock = threading.Lock()
+
+
+class _BaseClient:
+    """
+    Routing, spend limits, usage, call ids and logs of GenAI clients (see
+    GenAIClient and AsyncGenAIClient).
+    """
+
+    def __init__(
+        self,
+        log_output_path: Path,
+        max_tokens: int,
+        spend: Optional[SpendGuard] = None,
+        routing: RoutingTable = DEFAULT_ROUTING,
+        run_store: Optional[RunStore] = None,
+    ):
+        # shared with clients returned by with_max_tokens and escalated
+        self._counter = _CallCounter()
         self.max_tokens: int = max_tokens
         self.log_output_path: Path = log_output_path
+        self.usage = UsageLedger()
+        self.spend: Optional[SpendGuard] = spend
+        self.routing: RoutingTable = routing
+        self.run_store: Optional[RunStore] = run_store
+        # concurrent identical queries are made once
+        self._single_flight: SingleFlight = SingleFlight()
+        self._escalated: bool = False
+        # title of the section that queries are about (recorded in the run store)
+        self.section: Optional[str] = None
         log_output_path.mkdir(parents=True, exist_ok=True)
 
-    def make_query(self, system_prompt: str, user_prompt: str, label: str) -> str:
-        response = make_query(system_prompt, user_prompt, self.max_tokens)
+    @property
+    def calls(self) -> int:
+        return self._counter.calls
+
+    def _next_call_id(self) -> int:
+        with self._counter.lock:
+            call_id = self._counter.calls
+            self._counter.calls += 1
+            return call_id
 
-        # make filename more friendly for filesystems
-        for char in [" ", ":", "'", '"', "$", "{", "}", "\\", "/", "^"]:
-            label = label.replace(char, "_")
+    def _route(self, label: str) -> RoutingDecision:
+        return self.routing.route(label, MODEL, self.max_tokens, self._escalated)
+
+    def _admit(
+        self,
+        decision: RoutingDecision,
+        system_prompt: str,
+        user_prompt: str,
+        label: str,
+    ) -> tuple[RoutingDecision, Optional[Admission]]:
+        # check that a routed query fits in the spend limits (returns the routing
+        # decision with the admitted max_tokens, and the reservation)
+        if self.spend is None:
+            return decision, None
+        admission = self.spend.admit(
+            label,
+            system_prompt,
+            user_prompt,
+            decision.max_tokens,
+            MODEL_PRICES.get(decision.model, MODEL_PRICES[MODEL]),
+        )
+        return replace(decision, max_tokens=admission.max_tokens), admission
 
-        while "__" in label:
-            label = label.replace("__", "_", 1)
+    def _settle(self, admission: Optional[Admission], usage: dict):
+        # replace the reservation of a query by its usage (also when it failed)
+        if admission is not None and self.spend is not None:
+            self.spend.settle(
+                admission, usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+            )
 
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename: str = f"{timestamp}-{label}.txt"
+    def with_max_tokens(self: C, max_tokens: int) -> C:
+        """
+        Return client that makes queries with another 'max_tokens' (and shares call
+        ids, usage and logs with this client).
+        """
+        client = copy.copy(self)
+        client.max_tokens = max_tokens
+        return client
 
-        print("Writing log to ", self.log_output_path / filename)
-        (self.log_output_path / filename).write_text(
-            f"""Call # {self.calls}
-{80 * '='}
-SYSTEM PROMPT:
-{80 * '-'}
-{system_prompt}
-{80 * '-'}
+    def escalated(self: C) -> C:
+        """
+        Return client whose queries are escalated to the stronger model of their
+        route (for routes with a cascade, eg. after the output of the fast model
+        failed validation).
+        """
+        client = copy.copy(self)
+        client._escalated = True
+        return client
 
-USER PROMPT:
-{80 * '-'}
-{user_prompt}
-{80 * '-'}
+    def for_section(self: C, section: str) -> C:
+        """
+        Return client whose queries are recorded as queries about 'section' (eg. the
+        title of the reviewed section), and that shares call ids, usage and logs with
+        this client.
+        """
+        client = copy.copy(self)
+        client.section = section
+        return client
 
-RESPONSE:
-{80 * '-'}
-{response}
-{80 * '='}
-"""
+    def _record_usage(self, decision: RoutingDecision, label: str, usage: dict):
+        self.usage.record_query(
+            label,
+            usage.get("input_tokens", 0),
+            usage.get("output_tokens", 0),
+            model=decision.model,
+            route=decision.route,
+            escalated=decision.escalated,
+        )
+
+    def _query_key(
+        self,
+        decision: RoutingDecision,
+        system_prompt: str,
+        user_prompt: str,
+        tool: Optional[dict[str, Any]],
+    ) -> str:
+        # identical queries (same prompts, tool, model and max_tokens) have the
+        # same key
+        return prompt_key(
+            decision.model,
+            str(decision.max_tokens),
+            json.dumps(tool, sort_keys=True),
+            system_prompt,
+            user_prompt,
+        )
+
+    def _log_query(
+        self,
+        call_id: int,
+        label: str,
+        system_prompt: str,
+        user_prompt: str,
+        response: str,
+        decision: RoutingDecision,
+        usage: dict,
+        started: float,
+    ):
+        # record query in the run store, or write its text log (see query_log.py)
+        if self.run_store is not None:
+            self.run_store.record_query(
+                QueryRecord(
+                    call_id=call_id,
+                    label=label,
+                    system_prompt=system_prompt,
+                    user_prompt=user_prompt,
+                    response=response,
+                    model=decision.model,
+                    route=decision.route,
+                    escalated=decision.escalated,
+                    input_tokens=usage.get("input_tokens", 0),
+                    output_tokens=usage.get("output_tokens", 0),
+                    latency_seconds=time.perf_counter() - started,
+                    section=self.section,
+                )
+            )
+            return
+
+        path = write_query_log(
+            self.log_output_path,
+            datetime.datetime.now(),
+            call_id,
+            label,
+            system_prompt,
+            user_prompt,
+            response,
+        )
+        print("Writing log to ", path)
+
+
+class GenAIClient(_BaseClient):
+    """
+    Client to make GenAI queries, and log them. Queries can be made from multiple
+    threads.
+    """
+
+    def __init__(
+        self,
+        log_output_path: Path,
+        max_tokens: int,
+        spend: Optional[SpendGuard] = None,
+        routing: RoutingTable = DEFAULT_ROUTING,
+        hedging: Optional[Hedger] = None,
+        run_store: Optional[RunStore] = None,
+    ):
+        """
+        Args:
+            log_output_path: Directory where queries are logged
+            max_tokens:      Maximum output tokens per query
+            spend:           Optional spend limits of the run. Queries that do not fit
+                             in the remaining budget are rerouted with a smaller
+                             max_tokens, or refused (raising BudgetExceeded).
+            routing:         Model (and max_tokens) per query label or persona
+            hedging:         Optional hedging of slow queries (with a duplicate
+                             request)
+            run_store:       Optional run store where queries are recorded (instead
+                             of writing a text log per query to log_output_path)
+        """
+        super().__init__(
+            log_output_path,
+            max_tokens,
+            spend=spend,
+            routing=routing,
+            run_store=run_store,
+        )
+        self.hedging: Optional[Hedger] = hedging
+
+    def _run_query(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        label: str,
+        request: Callable[
+            [RoutingDecision, Callable[[dict], None], Optional[threading.Event]], T
+        ],
+        tool: Optional[dict[str, Any]] = None,
+    ) -> tuple[T, RoutingDecision, dict]:
+        # route, admit, and make a query with 'request' (called with the routing
+        # decision, a callback for the usage, and a cancellation event). Returns the
+        # result, with the admitted routing decision and the usage of the query.
+        # With hedging, a slow query is duplicated (the usage of both is recorded).
+        # Concurrent identical queries (same prompts, tool, model and max_tokens)
+        # wait for one query (the usage is returned to that query only).
+        decision = self._route(label)
+
+        def _attempt(
+            cancelled: Optional[threading.Event], is_hedge: bool
+        ) -> tuple[T, RoutingDecision, dict]:
+            admitted, admission = self._admit(
+                decision, system_prompt, user_prompt, label
+            )
+            usage: dict = {}
+            succeeded: bool = False
+            try:
+                with span(
+                    "genai request", label=label, model=admitted.model, hedge=is_hedge
+                ):
+                    result = request(admitted, usage.update, cancelled)
+                succeeded = True
+                return result, admitted, usage
+            finally:
+                self._settle(admission, usage)
+                if succeeded or len(usage) > 0:
+                    self._record_usage(
+                        admitted, f"{label} (hedge)" if is_hedge else label, usage
+                    )
+
+        def _query() -> tuple[T, RoutingDecision, dict]:
+            if self.hedging is None:
+                return _attempt(None, False)
+            return self.hedging.run(f"{decision.route}: {decision.model}", _attempt)
+
+        with span("make_query", label=label, route=decision.route) as query_span:
+            (result, admitted, usage), shared = self._single_flight.do(
+                self._query_key(decision, system_prompt, user_prompt, tool), _query
+            )
+            query_span.set(model=admitted.model, shared=shared, **usage)
+        if shared:
+            print(f"Query {label} was identical to a query in flight (not repeated)")
+            self.usage.record_deduplicated(label)
+            return result, admitted, {}
+        return result, admitted, usage
+
+    def make_query(self, system_prompt: str, user_prompt: str, label: str) -> str:
+        call_id: int = self._next_call_id()
+        started = time.perf_counter()
+        response, decision, usage = self._run_query(
+            system_prompt,
+            user_prompt,
+            label,
+            lambda decision, on_usage, cancelled: make_query(
+                system_prompt,
+                user_prompt,
+                decision.max_tokens,
+                on_usage=on_usage,
+                model=decision.model,
+                cancelled=cancelled,
+            ),
+        )
+
+        self._log_query(
+            call_id,
+            label,
+            system_prompt,
+            user_prompt,
+            response,
+            decision,
+            usage,
+            started,
         )
-        self.calls += 1
 
         assert isinstance(response, str)
         return response
+
+    def stream_query(
+        self, system_prompt: str, user_prompt: str, label: str
+    ) -> Generator[str, None, None]:
+        """
+        Make query, and yield the text of the response as it is generated (see
+        stream_query). Closing the generator aborts the query; the text generated so
+        far is logged.
+
+        Streamed queries are routed and admitted as other queries, but are not
+        hedged or deduplicated.
+        """
+        call_id: int = self._next_call_id()
+        started = time.perf_counter()
+        decision, admission = self._admit(
+            self._route(label),
+            system_prompt,
+            user_prompt,
+            label,
+        )
+
+        usage: dict = {}
+        parts: list[str] = []
+        completed: bool = False
+        response = stream_query(
+            system_prompt,
+            user_prompt,
+            decision.max_tokens,
+            on_usage=usage.update,
+            model=decision.model,
+        )
+        with span("stream_query", label=label, model=decision.model) as query_span:
+            try:
+                for text in response:
+                    parts.append(text)
+                    yield text
+                completed = True
+            finally:
+                response.close()
+                self._settle(admission, usage)
+                self._record_usage(decision, label, usage)
+                query_span.set(completed=completed, **usage)
+                self._log_query(
+                    call_id,
+                    label,
+                    system_prompt,
+                    user_prompt,
+                    "".join(parts) + ("" if completed else "\n[aborted]"),
+                    decision,
+                    usage,
+                    started,
+                )
+
+    def make_structured_query(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        tool: dict[str, Any],
+        label: str,
+    ) -> dict[str, Any]:
+        """
+        Make query where the response is the input to 'tool' (see make_tool_query).
+        """
+        call_id: int = self._next_call_id()
+        started = time.perf_counter()
+        response, decision, usage = self._run_query(
+            system_prompt,
+            user_prompt,
+            label,
+            lambda decision, on_usage, cancelled: make_tool_query(
+                system_prompt,
+                user_prompt,
+                decision.max_tokens,
+                tool,
+                on_usage=on_usage,
+                model=decision.model,
+                cancelled=cancelled,
+            ),
+            tool=tool,
+        )
+        self._log_query(
+            call_id,
+            label,
+            system_prompt,
+            user_prompt,
+            json.dumps(response, indent=2),
+            decision,
+            usage,
+            started,
+        )
+        # the response may be shared with identical queries
+        return copy.deepcopy(response)
+
+
+class AsyncGenAIClient(_BaseClient):
+    """
+    Client to make GenAI queries from asyncio tasks (with the async client of the
+    SDK), and log them. At most 'max_concurrency' queries are made at a time; other
+    queries wait for their turn without blocking the event loop.
+
+    Queries are cancelled cooperatively: cancelling the awaiting task closes the
+    response, and `cancel` stops all queries (running queries stop at the next part
+    of their response, waiting queries are not made).
+
+    A client (and the clients returned by with_max_tokens and escalated) is used in
+    one event loop.
+
+    The section reviews of the personas can be made with this client with
+    async_reviews.review_section. The command line uses GenAIClient.
+    """
+
+    def __init__(
+        self,
+        log_output_path: Path,
+        max_tokens: int,
+        max_concurrency: int = 8,
+        spend: Optional[SpendGuard] = None,
+        routing: RoutingTable = DEFAULT_ROUTING,
+        run_store: Optional[RunStore] = None,
+    ):
+        """
+        Args:
+            log_output_path: Directory where queries are logged
+            max_tokens:      Maximum output tokens per query
+            max_concurrency: Maximum number of queries made at a time (shared with
+                             clients returned by with_max_tokens and escalated)
+            spend:           Optional spend limits of the run (see GenAIClient)
+            routing:         Model (and max_tokens) per query label or persona
+            run_store:       Optional run store where queries are recorded (see
+                             GenAIClient)
+        """
+        super().__init__(
+            log_output_path,
+            max_tokens,
+            spend=spend,
+            routing=routing,
+            run_store=run_store,
+        )
+        self.max_concurrency: int = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Cancel all queries (raising QueryCancelled), including later queries.
+        """
+        self._cancelled.set()
+
+    async def _run_query(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        label: str,
+        request: Callable[
+            [RoutingDecision, Callable[[dict], None], threading.Event], Awaitable[T]
+        ],
+        tool: Optional[dict[str, Any]] = None,
+    ) -> tuple[T, RoutingDecision, dict]:
+        # as GenAIClient._run_query (without hedging). Queries are admitted when
+        # their turn comes, so that only running queries reserve spend.
+        decision = self._route(label)
+
+        async def _query() -> tuple[T, RoutingDecision, dict]:
+            async with self._semaphore:
+                if self._cancelled.is_set():
+                    raise QueryCancelled()
+                admitted, admission = self._admit(
+                    decision, system_prompt, user_prompt, label
+                )
+                usage: dict = {}
+                succeeded: bool = False
+                try:
+                    with span("genai request", label=label, model=admitted.model):
+                        result = await request(admitted, usage.update, self._cancelled)
+                    succeeded = True
+                    return result, admitted, usage
+                finally:
+                    self._settle(admission, usage)
+                    if succeeded or len(usage) > 0:
+                        self._record_usage(admitted, label, usage)
+
+        with span("make_query", label=label, route=decision.route) as query_span:
+            (result, admitted, usage), shared = await self._single_flight.do_async(
+                self._query_key(decision, system_prompt, user_prompt, tool), _query
+            )
+            query_span.set(model=admitted.model, shared=shared, **usage)
+        if shared:
+            print(f"Query {label} was identical to a query in flight (not repeated)")
+            self.usage.record_deduplicated(label)
+            return result, admitted, {}
+        return result, admitted, usage
+
+    async def make_query(self, system_prompt: str, user_prompt: str, label: str) -> str:
+        call_id: int = self._next_call_id()
+        started = time.perf_counter()
+        response, decision, usage = await self._run_query(
+            system_prompt,
+            user_prompt,
+            label,
+            lambda decision, on_usage, cancelled: async_make_query(
+                system_prompt,
+                user_prompt,
+                decision.max_tokens,
+                on_usage=on_usage,
+                model=decision.model,
+                cancelled=cancelled,
+            ),
+        )
+
+        await asyncio.to_thread(
+            self._log_query,
+            call_id,
+            label,
+            system_prompt,
+            user_prompt,
+            response,
+            decision,
+            usage,
+            started,
+        )
+        return response
+
+    async def make_structured_query(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        tool: dict[str, Any],
+        label: str,
+    ) -> dict[str, Any]:
+        """
+        Make query where the response is the input to 'tool' (see make_tool_query).
+        """
+        call_id: int = self._next_call_id()
+        started = time.perf_counter()
+        response, decision, usage = await self._run_query(
+            system_prompt,
+            user_prompt,
+            label,
+            lambda decision, on_usage, cancelled: async_make_tool_query(
+                system_prompt,
+                user_prompt,
+                decision.max_tokens,
+                tool,
+                on_usage=on_usage,
+                model=decision.model,
+                cancelled=cancelled,
+            ),
+            tool=tool,
+        )
+        await asyncio.to_thread(
+            self._log_query,
+            call_id,
+            label,
+            system_prompt,
+            user_prompt,
+            json.dumps(response, indent=2),
+            decision,
+            usage,
+            started,
+        )
+        # the response may be shared with identical queries
+        return copy.deepcopy(response)
@@ -0,0 +1,154 @@
+"""
+Hedged requests: when a GenAI query takes longer than a latency threshold (a
+percentile of the latencies of earlier queries in the run), a duplicate request is
+made. Whichever request finishes first wins, and the other is cancelled.
+
+Requests are cancelled cooperatively: each request gets an event that is set when it
+should stop (eg. a streaming response is closed when the event is set).
+
+The number of hedged requests is capped to a fraction of all queries (to limit the
+extra spend).
+"""
+
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class QueryCancelled(Exception):
+    """
+    A request was cancelled (since a hedged duplicate finished first).
+    """
+
+
+@dataclass(frozen=True)
+class HedgingPolicy:
+    # requests slower than this percentile of earlier latencies are hedged
+    percentile: float = 0.95
+
+    # number of latencies needed (per key) before requests are hedged
+    min_samples: int = 5
+
+    # requests are never hedged before this delay
+    min_delay_seconds: float = 5.0
+
+    # maximum number of hedged requests, as a fraction of all queries
+    max_hedge_fraction: float = 0.1
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """
+    Return the value at 'fraction' (between 0 and 1) of the sorted values.
+    """
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, math.ceil(fraction * len(values)) - 1))]
+
+
+class Hedger:
+    """
+    Thread-safe runner of hedged requests, with the latency history of the run.
+    """
+
+    def __init__(self, policy: HedgingPolicy = HedgingPolicy(), max_workers: int = 16):
+        self.policy = policy
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hedging"
+        )
+
+        self._lock = threading.Lock()
+        # latencies of completed requests, by key (eg. the route of the query)
+        self._latencies: dict[str, list[float]] = {}
+        self.queries: int = 0
+        self.hedged: int = 0
+        self.hedge_wins: int = 0
+
+    def threshold(self, key: str) -> Optional[float]:
+        """
+        Latency after which a request with 'key' is hedged (None: not enough
+        history).
+        """
+        with self._lock:
+            latencies = list(self._latencies.get(key, []))
+        if len(latencies) < self.policy.min_samples:
+            return None
+        return max(
+            self.policy.min_delay_seconds,
+            percentile(latencies, self.policy.percentile),
+        )
+
+    def _record_latency(self, key: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(key, []).append(seconds)
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            if self.hedged + 1 > self.policy.max_hedge_fraction * self.queries:
+                return False
+            self.hedged += 1
+            return True
+
+    def run(self, key: str, request: Callable[[threading.Event, bool], T]) -> T:
+        """
+        Run 'request' (called with a cancellation event, and whether the call is the
+        hedged duplicate), and return the result of the first successful call.
+        """
+        with self._lock:
+            self.queries += 1
+        threshold = self.threshold(key)
+
+        def _timed(cancelled: threading.Event, is_hedge: bool) -> T:
+            start = time.perf_counter()
+            result = request(cancelled, is_hedge)
+            if not cancelled.is_set():
+                self._record_latency(key, time.perf_counter() - start)
+            return result
+
+        cancel_events: dict[Future, threading.Event] = {}
+
+        def _submit(is_hedge: bool) -> Future:
+            cancelled = threading.Event()
+            future = self._executor.submit(_timed, cancelled, is_hedge)
+            cancel_events[future] = cancelled
+            return future
+
+        primary = _submit(is_hedge=False)
+        done, _ = wait([primary], timeout=threshold)
+        if len(done) == 0 and self._may_hedge():
+            print(f"Hedging: request ({key}) slower than {threshold:.1f}s, hedged")
+            _submit(is_hedge=True)
+
+        pending: set[Future] = set(cancel_events.keys())
+        try:
+            while True:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                # prefer a successful result; raise the error of the primary request
+                # only if all requests failed
+                for future in done:
+                    if future.exception() is None:
+                        if future is not primary:
+                            with self._lock:
+                                self.hedge_wins += 1
+                        return future.result()
+                if len(pending) == 0:
+                    return primary.result()
+        finally:
+            for cancelled in cancel_events.values():
+                cancelled.set()
+
+    def summary(self) -> str:
+        def _summary() -> Iterable[str]:
+            yield "--- Hedged requests ---"
+            yield f" - Queries: {self.queries}"
+            yield f" - Hedged: {self.hedged}"
+            if self.hedged > 0:
+                yield (
+                    f" - Hedge won: {self.hedge_wins} "
+                    f"({100 * self.hedge_wins / self.hedged:.0f}%)"
+                )
+
+        return "\n".join(_summary())
@@ -0,0 +1,74 @@
+"""
+Human-readable text logs of GenAI queries (one file per query). The logs are written
+by the GenAI clients, or exported from a run store (see utils/run_store.py).
+"""
+
+import datetime
+import itertools
+from pathlib import Path
+
+
+def query_log_filename(
+    timestamp: datetime.datetime, call_id: int, label: str, suffix: str = ""
+) -> str:
+    # make filename more friendly for filesystems
+    for char in [" ", ":", "'", '"', "$", "{", "}", "\\", "/", "^"]:
+        label = label.replace(char, "_")
+
+    while "__" in label:
+        label = label.replace("__", "_", 1)
+
+    time: str = timestamp.strftime("%Y-%m-%d_%H-%M-%S")
+    return f"{time}-{call_id:04d}-{label}{suffix}.txt"
+
+
+def query_log_text(
+    call_id: int, system_prompt: str, user_prompt: str, response: str
+) -> str:
+    return f"""Call # {call_id}
+{80 * '='}
+SYSTEM PROMPT:
+{80 * '-'}
+{system_prompt}
+{80 * '-'}
+
+USER PROMPT:
+{80 * '-'}
+{user_prompt}
+{80 * '-'}
+
+RESPONSE:
+{80 * '-'}
+{response}
+{80 * '='}
+"""
+
+
+def write_query_log(
+    directory: Path,
+    timestamp: datetime.datetime,
+    call_id: int,
+    label: str,
+    system_prompt: str,
+    user_prompt: str,
+    response: str,
+) -> Path:
+    """
+    Write log of a query to a new file in 'directory', and return its path.
+
+    The file is created exclusively, so that logs of clients sharing the directory
+    (with the same call id and label in the same second) are not overwritten.
+    """
+    content = query_log_text(call_id, system_prompt, user_prompt, response)
+    for attempt in itertools.count():
+        path = directory / query_log_filename(
+            timestamp, call_id, label, f"-{attempt}" if attempt > 0 else ""
+        )
+        try:
+            with path.open("x") as log_file:
+                log_file.write(content)
+        except FileExistsError:
+            continue
+        return path
+
+    raise AssertionError("unreachable")
@@ -0,0 +1,107 @@
+"""
+Routing of GenAI queries to models: a routing table maps query labels (eg.
+"latex-guard") or personas (labels start with the role of the persona, eg.
+"English language expert") to a model and max_tokens.
+
+A route can have a cascade: queries are first made with a fast model, and are
+escalated to a stronger model when the output fails validation (eg. when the LaTeX
+guard still can not compile a fixed snippet).
+
+Routing tables can be loaded from JSON files, eg.:
+
+    {
+        "latex-guard": {"model": "<fast model>", "escalate_to": "<strong model>"},
+        "Summary of section": {"model": "<fast model>", "max_tokens": 500},
+        "default": {"model": "<strong model>"}
+    }
+"""
+
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Mapping, Optional
+
+
+@dataclass(frozen=True)
+class Route:
+    model: str
+
+    # maximum output tokens (at most the max_tokens of the client; None: the
+    # max_tokens of the client)
+    max_tokens: Optional[int] = None
+
+    # model used for escalated queries (None: no cascade)
+    escalate_to: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class RoutingDecision:
+    # name of the route in the routing table ("default" if no route matched)
+    route: str
+    model: str
+    max_tokens: int
+    escalated: bool
+
+
+@dataclass(frozen=True)
+class RoutingTable:
+    # routes by label prefix (the longest matching prefix is used)
+    routes: Mapping[str, Route] = field(default_factory=dict)
+    default: Optional[Route] = None
+
+    def route(
+        self, label: str, default_model: str, max_tokens: int, escalated: bool = False
+    ) -> RoutingDecision:
+        """
+        Return the model and max_tokens for a query with 'label'. Queries that do not
+        match any route (and without a default route) use 'default_model'.
+        """
+        matches = [prefix for prefix in self.routes.keys() if label.startswith(prefix)]
+        if len(matches) > 0:
+            name = max(matches, key=len)
+            route: Route = self.routes[name]
+        else:
+            name = "default"
+            route = self.default if self.default is not None else Route(default_model)
+
+        model = route.model
+        if escalated and route.escalate_to is not None:
+            model = route.escalate_to
+        else:
+            escalated = False
+
+        return RoutingDecision(
+            route=name,
+            model=model,
+            max_tokens=(
+                min(route.max_tokens, max_tokens)
+                if route.max_tokens is not None
+                else max_tokens
+            ),
+            escalated=escalated,
+        )
+
+
+def _route_from_json(name: str, value: Any) -> Route:
+    if not isinstance(value, dict) or "model" not in value:
+        raise ValueError(f"Invalid route {name}: {value} (a model is required)")
+    unknown = set(value.keys()) - {"model", "max_tokens", "escalate_to"}
+    if len(unknown) > 0:
+        raise ValueError(f"Invalid route {name}: unknown keys {sorted(unknown)}")
+    return Route(
+        model=value["model"],
+        max_tokens=value.get("max_tokens"),
+        escalate_to=value.get("escalate_to"),
+    )
+
+
+def load_routing_table(path: Path) -> RoutingTable:
+    """
+    Load routing table from JSON file (see above). The "default" route is used for
+    queries that do not match any other route.
+    """
+    routes = {
+        name: _route_from_json(name, value)
+        for name, value in json.loads(path.read_text()).items()
+    }
+    return RoutingTable(routes=routes, default=routes.pop("default", None))
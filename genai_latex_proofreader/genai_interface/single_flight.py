@@ -0,0 +1,138 @@
+"""
+Single-flight deduplication: concurrent calls with the same key (eg. a hash of the
+prompts of a GenAI query) share one call. The first caller makes the call, and
+callers arriving while it is in flight wait for its result (or exception) instead of
+making the call again.
+
+Calls are tracked with concurrent.futures futures, so callers in threads (`do`) and
+in asyncio tasks (`do_async`, possibly in different event loops) can share a call.
+Once a call is done, the next call with the same key is made again (results are not
+cached).
+
+Errors of the call are passed to the waiting callers. If the caller making the call
+is cancelled (eg. its asyncio task), the waiting callers are not: one of them makes
+the call instead.
+"""
+
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def prompt_key(*parts: str) -> str:
+    """
+    Hash of the parts of a query (eg. model, system and user prompt).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = part.encode("utf-8")
+        # include the length, so that eg. ("ab", "c") and ("a", "bc") differ
+        digest.update(f"{len(encoded)}:".encode("utf-8"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+# result of a call whose caller left without a result (eg. its task was cancelled)
+_ABANDONED = object()
+
+
+class SingleFlight(Generic[T]):
+    """
+    Thread-safe (and asyncio-safe) single-flight group.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, Future] = {}
+        # number of calls that waited for a call in flight
+        self.shared: int = 0
+
+    def _join(self, key: str) -> tuple[Future, bool]:
+        # return the future of the call in flight, and if the caller should make it
+        with self._lock:
+            if key in self._in_flight:
+                return self._in_flight[key], False
+            future: Future = Future()
+            self._in_flight[key] = future
+            return future, True
+
+    def _count_shared(self):
+        with self._lock:
+            self.shared += 1
+
+    def _done(
+        self,
+        key: str,
+        future: Future,
+        result: object = None,
+        error: Optional[BaseException] = None,
+    ):
+        # pass the outcome of a call to the waiting callers
+        with self._lock:
+            del self._in_flight[key]
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, Exception):
+            future.set_exception(error)
+        else:
+            # the caller was cancelled (or interrupted), not the call: a waiting
+            # caller makes the call instead
+            future.set_result(_ABANDONED)
+
+    def do(self, key: str, fn: Callable[[], T]) -> tuple[T, bool]:
+        """
+        Call 'fn', or wait for the call in flight with the same key. Returns the
+        result, and if it was shared with another caller.
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                result = future.result()
+            except Exception:
+                self._count_shared()
+                raise
+            if result is not _ABANDONED:
+                self._count_shared()
+                return result, True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._done(key, future, error=e)
+            raise
+        self._done(key, future, result)
+        return result, False
+
+    async def do_async(
+        self, key: str, fn: Callable[[], Awaitable[T]]
+    ) -> tuple[T, bool]:
+        """
+        As `do`, for coroutines. Waiting does not block the event loop.
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            # shield: cancelling a waiting caller does not cancel the shared call
+            try:
+                result = await asyncio.shield(asyncio.wrap_future(future))
+            except Exception:
+                self._count_shared()
+                raise
+            if result is not _ABANDONED:
+                self._count_shared()
+                return result, True
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._done(key, future, error=e)
+            raise
+        self._done(key, future, result)
+        return result, False
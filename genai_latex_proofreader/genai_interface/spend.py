@@ -0,0 +1,188 @@
+"""
+Hard limits on the GenAI spend of a run: total input tokens, output tokens and
+estimated cost (in USD).
+
+Before each query, an admission check reserves the estimated input tokens (see
+`estimate_tokens`) and the maximum output tokens of the query. A query that does not
+fit in the remaining budget is rerouted with a smaller max_tokens (when enough output
+tokens remain), or refused by raising BudgetExceeded. When the query is done, its
+reservation is replaced by the usage reported by the API.
+"""
+
+import math
+import threading
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from ..genai_proofreader.chunking import estimate_tokens
+
+# Queries that can use fewer output tokens than this are refused (not rerouted)
+MIN_OUTPUT_TOKENS: int = 256
+
+
+class BudgetExceeded(Exception):
+    """
+    A query was refused since it would exceed the spend limits of the run.
+    """
+
+
+@dataclass(frozen=True)
+class TokenPrices:
+    input_usd_per_mtok: float
+    output_usd_per_mtok: float
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (
+            input_tokens * self.input_usd_per_mtok
+            + output_tokens * self.output_usd_per_mtok
+        ) / 1_000_000
+
+
+@dataclass(frozen=True)
+class SpendLimits:
+    # None: no limit
+    max_input_tokens: Optional[int] = None
+    max_output_tokens: Optional[int] = None
+    max_cost_usd: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class Admission:
+    label: str
+
+    # estimated input tokens, and maximum output tokens, reserved for the query
+    input_tokens: int
+    max_tokens: int
+
+    # token prices of the model used for the query
+    prices: TokenPrices
+
+    @property
+    def cost_usd(self) -> float:
+        return self.prices.cost(self.input_tokens, self.max_tokens)
+
+
+class SpendGuard:
+    """
+    Thread-safe admission check of queries against the spend limits of a run.
+    """
+
+    def __init__(self, limits: SpendLimits):
+        self.limits = limits
+
+        self._lock = threading.Lock()
+        # usage reported by the API, and reserved for queries not yet done
+        self.input_tokens: int = 0
+        self.output_tokens: int = 0
+        self.cost_usd: float = 0.0
+        self._reserved_input_tokens: int = 0
+        self._reserved_output_tokens: int = 0
+        self._reserved_cost_usd: float = 0.0
+
+        self.rerouted: list[str] = []
+        self.refused: list[str] = []
+
+    @property
+    def partial(self) -> bool:
+        """
+        Were any queries refused or rerouted (ie. is the output of the run partial)?
+        """
+        return len(self.refused) + len(self.rerouted) > 0
+
+    def _remaining_output_tokens(self, input_tokens: int, prices: TokenPrices) -> float:
+        # remaining output tokens if a query with 'input_tokens' is admitted
+        if (
+            self.limits.max_input_tokens is not None
+            and self.input_tokens + self._reserved_input_tokens + input_tokens
+            > self.limits.max_input_tokens
+        ):
+            return 0
+
+        remaining: list[float] = [math.inf]
+        if self.limits.max_output_tokens is not None:
+            remaining.append(
+                self.limits.max_output_tokens
+                - self.output_tokens
+                - self._reserved_output_tokens
+            )
+        if self.limits.max_cost_usd is not None:
+            remaining_usd = (
+                self.limits.max_cost_usd
+                - self.cost_usd
+                - self._reserved_cost_usd
+                - prices.cost(input_tokens, 0)
+            )
+            remaining.append(
+                1_000_000 * remaining_usd / max(prices.output_usd_per_mtok, 1e-9)
+            )
+        return min(remaining)
+
+    def admit(
+        self,
+        label: str,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        prices: TokenPrices,
+    ) -> Admission:
+        """
+        Admit a query to a model with 'prices' (returns the reservation for it, with
+        the max_tokens the query may use), or raise BudgetExceeded.
+        """
+        estimated_input_tokens = estimate_tokens(system_prompt) + estimate_tokens(
+            user_prompt
+        )
+        with self._lock:
+            remaining = self._remaining_output_tokens(estimated_input_tokens, prices)
+            if remaining < min(max_tokens, MIN_OUTPUT_TOKENS):
+                self.refused.append(label)
+                raise BudgetExceeded(
+                    f"Query {label} refused (estimated {estimated_input_tokens} input "
+                    f"tokens): spend limits of the run reached"
+                )
+            if remaining < max_tokens:
+                print(
+                    f"Spend limits: query {label} rerouted with max_tokens "
+                    f"{int(remaining)} (instead of {max_tokens})"
+                )
+                self.rerouted.append(label)
+                max_tokens = int(remaining)
+
+            admission = Admission(label, estimated_input_tokens, max_tokens, prices)
+            self._reserved_input_tokens += admission.input_tokens
+            self._reserved_output_tokens += admission.max_tokens
+            self._reserved_cost_usd += admission.cost_usd
+            return admission
+
+    def settle(self, admission: Admission, input_tokens: int, output_tokens: int):
+        """
+        Replace the reservation of a query by its usage (zero if the query failed).
+        """
+        with self._lock:
+            self._reserved_input_tokens -= admission.input_tokens
+            self._reserved_output_tokens -= admission.max_tokens
+            self._reserved_cost_usd -= admission.cost_usd
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cost_usd += admission.prices.cost(input_tokens, output_tokens)
+
+    def summary(self) -> str:
+        def _summary() -> Iterable[str]:
+            yield "--- GenAI spend limits ---"
+            for name, used, limit in [
+                ("Input tokens", self.input_tokens, self.limits.max_input_tokens),
+                ("Output tokens", self.output_tokens, self.limits.max_output_tokens),
+            ]:
+                yield f" - {name}: {used} of {limit if limit is not None else '-'}"
+            yield (
+                f" - Estimated cost: {self.cost_usd:.2f} USD of "
+                + (
+                    f"{self.limits.max_cost_usd:.2f} USD"
+                    if self.limits.max_cost_usd is not None
+                    else "-"
+                )
+            )
+            yield f" - Rerouted queries (smaller max_tokens): {len(self.rerouted)}"
+            yield f" - Refused queries: {len(self.refused)}"
+
+        return "\n".join(_summary())
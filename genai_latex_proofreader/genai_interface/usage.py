@@ -0,0 +1,125 @@
+"""
+Ledger of GenAI token usage (per query), and of tokens saved by compressing the
+context provided in queries.
+"""
+
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+
+@dataclass(frozen=True)
+class QueryUsage:
+    label: str
+    input_tokens: int
+    output_tokens: int
+
+    # routing of the query (see routing.py)
+    model: Optional[str] = None
+    route: Optional[str] = None
+    escalated: bool = False
+
+
+@dataclass(frozen=True)
+class ContextSavings:
+    """
+    Estimated input tokens of a query with the full context, and with the context
+    that was used instead (eg. summaries of sections).
+    """
+
+    label: str
+    full_context_tokens: int
+    used_context_tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.full_context_tokens - self.used_context_tokens
+
+
+class UsageLedger:
+    """
+    Thread-safe record of token usage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries: list[QueryUsage] = []
+        self.savings: list[ContextSavings] = []
+        # labels of queries that waited for an identical query (see single_flight.py)
+        self.deduplicated: list[str] = []
+
+    def record_query(
+        self,
+        label: str,
+        input_tokens: int,
+        output_tokens: int,
+        model: Optional[str] = None,
+        route: Optional[str] = None,
+        escalated: bool = False,
+    ):
+        with self._lock:
+            self.queries.append(
+                QueryUsage(label, input_tokens, output_tokens, model, route, escalated)
+            )
+
+    def record_deduplicated(self, label: str):
+        with self._lock:
+            self.deduplicated.append(label)
+
+    def record_context_savings(
+        self, label: str, full_context_tokens: int, used_context_tokens: int
+    ):
+        with self._lock:
+            self.savings.append(
+                ContextSavings(label, full_context_tokens, used_context_tokens)
+            )
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(query.input_tokens for query in self.queries)
+
+    @property
+    def output_tokens(self) -> int:
+        return sum(query.output_tokens for query in self.queries)
+
+    @property
+    def saved_tokens(self) -> int:
+        return sum(savings.saved_tokens for savings in self.savings)
+
+    def summary(self) -> str:
+        def _summary() -> Iterable[str]:
+            yield "--- GenAI usage ---"
+            yield f" - Queries: {len(self.queries)}"
+            yield f" - Input tokens: {self.input_tokens}"
+            yield f" - Output tokens: {self.output_tokens}"
+            if len(self.deduplicated) > 0:
+                yield (
+                    f" - Deduplicated: {len(self.deduplicated)} queries (identical to "
+                    "a query in flight)"
+                )
+            if len(self.savings) > 0:
+                full_tokens = sum(s.full_context_tokens for s in self.savings)
+                yield (
+                    f" - Compressed context: {len(self.savings)} queries, "
+                    f"{self.saved_tokens} of {full_tokens} (estimated) context tokens "
+                    "saved"
+                )
+            yield from self._routing_summary()
+
+        return "\n".join(_summary())
+
+    def _routing_summary(self) -> Iterable[str]:
+        routes = sorted({q.route for q in self.queries if q.route is not None})
+        if len(routes) == 0:
+            return
+        yield " - Routing:"
+        for route in routes:
+            queries = [q for q in self.queries if q.route == route]
+            models = Counter(q.model for q in queries)
+            escalated = sum(q.escalated for q in queries)
+            yield (
+                f"   - {route}: {len(queries)} queries ("
+                + ", ".join(f"{model}: {count}" for model, count in models.items())
+                + f"), {escalated} escalated ({100 * escalated / len(queries):.0f}%)"
+            )
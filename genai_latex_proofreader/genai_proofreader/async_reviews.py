@@ -0,0 +1,108 @@
+"""
+Section reviews from asyncio code, with an AsyncGenAIClient.
+
+The personas make their queries with a (sync) GenAIClient. Here, a persona runs in a
+worker thread, and each of its queries is made by the AsyncGenAIClient in the event
+loop of the caller, so that the concurrency limit and the cancellation of the async
+client apply to the queries of the review.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import CancelledError, Future
+from typing import Any, Callable, Coroutine, Iterable, Tuple, TypeVar, cast
+
+from ..genai_interface.anthropic import AsyncGenAIClient, GenAIClient
+from ..genai_interface.hedging import QueryCancelled
+from ..latex_interface.data_model import ContentReferenceBase
+
+T = TypeVar("T")
+
+
+class _Queries:
+    # queries of one review in the event loop (shared by the clients of the review)
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.lock = threading.Lock()
+        self.running: set[Future] = set()
+        self.cancelled: bool = False
+
+    def run(self, query: Coroutine[Any, Any, T]) -> T:
+        # called from a worker thread of the review
+        with self.lock:
+            if self.cancelled:
+                query.close()
+                raise QueryCancelled()
+            future = asyncio.run_coroutine_threadsafe(query, self.loop)
+            self.running.add(future)
+        try:
+            return future.result()
+        except CancelledError as e:
+            raise QueryCancelled() from e
+        finally:
+            with self.lock:
+                self.running.discard(future)
+
+    def cancel(self):
+        # cancel the running queries, and raise QueryCancelled for later queries
+        with self.lock:
+            self.cancelled = True
+            for future in self.running:
+                future.cancel()
+
+
+class _LoopClient:
+    """
+    Client of a persona in a worker thread, that makes its queries with an
+    AsyncGenAIClient (see review_section).
+    """
+
+    def __init__(self, client: AsyncGenAIClient, queries: _Queries):
+        self.client = client
+        self.queries = queries
+        self.usage = client.usage
+
+    def for_section(self, section: str) -> "_LoopClient":
+        return _LoopClient(self.client.for_section(section), self.queries)
+
+    def make_query(self, system_prompt: str, user_prompt: str, label: str) -> str:
+        return self.queries.run(
+            self.client.make_query(system_prompt, user_prompt, label)
+        )
+
+    def make_structured_query(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        tool: dict[str, Any],
+        label: str,
+    ) -> dict[str, Any]:
+        return self.queries.run(
+            self.client.make_structured_query(system_prompt, user_prompt, tool, label)
+        )
+
+    def stream_query(self, system_prompt: str, user_prompt: str, label: str):
+        raise ValueError("Streamed queries (stream_check) need a GenAIClient")
+
+
+async def review_section(
+    review: Callable[..., Iterable[Tuple[ContentReferenceBase, str]]],
+    client: AsyncGenAIClient,
+    *args: Any,
+    **kwargs: Any,
+) -> list[Tuple[ContentReferenceBase, str]]:
+    """
+    Make section review 'review' (eg. proofread_one_section_for_language, called
+    with 'args' and 'kwargs' after the client) with an AsyncGenAIClient, and return
+    its comments.
+
+    Cancelling the awaiting task cancels the queries of the review (the review
+    stops with QueryCancelled in its worker thread).
+    """
+    queries = _Queries(asyncio.get_running_loop())
+    bridge = cast(GenAIClient, _LoopClient(client, queries))
+    try:
+        return await asyncio.to_thread(lambda: list(review(bridge, *args, **kwargs)))
+    except asyncio.CancelledError:
+        queries.cancel()
+        raise
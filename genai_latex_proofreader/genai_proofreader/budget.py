@@ -0,0 +1,132 @@
+"""
+Deadline and token budget for a proofreading run.
+
+Tasks have a priority (0 is the most important, eg. the abstract). As the run uses
+up its time (or token) budget, tasks with lower priority are first run in a
+degraded mode (eg. with smaller max_tokens), and then skipped.
+"""
+
+import math
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Mapping, Optional
+
+from ..genai_interface.usage import UsageLedger
+
+
+class TaskMode(Enum):
+    FULL = "full"
+    DEGRADED = "degraded"
+    SKIPPED = "skipped"
+
+
+@dataclass(frozen=True)
+class DegradationThresholds:
+    # fraction of the budget used when tasks are run degraded, and skipped
+    degrade_at: float
+    skip_at: float
+
+
+# Thresholds per task priority (priorities not listed use the last entry)
+DEFAULT_THRESHOLDS: dict[int, DegradationThresholds] = {
+    # eg. abstract and introduction: never skipped
+    0: DegradationThresholds(degrade_at=0.9, skip_at=math.inf),
+    # eg. main sections
+    1: DegradationThresholds(degrade_at=0.6, skip_at=0.85),
+    # eg. appendix
+    2: DegradationThresholds(degrade_at=0.4, skip_at=0.7),
+}
+
+
+class RunBudget:
+    """
+    Time and token budget for a run. Tasks can be started from multiple threads.
+    """
+
+    def __init__(
+        self,
+        deadline_seconds: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        usage: Optional[UsageLedger] = None,
+        thresholds: Mapping[int, DegradationThresholds] = DEFAULT_THRESHOLDS,
+    ):
+        """
+        Args:
+            deadline_seconds: Time budget for the run (from now)
+            max_tokens:       Budget of input and output tokens for the run (as
+                              recorded in 'usage')
+            usage:            Usage ledger of the GenAI client
+            thresholds:       Degradation thresholds per task priority
+        """
+        if max_tokens is not None and usage is None:
+            raise ValueError("A token budget requires a usage ledger")
+
+        self.started: float = time.monotonic()
+        self.deadline_seconds = deadline_seconds
+        self.max_tokens = max_tokens
+        self.usage = usage
+        self.thresholds = thresholds
+
+        self._lock = threading.Lock()
+        self.task_modes: dict[str, TaskMode] = {}
+
+    def used_fraction(self) -> float:
+        """
+        Fraction of the time or token budget that is used (the largest of the two).
+        """
+        fractions: list[float] = [0.0]
+        if self.deadline_seconds is not None:
+            fractions.append(
+                (time.monotonic() - self.started) / max(self.deadline_seconds, 1e-9)
+            )
+        if self.max_tokens is not None and self.usage is not None:
+            fractions.append(
+                (self.usage.input_tokens + self.usage.output_tokens)
+                / max(self.max_tokens, 1)
+            )
+        return max(fractions)
+
+    def _thresholds(self, priority: int) -> DegradationThresholds:
+        priorities = sorted(p for p in self.thresholds.keys() if p <= priority)
+        if len(priorities) == 0:
+            priorities = sorted(self.thresholds.keys())
+        return self.thresholds[priorities[-1]]
+
+    def task_mode(self, task_name: str, priority: int) -> TaskMode:
+        """
+        Return (and record) how a task should be run when it is started now.
+        """
+        used = self.used_fraction()
+        thresholds = self._thresholds(priority)
+        if used >= thresholds.skip_at:
+            mode = TaskMode.SKIPPED
+        elif used >= thresholds.degrade_at:
+            mode = TaskMode.DEGRADED
+        else:
+            mode = TaskMode.FULL
+
+        with self._lock:
+            self.task_modes[task_name] = mode
+        if mode != TaskMode.FULL:
+            print(f"Budget: {100 * used:.0f}% used, task {task_name} is {mode.value}")
+        return mode
+
+    def tasks(self, mode: TaskMode) -> list[str]:
+        with self._lock:
+            return [name for name, m in self.task_modes.items() if m == mode]
+
+    @property
+    def partial(self) -> bool:
+        """
+        Were any tasks degraded or skipped?
+        """
+        return len(self.tasks(TaskMode.DEGRADED) + self.tasks(TaskMode.SKIPPED)) > 0
+
+    def summary(self) -> str:
+        return (
+            f"Budget: {100 * self.used_fraction():.0f}% used, "
+            f"{len(self.tasks(TaskMode.DEGRADED))} task(s) degraded, "
+            f"{len(self.tasks(TaskMode.SKIPPED))} task(s) skipped"
+        )
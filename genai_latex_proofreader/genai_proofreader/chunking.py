@@ -0,0 +1,188 @@
+r"""
+Split long sections into pieces that are proofread separately, and merge the
+proofreading reports of the pieces into one report.
+
+Sections are split at \subsection{..} or \subsubsection{..} commands, or at
+paragraph boundaries (empty lines). Each piece fits in a token budget, and starts
+with a few lines from the end of the previous piece (as context).
+
+Token counts are estimated from the number of characters (see `estimate_tokens`).
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Sequence
+
+# Default token budget for the section content in one query
+DEFAULT_MAX_CHUNK_TOKENS: int = 4000
+
+# Default number of tokens from the end of a piece that is repeated at the start of
+# the next piece
+DEFAULT_OVERLAP_TOKENS: int = 200
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text (about 4 characters per token for
+    English text and LaTeX).
+    """
+    return (len(text) + 3) // 4
+
+
+@dataclass(frozen=True)
+class SectionChunk:
+    # Lines in the chunk (including overlap)
+    lines: list[str]
+
+    # Number of lines at the start of the chunk that are repeated from the previous
+    # chunk (only included as context)
+    overlap: int = 0
+
+
+def _is_block_start(line: str) -> bool:
+    return line.startswith(r"\subsection") or line.startswith(r"\subsubsection")
+
+
+def _blocks(lines: Sequence[str]) -> list[list[str]]:
+    """
+    Split lines into blocks at subsections and paragraphs (ie. an empty line ends a
+    paragraph).
+    """
+    blocks: list[list[str]] = [[]]
+    for line in lines:
+        if _is_block_start(line) and len(blocks[-1]) > 0:
+            blocks.append([])
+        blocks[-1].append(line)
+        if line.strip() == "":
+            blocks.append([])
+
+    return [block for block in blocks if len(block) > 0]
+
+
+def _tokens(lines: Sequence[str]) -> int:
+    return sum(estimate_tokens(line) + 1 for line in lines)
+
+
+def chunk_section(
+    lines: Sequence[str],
+    max_tokens: int = DEFAULT_MAX_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+) -> list[SectionChunk]:
+    """
+    Split the lines of a section into chunks of at most 'max_tokens' (estimated)
+    tokens, excluding overlap. Blocks (subsections, paragraphs) are kept together
+    when possible; a block that does not fit in one chunk is split between lines.
+    """
+    # Pack blocks into chunks. A block that does not fit in a chunk is split between
+    # lines (a single line longer than the budget is kept as is).
+    chunk_lines: list[list[str]] = []
+    chunk_tokens: int = max_tokens + 1
+
+    def _add(lines: list[str], tokens: int):
+        nonlocal chunk_tokens
+        if chunk_tokens + tokens > max_tokens:
+            chunk_lines.append([])
+            chunk_tokens = 0
+        chunk_lines[-1].extend(lines)
+        chunk_tokens += tokens
+
+    for block in _blocks(lines):
+        if (block_tokens := _tokens(block)) <= max_tokens:
+            _add(block, block_tokens)
+        else:
+            for line in block:
+                _add([line], _tokens([line]))
+
+    # add overlap (the last lines of the previous chunk)
+    chunks: list[SectionChunk] = []
+    for idx, chunk in enumerate(chunk_lines):
+        overlap: list[str] = []
+        if idx > 0:
+            for line in reversed(chunk_lines[idx - 1]):
+                if _tokens([line, *overlap]) > overlap_tokens:
+                    break
+                overlap.insert(0, line)
+        chunks.append(SectionChunk(lines=[*overlap, *chunk], overlap=len(overlap)))
+
+    return chunks
+
+
+# --- Merge reports ---
+
+_LIST_PATTERN = re.compile(
+    r"\\begin\{(enumerate|itemize|description)\}"
+    r"|\\end\{(enumerate|itemize|description)\}"
+    r"|\\item(?![a-zA-Z])"
+)
+
+
+def split_report(report: str) -> tuple[list[str], str]:
+    r"""
+    Split a report (eg. "\begin{enumerate} \item A \item B \end{enumerate} Summary")
+    into the top-level items of its first enumerate list (["A", "B"]), and the text
+    after the list ("Summary").
+
+    If the report does not contain a list, the entire report is returned as a single
+    item.
+    """
+    depth: int = 0
+    list_end: int = -1
+    item_starts: list[int] = []
+    item_ends: list[int] = []
+    for match in _LIST_PATTERN.finditer(report):
+        if match.group(1) is not None:
+            depth += 1
+            if depth == 1 and match.group(1) != "enumerate":
+                # first top-level list is not an enumerate list
+                break
+        elif match.group(2) is not None:
+            depth -= 1
+            if depth == 0:
+                list_end = match.end()
+                item_ends.append(match.start())
+                break
+        elif depth == 1:
+            if len(item_starts) > 0:
+                item_ends.append(match.start())
+            item_starts.append(match.end())
+
+    if list_end == -1 or len(item_starts) == 0:
+        return ([report.strip()] if report.strip() != "" else []), ""
+
+    items = [report[start:end].strip() for start, end in zip(item_starts, item_ends)]
+    return [item for item in items if item != ""], report[list_end:].strip()
+
+
+def _normalize(item: str) -> str:
+    return " ".join(item.split()).lower()
+
+
+def merge_reports(reports: list[str]) -> str:
+    """
+    Merge reports (each with an enumerated list of issues followed by a summary) into
+    one report with one enumerated list. Duplicate items (eg. found in the overlap
+    of two chunks) are only included once.
+    """
+    items: list[str] = []
+    seen: set[str] = set()
+    summaries: list[str] = []
+    for report in reports:
+        report_items, summary = split_report(report)
+        for item in report_items:
+            if _normalize(item) not in seen:
+                seen.add(_normalize(item))
+                items.append(item)
+        if summary != "":
+            summaries.append(summary)
+
+    if len(items) == 0:
+        return "\n\n".join(summaries)
+
+    return "\n".join(
+        [
+            r"\begin{enumerate}",
+            *[rf"\item {item}" for item in items],
+            r"\end{enumerate}",
+            *summaries,
+        ]
+    )
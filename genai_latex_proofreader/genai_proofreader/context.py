@@ -0,0 +1,198 @@
+"""
+Context provided to reviewers that review one section of a paper.
+
+With the full context, the entire paper is provided. With the compressed context,
+the section under review is provided in full, while all other sections are replaced
+by short summaries. Summaries are created by GenAI queries once per section (and
+cached by the content hash of the section). With the notation context, the section
+under review is provided in full, together with a (locally built) index of the
+notation, definitions and labels of the paper.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from enum import Enum
+from typing import Optional
+
+from ..genai_interface.anthropic import GenAIClient
+from ..latex_interface.data_model import (
+    ContentReferenceBase,
+    LatexDocument,
+    SectionRef,
+    to_latex,
+)
+from ..latex_interface.notation_index import NotationIndex, to_prompt
+from .chunking import estimate_tokens
+
+
+class ContextMode(Enum):
+    # entire paper
+    FULL = "full"
+
+    # section under review, and summaries of the other sections
+    COMPRESSED = "compressed"
+
+    # section under review, and an index of notation, definitions and labels
+    NOTATION = "notation"
+
+
+SUMMARY_SYSTEM_PROMPT: str = r"""You are an expert in summarizing scientific papers."""
+
+SUMMARY_INSTRUCTIONS_PROMPT: str = r"""
+Below between <latex_section>-tags is one section from a scientific paper (in LaTeX).
+
+Write a compact summary of the section (at most 150 words) that another reviewer of
+the paper can use as context. Include:
+- The main claims and results of the section.
+- Definitions, notation and assumptions introduced in the section.
+- Labels (\label{...}) of the main definitions, theorems and equations.
+
+Only return the summary (as plain text, or LaTeX that compiles), without any preface.
+
+<latex_section>
+{LATEX_CONTENT}
+</latex_section>
+"""
+
+# Line that marks the start of a summary (that replaces the content of a section)
+SUMMARY_MARKER: str = "% --- summary of section (full text omitted) ---"
+
+# Line that replaces the content of sections omitted from the notation context
+OMITTED_MARKER: str = "% --- content of section omitted (see notation index) ---"
+
+
+class SectionSummaries:
+    """
+    Summaries of sections, cached by content hash of the section.
+    """
+
+    def __init__(self, client: GenAIClient, max_workers: int = 4):
+        self.client = client
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._cache: dict[str, str] = {}
+
+        # reviews running in parallel wait for the summaries being created (instead
+        # of summarizing the same sections again)
+        self._summaries_lock = threading.Lock()
+
+    def _summarize(self, doc: LatexDocument, section_ref: SectionRef) -> str:
+        key = doc.section_text(section_ref).content_hash
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+
+        summary = (
+            self.client.for_section(section_ref.title)
+            .make_query(
+                system_prompt=SUMMARY_SYSTEM_PROMPT,
+                user_prompt=SUMMARY_INSTRUCTIONS_PROMPT.replace(
+                    "{LATEX_CONTENT}", doc.section_text(section_ref).text
+                ),
+                label=f"Summary of section '{section_ref.title}'",
+            )
+            .strip()
+        )
+
+        with self._lock:
+            self._cache[key] = summary
+        return summary
+
+    def summaries(self, doc: LatexDocument) -> dict[ContentReferenceBase, str]:
+        """
+        Return summaries of all sections in 'doc' (sections without a summary in the
+        cache are summarized in parallel).
+        """
+        section_refs = [
+            section_ref
+            for section_ref in doc.content_dict.keys()
+            if isinstance(section_ref, SectionRef)
+        ]
+        with self._summaries_lock, ThreadPoolExecutor(
+            max_workers=self.max_workers
+        ) as executor:
+            summaries = list(
+                executor.map(lambda ref: self._summarize(doc, ref), section_refs)
+            )
+        return dict(zip(section_refs, summaries))
+
+
+def compressed_document(
+    doc: LatexDocument,
+    section_ref: ContentReferenceBase,
+    summaries: dict[ContentReferenceBase, str],
+) -> LatexDocument:
+    """
+    Return document where the content of every section except 'section_ref' is
+    replaced by its summary.
+    """
+    return replace(
+        doc,
+        content_dict={
+            ref: (
+                [SUMMARY_MARKER, *summaries[ref].split("\n")]
+                if ref != section_ref and ref in summaries
+                else content
+            )
+            for ref, content in doc.content_dict.items()
+        },
+    )
+
+
+def notation_context(
+    doc: LatexDocument, section_ref: ContentReferenceBase, index: NotationIndex
+) -> str:
+    """
+    Return the notation index (between <notation_index>-tags) followed by the
+    document where the content of every section except 'section_ref' is omitted.
+    """
+    omitted_doc = replace(
+        doc,
+        content_dict={
+            ref: (
+                [OMITTED_MARKER]
+                if ref != section_ref and isinstance(ref, SectionRef)
+                else content
+            )
+            for ref, content in doc.content_dict.items()
+        },
+    )
+    return "\n".join(
+        [
+            "<notation_index>",
+            to_prompt(index),
+            "</notation_index>",
+            "",
+            to_latex(omitted_doc),
+        ]
+    )
+
+
+def section_review_context(
+    client: GenAIClient,
+    doc: LatexDocument,
+    section_ref: ContentReferenceBase,
+    summaries: Optional[SectionSummaries],
+    label: str,
+    notation_index: Optional[NotationIndex] = None,
+) -> str:
+    """
+    Return the paper (as LaTeX) to provide as context when reviewing 'section_ref'.
+    Without summaries or notation index, this is the full paper. Otherwise, the
+    estimated token savings are recorded in the usage ledger of the client.
+    """
+    full_context: str = to_latex(doc)
+    if notation_index is not None:
+        context = notation_context(doc, section_ref, notation_index)
+    elif summaries is not None:
+        context = to_latex(
+            compressed_document(doc, section_ref, summaries.summaries(doc))
+        )
+    else:
+        return full_context
+
+    client.usage.record_context_savings(
+        label, estimate_tokens(full_context), estimate_tokens(context)
+    )
+    return context
@@ -1,3 +1,6 @@
+from typing import Optional
+
+
 def format_report(
     report: str,
     review_comment_header: str,
@@ -47,6 +50,20 @@ def project_plug() -> str:
     )
 
 
+def short_report_prompt(max_issues: Optional[int]) -> str:
+    """
+    Instructions for a short report (eg. for reviews that are degraded to meet the
+    deadline or budget of the run), appended to user prompts. Empty if 'max_issues'
+    is None.
+    """
+    if max_issues is None:
+        return ""
+    return (
+        f"\n\nKeep your report short: report at most {max_issues} issues (only the "
+        "most important ones), and write a summary of at most two sentences.\n"
+    )
+
+
 def make_review_comment_header(
     role: str, task: str, content_provided_for_review: str
 ) -> str:
@@ -0,0 +1,228 @@
+"""
+Incremental proofreading: reuse proofreading comments from a previous run for parts
+of the paper that have not changed.
+
+Each review is identified by the reviewer task and a fingerprint of the content it
+reviews (eg. one section). Reviews that also use the entire paper as context (eg. by
+the domain expert) additionally record a fingerprint of the paper. If the paper has
+changed, such reviews are reused according to a `StalenessPolicy`.
+
+The reviews (after the LaTeX guard) are stored in a JSON state file between runs.
+"""
+
+import hashlib
+import json
+import threading
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Tuple
+
+from ..latex_interface.data_model import ContentReferenceBase, LatexDocument, to_latex
+
+# Version of the state file format. State files with other versions are ignored.
+STATE_FILE_VERSION: int = 1
+
+
+def fingerprint(*parts: object) -> str:
+    """
+    Return sha256 fingerprint of the string representations of 'parts'.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(repr(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def section_fingerprint(doc: LatexDocument, section_ref: ContentReferenceBase) -> str:
+    # The section reference (title, labels) is included since it is part of prompts
+    return fingerprint(section_ref, doc.section_text(section_ref).content_hash)
+
+
+def document_fingerprint(doc: LatexDocument) -> str:
+    return fingerprint(to_latex(doc))
+
+
+@dataclass(frozen=True)
+class StalenessPolicy:
+    """
+    When to reuse a review that used the entire paper as context, if the section
+    under review is unchanged but other parts of the paper have changed.
+    """
+
+    # Maximum number of consecutive runs where a review is reused with an outdated
+    # context. 0: re-run reviews whenever the paper changes.
+    max_stale_runs: int = 0
+
+    def reuse(self, stale_runs: int) -> bool:
+        return stale_runs <= self.max_stale_runs
+
+
+@dataclass(frozen=True)
+class StoredReview:
+    # Guarded proofreading comments
+    comments: list[str]
+
+    # Fingerprint of the paper used as context (None if review did not use context)
+    context_fingerprint: Optional[str] = None
+
+    # Number of consecutive runs this review has been reused with changed context
+    stale_runs: int = 0
+
+
+@dataclass(frozen=True)
+class ProofreadState:
+    """
+    Reviews of a proofreading run, keyed by task and fingerprint of reviewed content.
+    """
+
+    reviews: dict[str, StoredReview] = field(default_factory=dict)
+
+
+def load_state(state_file: Path) -> ProofreadState:
+    """
+    Load state from a previous run. Returns an empty state if the file does not exist
+    or has an unsupported format version.
+    """
+    if not state_file.is_file():
+        print(f" - Incremental: no previous state in {state_file}")
+        return ProofreadState()
+
+    data = json.loads(state_file.read_text())
+    if data.get("version") != STATE_FILE_VERSION:
+        print(f" - Incremental: ignoring state file version {data.get('version')}")
+        return ProofreadState()
+
+    return ProofreadState(
+        reviews={key: StoredReview(**review) for key, review in data["reviews"].items()}
+    )
+
+
+def save_state(state: ProofreadState, state_file: Path) -> None:
+    state_file.parent.mkdir(parents=True, exist_ok=True)
+    state_file.write_text(
+        json.dumps(
+            {
+                "version": STATE_FILE_VERSION,
+                "reviews": {
+                    key: asdict(review) for key, review in state.reviews.items()
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+class IncrementalReviews:
+    """
+    Run reviews, or reuse reviews from a previous state when the reviewed content
+    is unchanged. Collects the reviews of this run into a new state. Reviews can be
+    run from multiple threads.
+    """
+
+    def __init__(
+        self,
+        doc: LatexDocument,
+        previous: ProofreadState = ProofreadState(),
+        policy: StalenessPolicy = StalenessPolicy(),
+    ):
+        self.previous = previous
+        self.policy = policy
+        self.context_fingerprint: str = document_fingerprint(doc)
+        self.state = ProofreadState()
+        self.reused: int = 0
+        self.executed: int = 0
+        self._lock = threading.Lock()
+
+    def review(
+        self,
+        task: str,
+        content_fingerprint: str,
+        section_ref: ContentReferenceBase,
+        run: Callable[[], Iterable[Tuple[ContentReferenceBase, str]]],
+        uses_context: bool = False,
+    ) -> list[Tuple[ContentReferenceBase, str]]:
+        """
+        Return reviews for 'section_ref' (either stored, or by calling 'run').
+
+        Args:
+            task:                Name of the review task, eg. "language:section"
+            content_fingerprint: Fingerprint of the content under review
+            section_ref:         Section where stored comments are inserted
+            run:                 Function that makes the review (when not reused)
+            uses_context:        Does the review use the entire paper as context?
+        """
+        stored = self.reuse(task, content_fingerprint, uses_context)
+        if stored is not None:
+            return [(section_ref, comment) for comment in stored]
+
+        results = list(run())
+        self.record(
+            task, content_fingerprint, [comment for _, comment in results], uses_context
+        )
+        return results
+
+    def reuse(
+        self, task: str, content_fingerprint: str, uses_context: bool = False
+    ) -> Optional[list[str]]:
+        """
+        Return the stored comments of a review if they can be reused (the reuse is
+        then recorded in the new state), or None if the review should be run.
+        """
+        key = f"{task}:{content_fingerprint}"
+        context = self.context_fingerprint if uses_context else None
+
+        stored: Optional[StoredReview] = self.previous.reviews.get(key)
+        if stored is None:
+            return None
+
+        stale_runs = (
+            0 if stored.context_fingerprint == context else stored.stale_runs + 1
+        )
+        if not self.policy.reuse(stale_runs):
+            return None
+
+        with self._lock:
+            self.reused += 1
+            self.state.reviews[key] = StoredReview(
+                comments=stored.comments,
+                # keep fingerprint of the context the review was made with
+                context_fingerprint=stored.context_fingerprint,
+                stale_runs=stale_runs,
+            )
+        return stored.comments
+
+    def keep(self, task: str, content_fingerprint: str):
+        """
+        Keep the stored review from the previous state (if any) in the new state,
+        eg. for a review that was skipped in this run.
+        """
+        key = f"{task}:{content_fingerprint}"
+        with self._lock:
+            if key in self.previous.reviews and key not in self.state.reviews:
+                self.state.reviews[key] = self.previous.reviews[key]
+
+    def record(
+        self,
+        task: str,
+        content_fingerprint: str,
+        comments: list[str],
+        uses_context: bool = False,
+    ):
+        """
+        Record the comments of a review that was run in the new state.
+        """
+        with self._lock:
+            self.executed += 1
+            self.state.reviews[f"{task}:{content_fingerprint}"] = StoredReview(
+                comments=comments,
+                context_fingerprint=(
+                    self.context_fingerprint if uses_context else None
+                ),
+            )
+
+    def summary(self) -> str:
+        return (
+            f"Incremental: {self.reused} review(s) reused, "
+            f"{self.executed} review(s) executed"
+        )
@@ -6,7 +6,7 @@ Latex errors are corrected using GenAI calls.
 
 import uuid
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 
 from genai_latex_proofreader.compile_latex import CommandResult, compile_latex_doc
 from genai_latex_proofreader.genai_interface.anthropic import GenAIClient
@@ -14,10 +14,20 @@ from genai_latex_proofreader.latex_interface.data_model import (
     ContentReferenceBase,
     LatexDocument,
 )
-from genai_latex_proofreader.proofread_comments.add_comments import add_comments
-from genai_latex_proofreader.utils.splitters import split_list_at_lambda
+from genai_latex_proofreader.latex_interface.notation_index import (
+    NotationIndex,
+    build_notation_index,
+    replace_unknown_references,
+    unknown_references,
+)
+from genai_latex_proofreader.proofread_comments.add_comments import CommentOverlay
+from genai_latex_proofreader.utils.run_commands import CommandStatus
+from genai_latex_proofreader.utils.splitters import split_indices_at_lambda
+from genai_latex_proofreader.utils.tracing import span, traced
 
 from ..genai_interface.anthropic import GenAIClient
+from ..genai_interface.spend import BudgetExceeded
+from .structured_report import RenderedLatex
 
 
 def _make_fix_latex_errors_query(
@@ -71,20 +81,46 @@ The output should be valid LaTeX.
     )
 
 
-def _doc_compiles(doc: LatexDocument) -> CommandResult:
-    return compile_latex_doc(doc, Path("main.tex"))[-1]
+def _doc_compiles(
+    doc: LatexDocument, client: GenAIClient, label: str = "latex-guard"
+) -> CommandResult:
+    # compiles are recorded in the run store of the client (if any)
+    return compile_latex_doc(
+        doc, Path("main.tex"), run_store=client.run_store, label=label
+    )[-1]
+
+
+def _log_lines_from_modification(stdout: str, run_id: str) -> list[str]:
+    r"""
+    Return the lines in the compile log that were written between the two
+    "\typeout{<RUN_ID>}" markers surrounding the modification.
+
+    If the compile was stopped before the end marker (eg. due to an infinite loop in
+    the modification), return the log written after the start marker. If no marker
+    is found, return the full log.
+    """
+    lines: list[str] = stdout.split("\n")
+    _, splits = split_indices_at_lambda(lines, lambda x: x if run_id in x else None)
+    if len(splits) == 0:
+        return lines
+
+    [_, log_lines_from_modification], *_ = splits
+    return lines[log_lines_from_modification.start : log_lines_from_modification.stop]
 
 
 def _latex_guard(
     client: GenAIClient,
-    doc: LatexDocument,
+    overlay: CommentOverlay,
     content_ref: ContentReferenceBase,
     content: str,
 ) -> str:
     # unmodified document should not have errors
-    if (input_run := _doc_compiles(doc)).returncode != 0:
+    if not (
+        input_run := _doc_compiles(overlay.materialize(), client, "latex-guard: input")
+    ).succeeded:
         raise Exception(
             f"latex guard: input does not compile \n"
+            f"status      :  {input_run.status.value} \n"
             f"returncode  :  {input_run.returncode} \n"
             f"stdout      :  {input_run.stdout} \n"
             f"stderr      :  {input_run.stderr} \n"
@@ -99,54 +135,97 @@ def _latex_guard(
     run_id_line = r"\typeout{<RUN_ID>}".replace("<RUN_ID>", run_id)
 
     new_lines = [run_id_line, content, run_id_line]
-    modified_latex = add_comments(doc, content_ref, new_lines)
+    modified_latex = overlay.add(content_ref, new_lines).materialize()
 
-    if (out := _doc_compiles(modified_latex)).returncode == 0:
+    if (out := _doc_compiles(modified_latex, client)).succeeded:
         return content
 
     else:
-        stdout: list[str] = out.stdout.split("\n")
-
-        _, [[_, log_lines_from_modification], *_] = split_list_at_lambda(
-            stdout, lambda x: x if run_id in x else None
-        )
+        error_messages: list[str] = _log_lines_from_modification(out.stdout, run_id)
+        if out.status != CommandStatus.COMPLETED:
+            # The compile was killed (timeout, CPU limit, or runaway output). The
+            # log is then likely very long and repetitive, so only keep its tail.
+            error_messages = [
+                f"Compilation was stopped ({out.status.value}). The snippet likely "
+                "contains an infinite loop or a runaway macro. Last lines of log:",
+                *error_messages[-20:],
+            ]
 
         corrected_content = _make_fix_latex_errors_query(
             label="latex-guard",
             client=client,
             latex_snippet=content,
-            error_messages="\n".join(log_lines_from_modification),
+            error_messages="\n".join(error_messages),
         )
         return corrected_content
 
 
 class LatexGuard:
-    """
+    r"""
     GenAI may return invalid LaTeX. This class provide way to catch that and attempt to
     fix any LaTeX errors in generated proofreading reports (using the GenAI API client).
+
+    References (eg. \ref{..}) to labels that are not in the document are replaced by
+    the label as text (since they would otherwise be shown as "??").
+
+    Reports rendered locally from structured output (without math) are not checked.
+
+    The first fix of a report is made with the model routed for "latex-guard" queries
+    (a fast model by default). Later fixes are escalated to a stronger model.
     """
 
-    def __init__(self, client: GenAIClient, doc: LatexDocument, retries: int = 3):
+    def __init__(
+        self,
+        client: GenAIClient,
+        doc: LatexDocument,
+        retries: int = 3,
+        notation_index: Optional[NotationIndex] = None,
+    ):
         self.client = client
         self.doc = doc
+        # comments to validate are added to an overlay of the document
+        self.overlay = CommentOverlay(doc)
         self.retries = retries
+        self.notation_index: NotationIndex = (
+            notation_index if notation_index is not None else build_notation_index(doc)
+        )
 
+    @traced("LatexGuard.__call__")
     def __call__(
         self, x: Tuple[ContentReferenceBase, str]
     ) -> Tuple[ContentReferenceBase, str]:
         print("LaTeX guard: Checking that generated content is valid LaTeX")
         part_ref, content = x
+
+        if isinstance(content, RenderedLatex):
+            print("LaTeX guard: generated content was rendered locally (not checked)")
+            return part_ref, content
+
+        if len(unknown := unknown_references(self.notation_index, content)) > 0:
+            print(f"LaTeX guard: replacing references to unknown labels {unknown}")
+            content = replace_unknown_references(self.notation_index, content)
+
         for retry in range(self.retries):
             if retry > 0:
                 print(f"LaTeX guard retry {retry + 1} of {self.retries}")
 
-            content = _latex_guard(self.client, self.doc, part_ref, content)
-            if (
-                _doc_compiles(
-                    add_comments(self.doc, part_ref, [content]),
-                ).returncode
-                == 0
-            ):
+            # the first fix uses the routed (fast) model; if the fixed content still
+            # does not compile, later fixes are escalated (see routing.py)
+            client = self.client if retry == 0 else self.client.escalated()
+            try:
+                with span("latex_guard: check and fix", retry=retry):
+                    content = _latex_guard(client, self.overlay, part_ref, content)
+            except BudgetExceeded as e:
+                # the content does not compile, and can not be fixed
+                print(f"LaTeX guard: {e}")
+                return (
+                    part_ref,
+                    r"\textbf{Generated content removed: it contained LaTeX errors "
+                    r"that could not be fixed within the spend limits of the run.}",
+                )
+            if _doc_compiles(
+                self.overlay.add(part_ref, [content]).materialize(), self.client
+            ).succeeded:
                 if retry == 0:
                     print("LaTeX guard: generated content compiles as is")
                 else:
@@ -0,0 +1,126 @@
+"""
+Stages of a pipeline connected by bounded queues.
+
+Each stage has a pool of worker threads that process items from its queue. Adding an
+item to a full queue blocks (so a fast stage cannot run far ahead of a slow stage).
+Each stage counts the processed items, the time its workers were busy, and the
+queue depth, to help choose the number of workers per stage.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+
+    processed: int = 0
+
+    # total time that workers were busy processing items
+    busy_seconds: float = 0.0
+
+    # number of items waiting in the queue (when last sampled), and the maximum
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+
+    started: float = field(default_factory=time.perf_counter)
+    stopped: Optional[float] = None
+
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False
+    )
+
+    def record_queue_depth(self, depth: int):
+        with self._lock:
+            self.queue_depth = depth
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def record_processed(self, busy_seconds: float):
+        with self._lock:
+            self.processed += 1
+            self.busy_seconds += busy_seconds
+
+    def stop(self):
+        self.stopped = time.perf_counter()
+
+    @property
+    def utilization(self) -> float:
+        """
+        Fraction of the time (while the stage was running) that workers were busy.
+        """
+        elapsed = (self.stopped or time.perf_counter()) - self.started
+        if elapsed <= 0 or self.workers == 0:
+            return 0.0
+        return min(1.0, self.busy_seconds / (elapsed * self.workers))
+
+    def summary(self) -> str:
+        return (
+            f"Stage {self.name}: {self.processed} item(s), {self.workers} worker(s), "
+            f"utilization {100 * self.utilization:.0f}%, "
+            f"max queue depth {self.max_queue_depth}"
+        )
+
+
+# Item put in a queue to stop a worker
+_STOP = object()
+
+
+class PipelineStage:
+    """
+    Pool of worker threads that apply a function to items from a bounded queue.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Any],
+        workers: int = 1,
+        queue_size: int = 8,
+    ):
+        self.fn = fn
+        self.stats = StageStats(name=name, workers=workers)
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._workers: list[threading.Thread] = [
+            threading.Thread(target=self._work, name=f"{name}-{idx}", daemon=True)
+            for idx in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _work(self):
+        while (item := self._queue.get()) is not _STOP:
+            value, future = item
+            self.stats.record_queue_depth(self._queue.qsize())
+            start = time.perf_counter()
+            try:
+                future.set_result(self.fn(value))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self.stats.record_processed(time.perf_counter() - start)
+
+    def submit(self, value: Any) -> Future:
+        """
+        Add an item to the queue (blocks while the queue is full). Returns a future
+        with the result of the stage function for the item.
+        """
+        future: Future = Future()
+        self._queue.put((value, future))
+        self.stats.record_queue_depth(self._queue.qsize())
+        return future
+
+    def close(self):
+        """
+        Wait until all items in the queue are processed, and stop the workers.
+        """
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+        self.stats.stop()
@@ -0,0 +1,224 @@
+r"""
+Combined review of one section: one query asks for the reports of several personas
+(eg. the language expert and the domain expert). The reports are returned between
+XML-tags, eg. <language_report>...</language_report>, and split into one comment per
+persona.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from ...genai_interface.anthropic import GenAIClient
+from ...latex_interface.data_model import (
+    ContentReferenceBase,
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+)
+from ...latex_interface.notation_index import NotationIndex
+from ..context import SectionSummaries, section_review_context
+from ..formatting import (
+    format_report,
+    make_review_comment_header,
+    short_report_prompt,
+)
+from . import domain_expert, language_expert
+
+
+@dataclass(frozen=True)
+class Persona:
+    # name used in XML-tags of the report, eg. "language" for <language_report>
+    name: str
+
+    # role shown in the report header
+    role: str
+
+    # what the persona should review
+    instructions: str
+
+
+def _instructions(*parts: str) -> str:
+    return "\n\n".join(part.strip() for part in parts)
+
+
+# The reviewers get the same instructions as in separate reviews (see language_expert
+# and domain_expert); the format of the reports is given in INSTRUCTIONS_PROMPT.
+PERSONAS: dict[str, Persona] = {
+    "language": Persona(
+        name="language",
+        role="English language expert",
+        instructions=_instructions(
+            language_expert.SYSTEM_PROMPT,
+            language_expert.REVIEW_ASPECTS,
+            language_expert.REPORT_LENGTH,
+        ),
+    ),
+    "domain": Persona(
+        name="domain",
+        role="Domain Expert",
+        instructions=_instructions(
+            domain_expert.SYSTEM_PROMPT, domain_expert.REVIEW_ASPECTS
+        ),
+    ),
+}
+
+
+SYSTEM_PROMPT: str = r"""You are a panel of expert reviewers of scientific papers.
+Each reviewer writes their own report, and only comments on their own topics."""
+
+
+INSTRUCTIONS_PROMPT: str = r"""
+The paper to review is provided in the latex_to_proofread-tag below:
+
+<latex_to_proofread>
+{LATEX_CONTENT}
+</latex_to_proofread>
+
+<FOCUS>
+
+Write one report for each of the reviewers described below:
+
+<REVIEWERS>
+
+Format of the reports:
+- Return only the reports, each between the XML-tags of its reviewer (as in the
+  <example_output> tag below). Do not write anything outside these tags.
+- Each report is a LaTeX-enumerated list followed by a short summary. Each report
+  must begin with "\begin{enumerate}" (without the quotes).
+- The reports will be copy-pasted into the paper and then compiled. Therefore each
+  report must be valid LaTeX. Eg., always surround formulas with dollar signs.
+- You can reference existing labels in the paper.
+
+<example_output>
+<EXAMPLE_OUTPUT>
+</example_output>
+"""
+
+
+def _report_tag(persona: str) -> str:
+    return f"{persona}_report"
+
+
+def split_persona_reports(
+    response: str, personas: Sequence[str]
+) -> dict[str, Optional[str]]:
+    """
+    Split the response of a combined query into the report of each persona (None if
+    the response does not contain a report for the persona).
+    """
+    reports: dict[str, Optional[str]] = {}
+    for persona in personas:
+        tag = _report_tag(persona)
+        match = re.search(rf"<{tag}>(.*?)</{tag}>", response, flags=re.DOTALL)
+        reports[persona] = match.group(1).strip() if match is not None else None
+    return reports
+
+
+def proofread_one_section_combined(
+    client: GenAIClient,
+    doc: LatexDocument,
+    section_ref: ContentReferenceBase,
+    personas: Sequence[str] = ("language", "domain"),
+    summaries: Optional[SectionSummaries] = None,
+    notation_index: Optional[NotationIndex] = None,
+    max_issues: Optional[int] = None,
+):
+    """
+    Review one section by several personas with one query. The context is the same
+    as for the domain expert (see `proofread_one_section_by_expert`). Yields one
+    comment per persona (in the order of 'personas'). With 'max_issues', the report
+    of each persona is kept short (see short_report_prompt).
+    """
+    role = "Combined review"
+
+    if isinstance(section_ref, PreSectionRef):
+        # content before the first \section{} is not proofread
+        yield from []
+        return
+
+    elif isinstance(section_ref, SectionRef):
+        client = client.for_section(section_ref.title)
+        if section_ref.in_appendix:
+            content_to_review = (
+                f"Section '{section_ref.title}' in the appendix "
+                f"(label: '{section_ref.generated_label}')"
+            )
+        else:
+            content_to_review = f"Section '{section_ref.title}'"
+
+    else:
+        raise ValueError(f"Invalid part type: {section_ref}")
+
+    task = f"Proofread '{content_to_review}' of paper"
+
+    print(f" - {role} ({', '.join(personas)}): {task}")
+
+    if notation_index is not None:
+        content_provided_for_review = "Section, and notation index of paper"
+    elif summaries is not None:
+        content_provided_for_review = "Section, and summaries of other sections"
+    else:
+        content_provided_for_review = "Entire paper"
+
+    response: str = client.make_query(
+        system_prompt=SYSTEM_PROMPT,
+        user_prompt=(
+            INSTRUCTIONS_PROMPT
+            # -
+            .replace(
+                "{LATEX_CONTENT}",
+                section_review_context(
+                    client,
+                    doc,
+                    section_ref,
+                    summaries,
+                    label=f"{role}: {task}",
+                    notation_index=notation_index,
+                ),
+            )
+            # -
+            .replace(
+                "<FOCUS>",
+                f"Your task is to review one part of the paper, namely "
+                f"{content_to_review}. The rest of the paper is only provided as "
+                "context.",
+            )
+            # -
+            .replace(
+                "<REVIEWERS>",
+                "\n".join(
+                    f'<reviewer name="{persona}">{PERSONAS[persona].instructions}'
+                    "</reviewer>"
+                    for persona in personas
+                ),
+            )
+            # -
+            .replace(
+                "<EXAMPLE_OUTPUT>",
+                "\n".join(
+                    f"<{_report_tag(persona)}>\n"
+                    "\\begin{enumerate}\n\\item Issue 1\n\\end{enumerate}\n"
+                    f"Short summary.\n</{_report_tag(persona)}>"
+                    for persona in personas
+                ),
+            )
+            + short_report_prompt(max_issues)
+        ),
+        label=f"{role}: {task}",
+    )
+
+    for persona, report in split_persona_reports(response, personas).items():
+        yield section_ref, format_report(
+            report=(
+                report
+                if report is not None
+                else r"\textbf{No report returned in combined review.}"
+            ),
+            review_comment_header=make_review_comment_header(
+                PERSONAS[persona].role,
+                f"{task} (combined review)",
+                content_provided_for_review,
+            ),
+            label=f"{PERSONAS[persona].role}: {task}",
+        )
@@ -1,4 +1,4 @@
-from typing import Tuple
+from typing import Optional, Tuple
 
 from ...genai_interface.anthropic import GenAIClient
 from ...latex_interface.data_model import (
@@ -8,7 +8,26 @@ from ...latex_interface.data_model import (
     SectionRef,
     to_latex,
 )
-from ..formatting import format_report, make_review_comment_header
+from ...latex_interface.notation_index import NotationIndex
+from ..context import (
+    OMITTED_MARKER,
+    SUMMARY_MARKER,
+    SectionSummaries,
+    section_review_context,
+)
+from ..formatting import (
+    format_report,
+    make_review_comment_header,
+    short_report_prompt,
+)
+from ..streaming import make_checked_query
+from ..structured_report import (
+    REPORT_ISSUES_TOOL,
+    STRUCTURED_OUTPUT_PROMPT,
+    format_rendered_report,
+    parse_issues,
+    render_issues,
+)
 
 SYSTEM_PROMPT: str = (
     r"""You are distinguished expert in the areas of <AREAS_OF_EXPERTICE>, with
@@ -26,17 +45,8 @@ standards of top journals in the field.""".replace(
 )
 
 
-INSTRUCTIONS_PROMPT: str = (
-    r"""Your task is to write up a report for an upcoming paper in your
-area of expertise.
-
-The material to proofread is provided in the latex_to_proofread-tag below:
-
-<latex_to_proofread>
-{LATEX_CONTENT}
-</latex_to_proofread>
-
-Please focus on the following aspects:
+# What the domain expert reviews (also used in combined reviews)
+REVIEW_ASPECTS: str = r"""Please focus on the following aspects:
 - Motivation: Ensure that the problem statement is well motivated.
 - Correctness: Critically assess the mathematical arguments for accuracy and proper motivation.
 - Clarity: Assess whether the ideas are expressed clearly and concisely, suitable for
@@ -49,7 +59,20 @@ Please focus on the following aspects:
 
 Conclude with a summary of the main strengths and weaknesses, and also provide
 suggestions for future research directions and/or broader themes that connect to this
-work.
+work."""
+
+
+INSTRUCTIONS_PROMPT: str = (
+    r"""Your task is to write up a report for an upcoming paper in your
+area of expertise.
+
+The material to proofread is provided in the latex_to_proofread-tag below:
+
+<latex_to_proofread>
+{LATEX_CONTENT}
+</latex_to_proofread>
+
+<REVIEW_ASPECTS>
 
 Format your proofreading report as follows:
 - For each issues that you find, please provide helpful suggestions on how the issue
@@ -87,6 +110,8 @@ Your report will be judged on its clarity of expression, thoroughness, and helpf
 
 Take a deep breath. Remember to be thorough and precise in your proofreading.
 """
+    # -
+    .replace("<REVIEW_ASPECTS>", REVIEW_ASPECTS)
     # -
     .replace(
         "<PROOFREAD_TASK_SUMMARY>",
@@ -99,7 +124,22 @@ def proofread_one_section_by_expert(
     client: GenAIClient,
     doc: LatexDocument,
     section_ref: ContentReferenceBase,
+    summaries: Optional[SectionSummaries] = None,
+    notation_index: Optional[NotationIndex] = None,
+    structured_output: bool = False,
+    stream_check: bool = False,
+    max_issues: Optional[int] = None,
 ):
+    """
+    Review one section. The entire paper is provided as context, or (if
+    'summaries' is given) summaries of the other sections, or (if 'notation_index' is
+    given) an index of the notation, definitions and labels in the paper.
+
+    With 'structured_output', issues are returned using a tool, and the report is
+    rendered to LaTeX locally (see structured_report). With 'stream_check', the report
+    is checked while it is streamed, and an off-format report is retried (see
+    streaming). With 'max_issues', the report is kept short (see short_report_prompt).
+    """
     role = "Domain Expert"
 
     if isinstance(section_ref, PreSectionRef):
@@ -108,6 +148,7 @@ def proofread_one_section_by_expert(
         return
 
     elif isinstance(section_ref, SectionRef):
+        client = client.for_section(section_ref.title)
         if section_ref.in_appendix:
             content_to_review = (
                 f"Section '{section_ref.title}' in the appendix "
@@ -119,40 +160,96 @@ def proofread_one_section_by_expert(
     else:
         raise ValueError(f"Invalid part type: {section_ref}")
 
-    content_provided_for_review = "Entire paper"
+    if notation_index is not None:
+        content_provided_for_review = "Section, and notation index of paper"
+        context_description = (
+            "The selected section is provided in full. To save space, the content "
+            f"of the other sections is omitted (marked by '{OMITTED_MARKER}'). "
+            "Instead, an index of the macros, definitions, theorems, labels and "
+            "terms in the paper is provided between <notation_index>-tags so you "
+            "can understand the context. "
+        )
+    elif summaries is None:
+        content_provided_for_review = "Entire paper"
+        context_description = (
+            "The entire paper is provided so you can understand the context. "
+        )
+    else:
+        content_provided_for_review = "Section, and summaries of other sections"
+        context_description = (
+            "The selected section is provided in full. To save space, the content "
+            "of the other sections is replaced by summaries (marked by "
+            f"'{SUMMARY_MARKER}') so you can understand the context. "
+        )
 
     task = f"Proofread '{content_to_review}' of paper"
 
     print(f" - {role}: {task}")
 
-    review_reports: str = client.make_query(
-        system_prompt=SYSTEM_PROMPT,
-        user_prompt=(
-            INSTRUCTIONS_PROMPT
-            # -
-            .replace("{LATEX_CONTENT}", to_latex(doc))
-            # -
-            .replace(
-                "<FOCUS>",
-                f"Your task is to review one part of the paper, namely {content_to_review}. "
-                f"The entire paper is provided so you can understand the context. "
-                f"However, your task is to only review the selected section. ",
+    user_prompt: str = (
+        INSTRUCTIONS_PROMPT
+        # -
+        .replace(
+            "{LATEX_CONTENT}",
+            section_review_context(
+                client,
+                doc,
+                section_ref,
+                summaries,
+                label=f"{role}: {task}",
+                notation_index=notation_index,
+            ),
+        )
+        # -
+        .replace(
+            "<FOCUS>",
+            f"Your task is to review one part of the paper, namely {content_to_review}. "
+            + context_description
+            + f"However, your task is to only review the selected section. ",
+        )
+    ) + short_report_prompt(max_issues)
+    header = make_review_comment_header(role, task, content_provided_for_review)
+
+    if structured_output:
+        report, math = render_issues(
+            *parse_issues(
+                client.make_structured_query(
+                    system_prompt=SYSTEM_PROMPT,
+                    user_prompt=user_prompt + STRUCTURED_OUTPUT_PROMPT,
+                    tool=REPORT_ISSUES_TOOL,
+                    label=f"{role}: {task}",
+                )
             )
-        ),
-        label=f"{role}: {task}",
+        )
+        yield section_ref, format_rendered_report(
+            report, math, role, task, content_provided_for_review
+        )
+        return
+
+    review_reports: str = (
+        make_checked_query(
+            client,
+            system_prompt=SYSTEM_PROMPT,
+            user_prompt=user_prompt,
+            label=f"{role}: {task}",
+        )
+        if stream_check
+        else client.make_query(
+            system_prompt=SYSTEM_PROMPT,
+            user_prompt=user_prompt,
+            label=f"{role}: {task}",
+        )
     )
 
     yield section_ref, format_report(
         report=review_reports,
-        review_comment_header=make_review_comment_header(
-            role, task, content_provided_for_review
-        ),
+        review_comment_header=header,
         label=f"{role}: {task}",
     )
 
 
 def proofread_title_abstract_and_intro_vs_paper_by_domain_expert(
-    client: GenAIClient, doc: LatexDocument
+    client: GenAIClient, doc: LatexDocument, max_issues: Optional[int] = None
 ) -> Tuple[ContentReferenceBase, str]:
     role = "Domain Expert"
     task = "Check that the title, abstract and introduction match the rest of the paper"
@@ -174,6 +271,7 @@ def proofread_title_abstract_and_intro_vs_paper_by_domain_expert(
                 "In your report, treat the title, the abstract and introduction "
                 "separately. ",
             )
+            + short_report_prompt(max_issues)
         ),
         label=f"{role}: {task}",
     )
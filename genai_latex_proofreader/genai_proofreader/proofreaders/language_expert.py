@@ -1,3 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
 from ...genai_interface.anthropic import GenAIClient
 from ...latex_interface.data_model import (
     ContentReferenceBase,
@@ -5,7 +8,30 @@ from ...latex_interface.data_model import (
     PreSectionRef,
     SectionRef,
 )
-from ..formatting import format_report, make_review_comment_header
+from ..chunking import (
+    DEFAULT_MAX_CHUNK_TOKENS,
+    DEFAULT_OVERLAP_TOKENS,
+    SectionChunk,
+    chunk_section,
+    merge_reports,
+)
+from ..formatting import (
+    format_report,
+    make_review_comment_header,
+    short_report_prompt,
+)
+from ..streaming import make_checked_query
+from ..structured_report import (
+    REPORT_ISSUES_TOOL,
+    STRUCTURED_OUTPUT_PROMPT,
+    Issue,
+    format_rendered_report,
+    merge_issues,
+    parse_issues,
+    render_issues,
+)
+
+T = TypeVar("T")
 
 SYSTEM_PROMPT: str = """
 You are an elite-level editor and proofreader with over 20 years of experience in
@@ -54,17 +80,8 @@ feedback for its depth, clarity, and actionable nature, consistently resulting i
 polished, professional manuscripts ready for high-impact publication.
 """
 
-INSTRUCTIONS_PROMPT: str = r"""
-Your task is to proofread and suggest improvement on the provided {FOCUS} from an
-academic paper under review. Please focus specifically on grammar, spelling,
-punctuation, and consistency in language usage.
-
-The material to proofread is provided in the latex_to_proofread-tag below:
-<latex_to_proofread>
-{LATEX_CONTENT}
-</latex_to_proofread>
-
-Please focus on the following aspects:
+# What the language expert reviews (also used in combined reviews)
+REVIEW_ASPECTS: str = r"""Please focus on the following aspects:
 - Grammar: Identify and correct any grammatical errors.
 - Spelling: Spot and correct any spelling mistakes or typos.
 - Formatting: Check for consistent use of formatting elements such as italics,
@@ -80,7 +97,23 @@ Please focus on the following aspects:
 Your task is only to focus on the language usage in the paper.
 - Do not proofread or comment on the scientific content of the paper.
 - Do not proofread or suggest improvements on the use of Latex.
-These tasks are handled by other experts.
+These tasks are handled by other experts."""
+
+REPORT_LENGTH: str = r"""Your report should be thorough but concise (aim for 15-20 key points). Focus on
+the most significant issues that improve readability and professionalism."""
+
+INSTRUCTIONS_PROMPT: str = (
+    r"""
+Your task is to proofread and suggest improvement on the provided {FOCUS} from an
+academic paper under review. Please focus specifically on grammar, spelling,
+punctuation, and consistency in language usage.
+
+The material to proofread is provided in the latex_to_proofread-tag below:
+<latex_to_proofread>
+{LATEX_CONTENT}
+</latex_to_proofread>
+
+<REVIEW_ASPECTS>
 
 Format your proofreading report as follows:
 
@@ -111,16 +144,54 @@ the <example_proofread_report> tag below. Your review must begin with
 Conclude with a short summary of your findings.
 </example_proofread_report>
 
-Your report should be thorough but concise (aim for 15-20 key points). Focus on
-the most significant issues that improve readability and professionalism.
+<REPORT_LENGTH>
 """
+    # -
+    .replace("<REVIEW_ASPECTS>", REVIEW_ASPECTS)
+    # -
+    .replace("<REPORT_LENGTH>", REPORT_LENGTH)
+)
+
+
+# Marker line after the lines repeated from the previous part of a section
+CHUNK_OVERLAP_END: str = "% --- end of context from previous part ---"
+
+
+def _chunk_content(chunk: SectionChunk) -> str:
+    if chunk.overlap == 0:
+        return "\n".join(chunk.lines)
+
+    return "\n".join(
+        [
+            *chunk.lines[: chunk.overlap],
+            CHUNK_OVERLAP_END,
+            *chunk.lines[chunk.overlap :],
+        ]
+    )
 
 
 def proofread_one_section_for_language(
     client: GenAIClient,
     doc: LatexDocument,
     section_ref: ContentReferenceBase,
+    max_chunk_tokens: int = DEFAULT_MAX_CHUNK_TOKENS,
+    overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+    max_workers: int = 4,
+    structured_output: bool = False,
+    stream_check: bool = False,
+    max_issues: Optional[int] = None,
 ):
+    """
+    Proofread one section for language. Long sections are split into parts (of at
+    most 'max_chunk_tokens' estimated tokens) that are proofread in parallel, and
+    the reports for the parts are merged into one report.
+
+    With 'structured_output', issues are returned using a tool, and the report is
+    rendered to LaTeX locally (see structured_report). With 'stream_check', reports
+    are checked while they are streamed, and off-format reports are retried (see
+    streaming). With 'max_issues', the report of each part is kept short (see
+    short_report_prompt).
+    """
     role = "English language expert"
 
     if isinstance(section_ref, PreSectionRef):
@@ -129,6 +200,7 @@ def proofread_one_section_for_language(
         return
 
     elif isinstance(section_ref, SectionRef):
+        client = client.for_section(section_ref.title)
         if section_ref.in_appendix:
             content_to_review = (
                 f"Section '{section_ref.title}' in the appendix "
@@ -144,25 +216,83 @@ def proofread_one_section_for_language(
 
     print(f" - {role}: {task}")
 
-    section_content: str = "\n".join(doc.content_dict[section_ref])
+    chunks: list[SectionChunk] = chunk_section(
+        doc.content_dict[section_ref], max_chunk_tokens, overlap_tokens
+    ) or [SectionChunk(lines=list(doc.content_dict[section_ref]))]
 
-    review_reports: str = client.make_query(
-        system_prompt=SYSTEM_PROMPT,
-        user_prompt=(
+    def _prompt(chunk_idx: int) -> tuple[str, str]:
+        if len(chunks) == 1:
+            focus, label = "section", f"{role}: {task}"
+        else:
+            focus = (
+                f"part {chunk_idx + 1} of {len(chunks)} of a section (lines before "
+                f"the line '{CHUNK_OVERLAP_END}' are the end of the previous part, "
+                "and only included as context. Do not proofread these lines.)"
+                if chunks[chunk_idx].overlap > 0
+                else f"part {chunk_idx + 1} of {len(chunks)} of a section"
+            )
+            label = f"{role}: {task} (part {chunk_idx + 1} of {len(chunks)})"
+
+        user_prompt = (
             INSTRUCTIONS_PROMPT
             # -
-            .replace("{LATEX_CONTENT}", section_content)
+            .replace("{LATEX_CONTENT}", _chunk_content(chunks[chunk_idx]))
             # -
-            .replace("{FOCUS}", "section")
-        ),
-        label=f"{role}: {task}",
+            .replace("{FOCUS}", focus)
+        ) + short_report_prompt(max_issues)
+        return user_prompt, label
+
+    def _query(chunk_idx: int) -> str:
+        user_prompt, label = _prompt(chunk_idx)
+        if stream_check:
+            return make_checked_query(
+                client,
+                system_prompt=SYSTEM_PROMPT,
+                user_prompt=user_prompt,
+                label=label,
+            )
+        return client.make_query(
+            system_prompt=SYSTEM_PROMPT, user_prompt=user_prompt, label=label
+        )
+
+    def _structured_query(chunk_idx: int) -> tuple[list[Issue], str]:
+        user_prompt, label = _prompt(chunk_idx)
+        return parse_issues(
+            client.make_structured_query(
+                system_prompt=SYSTEM_PROMPT,
+                user_prompt=user_prompt + STRUCTURED_OUTPUT_PROMPT,
+                tool=REPORT_ISSUES_TOOL,
+                label=label,
+            )
+        )
+
+    def _run_queries(query: Callable[[int], T]) -> list[T]:
+        if len(chunks) == 1:
+            return [query(0)]
+        print(f"   (section split into {len(chunks)} parts)")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(query, range(len(chunks))))
+
+    header = make_review_comment_header(
+        role=role, task=task, content_provided_for_review=content_to_review
     )
+    if structured_output:
+        results = _run_queries(_structured_query)
+        report, math = render_issues(
+            merge_issues([issues for issues, _ in results]),
+            "\n\n".join(summary for _, summary in results if summary != ""),
+        )
+        yield section_ref, format_rendered_report(
+            report, math, role, task, content_to_review
+        )
+        return
+
+    reports = _run_queries(_query)
+    review_reports: str = reports[0] if len(reports) == 1 else merge_reports(reports)
 
     yield section_ref, format_report(
         report=review_reports,
-        review_comment_header=make_review_comment_header(
-            role=role, task=task, content_provided_for_review=content_to_review
-        ),
+        review_comment_header=header,
         label=f"{role}: {task}",
     )
 
@@ -170,6 +300,7 @@ def proofread_one_section_for_language(
 def proofread_abstract_for_language(
     client: GenAIClient,
     doc: LatexDocument,
+    max_issues: Optional[int] = None,
 ) -> str:
     if not r"\begin{abstract}" in doc.begin_document:
         print("Skipped: No abstract found to proofread for language")
@@ -192,6 +323,7 @@ def proofread_abstract_for_language(
             .replace("{LATEX_CONTENT}", section_content)
             # -
             .replace("{FOCUS}", "abstract")
+            + short_report_prompt(max_issues)
         ),
         label=f"{role}: {task}",
     )
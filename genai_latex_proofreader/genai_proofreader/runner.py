@@ -1,10 +1,25 @@
-from dataclasses import replace
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from functools import partial
+from typing import Any, Callable, Iterable, Mapping, Optional, Tuple
 
 from ..genai_interface.anthropic import GenAIClient
-from ..latex_interface.data_model import LatexDocument, PreSectionRef
-from ..proofread_comments.add_comments import add_comments
-from .formatting import project_plug
+from ..genai_interface.spend import BudgetExceeded
+from ..latex_interface.data_model import (
+    ContentReferenceBase,
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+)
+from ..latex_interface.notation_index import NotationIndex, build_notation_index
+from ..proofread_comments.add_comments import CommentOverlay
+from .budget import RunBudget, TaskMode
+from .context import ContextMode, SectionSummaries
+from .formatting import format_report, project_plug
+from .incremental import IncrementalReviews, fingerprint, section_fingerprint
 from .latex_guard import LatexGuard
+from .pipeline import PipelineStage, StageStats
+from .proofreaders.combined import proofread_one_section_combined
 from .proofreaders.domain_expert import (
     proofread_one_section_by_expert,
     proofread_title_abstract_and_intro_vs_paper_by_domain_expert,
@@ -13,53 +28,408 @@ from .proofreaders.language_expert import (
     proofread_abstract_for_language,
     proofread_one_section_for_language,
 )
+from .scheduler import PersonaTask, run_task_graph
+from .structured_report import escape_latex
+
+# Default maximum number of concurrent review tasks per persona
+DEFAULT_PERSONA_CONCURRENCY: dict[str, int] = {
+    "language": 2,
+    "domain": 2,
+    "combined": 2,
+}
+
+
+@dataclass(frozen=True)
+class _Review:
+    # name of the review in the task graph
+    name: str
+    persona: str
+
+    # name of the review task in the incremental state
+    task: str
+
+    # section where stored comments are inserted
+    section_ref: ContentReferenceBase
+
+    # fingerprint of the reviewed content (None: the review is not stored)
+    content_fingerprint: Optional[str]
+
+    # function that makes the review with a client, and the maximum number of issues
+    # in the report (None: no limit). Returns comments before LaTeX validation.
+    generate: Callable[
+        [GenAIClient, Optional[int]], Iterable[Tuple[ContentReferenceBase, str]]
+    ]
+
+    # does the review use the entire paper as context?
+    uses_context: bool = False
+
+    # priority (0 is the most important), see RunBudget
+    priority: int = 0
+
 
+# Notes added to the report for skipped and incomplete reviews
+SKIPPED_NOTE: str = "Review skipped to meet the deadline or budget of the run."
+REFUSED_NOTE: str = "Review incomplete: the spend limits of the run were reached."
 
-def proofread_paper(client: GenAIClient, doc: LatexDocument) -> LatexDocument:
+
+def _skipped_note(review: _Review, note: str = SKIPPED_NOTE) -> str:
+    return format_report(
+        report=rf"\textbf{{{note}}}",
+        review_comment_header=(
+            rf"\textbf{{Skipped review:}} \emph{{{escape_latex(review.name)}}} \\ \\"
+        ),
+        label=f"skipped: {review.name}",
+    )
+
+
+def _budget_note(budget: RunBudget) -> str:
+    def _list(names: list[str]) -> str:
+        return ", ".join(escape_latex(name) for name in names) or "none"
+
+    return format_report(
+        report=(
+            r"\textbf{This report is partial.} "
+            f"Reviews skipped: {_list(budget.tasks(TaskMode.SKIPPED))}. "
+            f"Reviews with reduced output: {_list(budget.tasks(TaskMode.DEGRADED))}."
+        ),
+        review_comment_header=r"\textbf{Deadline or budget of the run reached} \\ \\",
+        label="budget-note",
+    )
+
+
+def _completed(value) -> Future:
+    future: Future = Future()
+    future.set_result(value)
+    return future
+
+
+def proofread_paper(
+    client: GenAIClient,
+    doc: LatexDocument,
+    incremental: Optional[IncrementalReviews] = None,
+    context_mode: ContextMode = ContextMode.FULL,
+    combined_reviews: bool = False,
+    structured_output: bool = False,
+    stream_check: bool = False,
+    persona_concurrency: Mapping[str, int] = DEFAULT_PERSONA_CONCURRENCY,
+    max_workers: int = 4,
+    validation_workers: int = 2,
+    queue_size: int = 8,
+    stage_stats: Optional[list[StageStats]] = None,
+    budget: Optional[RunBudget] = None,
+    degraded_max_tokens: int = 1000,
+    degraded_max_issues: int = 5,
+) -> CommentOverlay:
     """
     Top level function to proofread a paper using GenAI and attach reports them to the
     input Latex document.
+
+    Returns the reports as a comment overlay on the input document (with the color
+    package added). Use `materialize()` to get the report document.
+
+    Args:
+        client:      GenAI client used for reviews
+        doc:         The document to proofread
+        incremental: Optional reviews from a previous run to reuse for unchanged
+                     parts of the paper. The reviews of this run are collected into
+                     `incremental.state`.
+        context_mode: Context for domain expert section reviews: the entire paper,
+                     or the section and summaries of the other sections, or the
+                     section and an index of the notation in the paper.
+        combined_reviews: Review each section by the language and domain experts
+                     with one query (instead of one query per expert).
+        structured_output: Section reviews by the language and domain experts
+                     return issues as structured output, that are rendered to LaTeX
+                     locally (not used for combined reviews).
+        stream_check: Section reviews by the language and domain experts are
+                     checked while they are streamed, and aborted (and retried) if
+                     they go off-format (not used for combined reviews, or with
+                     structured output).
+        persona_concurrency: Maximum number of concurrent review tasks per persona
+                     (eg. "language", "domain").
+        max_workers: Maximum number of concurrent review tasks.
+        validation_workers: Number of threads that check (and fix) the LaTeX of
+                     generated comments.
+        queue_size:  Maximum number of items waiting for validation, and for
+                     merging into the report.
+        stage_stats: Optional list where the counters of the pipeline stages
+                     (generation, validation, merge) are added.
+        budget:      Optional deadline and token budget. As it is used up, reviews
+                     with low priority (appendix, then main sections) are made with
+                     'degraded_max_tokens', and then skipped (noted in the report).
+        degraded_max_tokens: Maximum output tokens for degraded reviews.
+        degraded_max_issues: Maximum number of issues that degraded reviews are
+                     asked to report (so that they fit in 'degraded_max_tokens').
     """
+    if incremental is None:
+        incremental = IncrementalReviews(doc)
+
     # ensure that the color package is included in report
-    doc = replace(doc, pre_matter=doc.pre_matter + [r"\usepackage{color}"])
+    doc = replace(doc, pre_matter=[*doc.pre_matter, r"\usepackage{color}"])
 
-    latex_guard = LatexGuard(client, doc)
+    # index of notation and labels (used as context, and to validate references)
+    notation_index = build_notation_index(doc)
+    latex_guard = LatexGuard(client, doc, notation_index=notation_index)
 
-    def _get_reports():
+    summaries: Optional[SectionSummaries] = (
+        SectionSummaries(client) if context_mode == ContextMode.COMPRESSED else None
+    )
 
-        # Language expert: proofread abstract
-        yield latex_guard(
-            (
-                PreSectionRef(in_appendix=False),
-                proofread_abstract_for_language(client, doc),
-            )
-        )
+    context_task_suffix: str = (
+        "" if context_mode == ContextMode.FULL else f":{context_mode.value}"
+    )
+    context_notation_index: Optional[NotationIndex] = (
+        notation_index if context_mode == ContextMode.NOTATION else None
+    )
 
-        # Domain expert: check abstract vs paper content
-        yield latex_guard(
-            proofread_title_abstract_and_intro_vs_paper_by_domain_expert(client, doc)
+    def _section_reviews(section_ref: ContentReferenceBase) -> list[_Review]:
+        name: str = (
+            section_ref.generated_label
+            if isinstance(section_ref, SectionRef)
+            else f"pre-section:{section_ref.in_appendix}"
         )
+        # main sections before the appendix
+        priority: int = 2 if section_ref.in_appendix else 1
+        if combined_reviews:
+            return [
+                _Review(
+                    name=f"combined:section:{name}",
+                    persona="combined",
+                    task=f"combined:section{context_task_suffix}",
+                    section_ref=section_ref,
+                    content_fingerprint=section_fingerprint(doc, section_ref),
+                    generate=lambda client, max_issues: proofread_one_section_combined(
+                        client,
+                        doc,
+                        section_ref,
+                        summaries=summaries,
+                        notation_index=context_notation_index,
+                        max_issues=max_issues,
+                    ),
+                    uses_context=True,
+                    priority=priority,
+                )
+            ]
 
-        # LaTeX guard should not be necessary since plug is a constant.
-        yield latex_guard(
-            (
-                PreSectionRef(in_appendix=False),
-                project_plug(),
-            )
-        )
+        return [
+            _Review(
+                name=f"language:section:{name}",
+                persona="language",
+                task="language:section",
+                section_ref=section_ref,
+                content_fingerprint=section_fingerprint(doc, section_ref),
+                generate=lambda client, max_issues: proofread_one_section_for_language(
+                    client,
+                    doc,
+                    section_ref,
+                    structured_output=structured_output,
+                    stream_check=stream_check,
+                    max_issues=max_issues,
+                ),
+                priority=priority,
+            ),
+            _Review(
+                name=f"domain:section:{name}",
+                persona="domain",
+                task=f"domain:section{context_task_suffix}",
+                section_ref=section_ref,
+                content_fingerprint=section_fingerprint(doc, section_ref),
+                generate=lambda client, max_issues: proofread_one_section_by_expert(
+                    client,
+                    doc,
+                    section_ref,
+                    summaries,
+                    notation_index=context_notation_index,
+                    structured_output=structured_output,
+                    stream_check=stream_check,
+                    max_issues=max_issues,
+                ),
+                uses_context=True,
+                priority=priority,
+            ),
+        ]
 
+    first_ref = list(doc.content_dict.keys())[0]
+
+    # Comments are inserted in the order of the reviews
+    reviews: list[_Review] = [
+        # Language expert: proofread abstract
+        _Review(
+            name="language:abstract",
+            persona="language",
+            task="language:abstract",
+            section_ref=PreSectionRef(in_appendix=False),
+            content_fingerprint=fingerprint(doc.begin_document),
+            generate=lambda client, max_issues: [
+                (
+                    PreSectionRef(in_appendix=False),
+                    proofread_abstract_for_language(client, doc, max_issues),
+                )
+            ],
+        ),
+        # Domain expert: check abstract vs paper content
+        _Review(
+            name="domain:title-abstract-intro",
+            persona="domain",
+            task="domain:title-abstract-intro",
+            section_ref=first_ref,
+            content_fingerprint=fingerprint(doc.pre_matter, doc.begin_document),
+            generate=lambda client, max_issues: [
+                proofread_title_abstract_and_intro_vs_paper_by_domain_expert(
+                    client, doc, max_issues
+                )
+            ],
+            uses_context=True,
+        ),
+        # LaTeX guard should not be necessary since plug is a constant (the plug is
+        # not stored in the incremental state).
+        _Review(
+            name="project-plug",
+            persona="project-plug",
+            task="project-plug",
+            section_ref=PreSectionRef(in_appendix=False),
+            content_fingerprint=None,
+            generate=lambda client, max_issues: [
+                (PreSectionRef(in_appendix=False), project_plug())
+            ],
+        ),
         # Language + Domain experts: review each section
-        for section_ref in doc.content_dict.keys():
-            yield from map(
-                latex_guard,
-                proofread_one_section_for_language(client, doc, section_ref),
+        *[
+            review
+            for section_ref in doc.content_dict.keys()
+            for review in _section_reviews(section_ref)
+        ],
+    ]
+
+    # Reviews run as a pipeline: generated comments are validated (ie. compiled) while
+    # other queries are in flight, and merged into the report in the order of the
+    # reviews. Stages are connected by bounded queues.
+
+    # Stage 2: check (and fix) LaTeX of generated comments
+    validation = PipelineStage(
+        "validation", latex_guard, workers=validation_workers, queue_size=queue_size
+    )
+
+    # Stage 3: add comments to report (in the order of the reviews)
+    report = CommentOverlay(doc)
+    next_idx: int = 0
+    waiting: dict[int, tuple[_Review, list[Future], bool]] = {}
+
+    def _merge(item: tuple[int, _Review, list[Future], bool]):
+        nonlocal report, next_idx
+        idx, review, futures, store = item
+        waiting[idx] = (review, futures, store)
+        while next_idx in waiting:
+            review, futures, store = waiting.pop(next_idx)
+            comments: list[Tuple[ContentReferenceBase, str]] = [
+                future.result() for future in futures
+            ]
+            if store and review.content_fingerprint is not None:
+                incremental.record(
+                    review.task,
+                    review.content_fingerprint,
+                    [comment for _, comment in comments],
+                    review.uses_context,
+                )
+            elif review.content_fingerprint is not None:
+                incremental.keep(review.task, review.content_fingerprint)
+            for k, v in comments:
+                report = report.add(k, [v])
+            next_idx += 1
+
+    merge = PipelineStage("merge", _merge, workers=1, queue_size=queue_size)
+    merged: list[Future] = []
+
+    # Stage 1: generate comments (reused comments were validated in a previous run,
+    # and are also used for degraded and skipped reviews). Degraded and skipped
+    # reviews are not stored in the incremental state (the stored review of the
+    # previous run, if any, is kept).
+    def _generate(
+        idx: int, review: _Review, mode: TaskMode, _dependencies: Mapping[str, Any]
+    ):
+        stored: Optional[list[str]] = (
+            incremental.reuse(
+                review.task, review.content_fingerprint, review.uses_context
             )
-            yield from map(
-                latex_guard,
-                proofread_one_section_by_expert(client, doc, section_ref),
+            if review.content_fingerprint is not None
+            else None
+        )
+        store: bool = stored is None and mode == TaskMode.FULL
+        if stored is not None:
+            futures = [_completed((review.section_ref, comment)) for comment in stored]
+        elif mode == TaskMode.SKIPPED:
+            # content before the first section is not reviewed (no note is needed)
+            futures = (
+                [_completed((review.section_ref, _skipped_note(review)))]
+                if isinstance(review.section_ref, SectionRef)
+                else []
             )
+        else:
+            futures = []
+            try:
+                for comment in (
+                    review.generate(
+                        client.with_max_tokens(degraded_max_tokens),
+                        degraded_max_issues,
+                    )
+                    if mode == TaskMode.DEGRADED
+                    else review.generate(client, None)
+                ):
+                    futures.append(validation.submit(comment))
+            except BudgetExceeded as e:
+                # keep the comments generated so far, but do not store them
+                print(f"Review {review.name} is incomplete: {e}")
+                futures.append(
+                    _completed(
+                        (review.section_ref, _skipped_note(review, REFUSED_NOTE))
+                    )
+                )
+                store = False
+        merged.append(merge.submit((idx, review, futures, store)))
 
-    for k, v in _get_reports():
-        doc = add_comments(doc, k, [v])
+    generation_stats = StageStats(name="generation", workers=max_workers)
+    try:
+        run_task_graph(
+            [
+                PersonaTask(
+                    name=review.name,
+                    persona=review.persona,
+                    run=partial(_generate, idx, review, TaskMode.FULL),
+                    priority=review.priority,
+                    degraded_run=partial(_generate, idx, review, TaskMode.DEGRADED),
+                    # the most important reviews are never skipped
+                    skipped_run=(
+                        partial(_generate, idx, review, TaskMode.SKIPPED)
+                        if review.priority > 0
+                        else None
+                    ),
+                )
+                for idx, review in enumerate(reviews)
+            ],
+            persona_concurrency,
+            max_workers,
+            stats=generation_stats,
+            budget=budget,
+        )
+    finally:
+        validation.close()
+        merge.close()
+
+    for future in merged:
+        # raise any errors from validation or merge
+        future.result()
+
+    for stats in [generation_stats, validation.stats, merge.stats]:
+        print(stats.summary())
+        if stage_stats is not None:
+            stage_stats.append(stats)
+
+    if budget is not None:
+        print(budget.summary())
+        if budget.partial:
+            report = report.add(
+                PreSectionRef(in_appendix=False), [_budget_note(budget)]
+            )
 
-    return doc
+    print(incremental.summary())
+    return report
@@ -0,0 +1,171 @@
+"""
+Run proofreading tasks as a graph: each task belongs to a persona (eg. the language
+expert), and can depend on the results of other tasks. Tasks whose dependencies are
+done are run in parallel, with an optional limit on the number of concurrent tasks
+per persona (eg. to limit the number of parallel queries of one kind).
+
+Results are returned in the order the tasks were given, independent of the order in
+which they finished.
+
+With a run budget (see budget.py), tasks with low priority are run in a degraded
+mode, or skipped, as the budget is used up.
+"""
+
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Mapping, Optional, Sequence
+
+from .budget import RunBudget, TaskMode
+from .pipeline import StageStats
+
+
+@dataclass(frozen=True)
+class PersonaTask:
+    # unique name of the task, eg. "language:section:Introduction"
+    name: str
+
+    # persona running the task, eg. "language"
+    persona: str
+
+    # function that runs the task; called with the results of the dependencies
+    # (by task name)
+    run: Callable[[Mapping[str, Any]], Any]
+
+    # names of tasks that must be done before this task can run
+    depends_on: tuple[str, ...] = ()
+
+    # priority of the task (0 is the most important). Ready tasks are started in
+    # order of priority.
+    priority: int = 0
+
+    # functions called instead of 'run' when the task is degraded or skipped due to
+    # the run budget (if None, the task is run as usual)
+    degraded_run: Optional[Callable[[Mapping[str, Any]], Any]] = None
+    skipped_run: Optional[Callable[[Mapping[str, Any]], Any]] = None
+
+    def run_function(self, mode: TaskMode) -> Callable[[Mapping[str, Any]], Any]:
+        if mode == TaskMode.SKIPPED and self.skipped_run is not None:
+            return self.skipped_run
+        if mode != TaskMode.FULL and self.degraded_run is not None:
+            return self.degraded_run
+        return self.run
+
+
+def _check_task_graph(tasks: Sequence[PersonaTask]):
+    names: set[str] = set()
+    for task in tasks:
+        if task.name in names:
+            raise ValueError(f"Duplicate task name: {task.name}")
+        names.add(task.name)
+
+    for task in tasks:
+        for dependency in task.depends_on:
+            if dependency not in names:
+                raise ValueError(
+                    f"Task {task.name} depends on unknown task {dependency}"
+                )
+
+    # check for cycles (by removing tasks without remaining dependencies)
+    remaining: dict[str, set[str]] = {task.name: set(task.depends_on) for task in tasks}
+    while len(remaining) > 0:
+        ready = [name for name, deps in remaining.items() if len(deps) == 0]
+        if len(ready) == 0:
+            raise ValueError(
+                f"Cyclic dependencies between tasks: {sorted(remaining.keys())}"
+            )
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def run_task_graph(
+    tasks: Sequence[PersonaTask],
+    persona_concurrency: Mapping[str, int] = {},
+    max_workers: int = 4,
+    stats: Optional[StageStats] = None,
+    budget: Optional[RunBudget] = None,
+) -> dict[str, Any]:
+    """
+    Run tasks in parallel (when their dependencies are done), and return their
+    results by task name (in the order of 'tasks').
+
+    Ready tasks are started in order of priority (and then in the order of 'tasks').
+    If a task fails, no new tasks are started, and the exception is raised (once
+    running tasks are done).
+
+    Args:
+        tasks:               Tasks to run
+        persona_concurrency: Maximum number of concurrent tasks per persona
+                             (personas not included are only limited by
+                             'max_workers')
+        max_workers:         Maximum number of concurrent tasks
+        stats:               Optional counters for the tasks (the queue depth is the
+                             number of tasks ready to run, but not started)
+        budget:              Optional budget that determines if tasks are run as
+                             usual, degraded or skipped (when they are started)
+    """
+    _check_task_graph(tasks)
+
+    results: dict[str, Any] = {}
+    pending: list[PersonaTask] = sorted(tasks, key=lambda task: task.priority)
+    running: dict[Future, PersonaTask] = {}
+    running_per_persona: Counter[str] = Counter()
+
+    def _can_start(task: PersonaTask) -> bool:
+        return (
+            len(running) < max_workers
+            and all(dependency in results for dependency in task.depends_on)
+            and running_per_persona[task.persona]
+            < persona_concurrency.get(task.persona, max_workers)
+        )
+
+    def _run(task: PersonaTask, dependency_results: Mapping[str, Any]) -> Any:
+        start = time.perf_counter()
+        mode: TaskMode = (
+            budget.task_mode(task.name, task.priority)
+            if budget is not None
+            else TaskMode.FULL
+        )
+        try:
+            return task.run_function(mode)(dependency_results)
+        finally:
+            if stats is not None:
+                stats.record_processed(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(pending) > 0 or len(running) > 0:
+            for task in list(pending):
+                if not _can_start(task):
+                    continue
+                pending.remove(task)
+                running_per_persona[task.persona] += 1
+                dependency_results = {
+                    dependency: results[dependency] for dependency in task.depends_on
+                }
+                running[executor.submit(_run, task, dependency_results)] = task
+
+            if stats is not None:
+                stats.record_queue_depth(
+                    sum(
+                        all(dependency in results for dependency in task.depends_on)
+                        for task in pending
+                    )
+                )
+
+            if len(running) == 0:
+                raise ValueError(
+                    "No task can be started (check persona concurrency limits)"
+                )
+
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                running_per_persona[task.persona] -= 1
+                results[task.name] = future.result()
+
+    if stats is not None:
+        stats.stop()
+    return {task.name: results[task.name] for task in tasks}
@@ -0,0 +1,58 @@
+r"""
+Queries whose LaTeX output is checked while it is streamed (see stream_check).
+Generations that go off-format (eg. not starting with \begin{enumerate}, or with a
+\section command) are aborted early and retried, instead of waiting for the full
+output and then fixing it with the LaTeX guard.
+"""
+
+from typing import Optional
+
+from ..genai_interface.anthropic import GenAIClient
+from ..latex_interface.stream_check import IncrementalLatexChecker, OffFormatOutput
+
+
+def make_checked_query(
+    client: GenAIClient,
+    system_prompt: str,
+    user_prompt: str,
+    label: str,
+    required_prefix: Optional[str] = r"\begin{enumerate}",
+    retries: int = 1,
+) -> str:
+    """
+    Make streamed query, and abort (and retry) it when the output goes off-format.
+    The output of the last attempt is not aborted (the LaTeX guard can still fix it).
+    """
+    for attempt in range(retries + 1):
+        checker: Optional[IncrementalLatexChecker] = IncrementalLatexChecker(
+            required_prefix
+        )
+        parts: list[str] = []
+        response = client.stream_query(
+            system_prompt,
+            user_prompt,
+            label if attempt == 0 else f"{label} (retry {attempt})",
+        )
+        try:
+            for text in response:
+                parts.append(text)
+                try:
+                    if checker is not None:
+                        checker.feed(text)
+                except OffFormatOutput as e:
+                    print(f"Streaming check: {label}: {e}")
+                    if attempt < retries:
+                        print(f"Streaming check: {label}: aborted, retrying")
+                        break
+                    checker = None
+            else:
+                try:
+                    if checker is not None:
+                        checker.finish()
+                except OffFormatOutput as e:
+                    print(f"Streaming check: {label}: {e}")
+                return "".join(parts)
+        finally:
+            response.close()
+
+    raise AssertionError("unreachable")
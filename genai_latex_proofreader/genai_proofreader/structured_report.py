@@ -0,0 +1,249 @@
+r"""
+Structured proofreading reports: instead of writing LaTeX, a reviewer returns a list
+of issues (with location, category, original text and suggestion) using a tool. The
+report is then rendered to LaTeX locally:
+
+ - Text is escaped, so that it compiles.
+ - Only math fragments (between $-signs) are included as is. Reports without math
+   do not need to be validated by the LaTeX guard.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional, Sequence
+
+from .formatting import format_report, make_review_comment_header
+
+
+class RenderedLatex(str):
+    """
+    LaTeX rendered locally from escaped text (ie. that does not need to be validated
+    by compiling it).
+    """
+
+
+# Tool (for the GenAI API) that reviewers use to report issues
+REPORT_ISSUES_TOOL: dict[str, Any] = {
+    "name": "report_issues",
+    "description": "Report the issues found when proofreading a paper.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "issues": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "location": {
+                            "type": "string",
+                            "description": (
+                                "Where the issue is, eg. 'Section 2, first "
+                                "paragraph' or 'Equation (3)'."
+                            ),
+                        },
+                        "category": {
+                            "type": "string",
+                            "description": "Kind of issue, eg. 'typo' or 'clarity'.",
+                        },
+                        "original": {
+                            "type": "string",
+                            "description": "The original text with the issue.",
+                        },
+                        "suggestion": {
+                            "type": "string",
+                            "description": "How the issue can be resolved.",
+                        },
+                    },
+                    "required": ["location", "category", "suggestion"],
+                },
+            },
+            "summary": {
+                "type": "string",
+                "description": "Short summary of the findings.",
+            },
+        },
+        "required": ["issues", "summary"],
+    },
+}
+
+# Replaces the format instructions in prompts when structured output is requested
+STRUCTURED_OUTPUT_PROMPT: str = r"""
+Report format (this replaces any instructions above on how to format the report):
+- Report your findings using the report_issues tool (one entry per issue), not as
+  LaTeX.
+- Write plain text. Only write mathematics as LaTeX, surrounded by dollar signs (eg.
+  $\kappa_p$). Do not use any other LaTeX commands (eg. \ref or \emph).
+"""
+
+
+@dataclass(frozen=True)
+class Issue:
+    location: str
+    category: str
+    original: Optional[str]
+    suggestion: str
+
+
+def parse_issues(tool_input: Mapping[str, Any]) -> tuple[list[Issue], str]:
+    """
+    Parse the input to the report_issues tool into issues and a summary.
+    """
+    issues = [
+        Issue(
+            location=str(issue.get("location", "")).strip(),
+            category=str(issue.get("category", "")).strip(),
+            original=(
+                str(issue["original"]).strip()
+                if issue.get("original") not in [None, ""]
+                else None
+            ),
+            suggestion=str(issue.get("suggestion", "")).strip(),
+        )
+        for issue in tool_input.get("issues", [])
+        if isinstance(issue, Mapping)
+    ]
+    return issues, str(tool_input.get("summary", "")).strip()
+
+
+def merge_issues(issue_lists: Sequence[list[Issue]]) -> list[Issue]:
+    """
+    Merge lists of issues (eg. for parts of a section). Duplicate issues are only
+    included once.
+    """
+    result: list[Issue] = []
+    seen: set[tuple[str, ...]] = set()
+    for issues in issue_lists:
+        for issue in issues:
+            key = tuple(
+                " ".join((text or "").split()).lower()
+                for text in [
+                    issue.location,
+                    issue.category,
+                    issue.original,
+                    issue.suggestion,
+                ]
+            )
+            if key not in seen:
+                seen.add(key)
+                result.append(issue)
+    return result
+
+
+_LATEX_SPECIAL_CHARACTERS: dict[str, str] = {
+    "\\": r"\textbackslash{}",
+    "{": r"\{",
+    "}": r"\}",
+    "$": r"\$",
+    "&": r"\&",
+    "%": r"\%",
+    "#": r"\#",
+    "_": r"\_",
+    "^": r"\textasciicircum{}",
+    "~": r"\textasciitilde{}",
+    # shown as other characters in the default (OT1) font encoding
+    "<": r"\textless{}",
+    ">": r"\textgreater{}",
+    "|": r"\textbar{}",
+}
+
+# math fragments, eg. "$x^2$" (not "$$")
+_MATH_PATTERN = re.compile(r"\$([^$]+)\$")
+
+
+def escape_latex(text: str) -> str:
+    """
+    Escape text so that it is shown as is in LaTeX.
+    """
+    return "".join(_LATEX_SPECIAL_CHARACTERS.get(char, char) for char in text)
+
+
+def render_text(text: str) -> tuple[str, list[str]]:
+    """
+    Render text where math fragments (between $-signs) are kept as is, and all other
+    text is escaped. Returns the LaTeX and the math fragments.
+    """
+    parts: list[str] = []
+    math: list[str] = []
+    position: int = 0
+    for match in _MATH_PATTERN.finditer(text):
+        parts.append(escape_latex(text[position : match.start()]))
+        parts.append(match.group(0))
+        math.append(match.group(0))
+        position = match.end()
+    parts.append(escape_latex(text[position:]))
+    return "".join(parts), math
+
+
+def render_issues(issues: Sequence[Issue], summary: str) -> tuple[str, list[str]]:
+    """
+    Render issues and summary as a LaTeX report (an enumerated list of issues
+    followed by the summary). Returns the report and the math fragments in it.
+    """
+    lines: list[str] = []
+    math: list[str] = []
+
+    def _render(text: str) -> str:
+        latex, fragments = render_text(text)
+        math.extend(fragments)
+        return latex
+
+    if len(issues) > 0:
+        lines.append(r"\begin{enumerate}")
+        for issue in issues:
+            item = rf"\item \textbf{{{_render(issue.location)}}}"
+            if issue.category != "":
+                item += rf" ({_render(issue.category)})"
+            if issue.original is not None:
+                item += rf": ``{_render(issue.original)}''"
+            item += rf" --- {_render(issue.suggestion)}"
+            lines.append(item)
+        lines.append(r"\end{enumerate}")
+
+    if summary != "":
+        lines.append(_render(summary))
+
+    return "\n".join(lines), math
+
+
+def trusted_if_without_math(latex: str, math: list[str]) -> str:
+    """
+    Mark a (formatted) report as rendered locally if it contains no math fragments
+    (so that the LaTeX guard does not need to compile it). Reports with non-ASCII
+    characters (eg. arrows, CJK) are not marked, since pdflatex may not support them.
+    """
+    return RenderedLatex(latex) if len(math) == 0 and latex.isascii() else latex
+
+
+def format_rendered_report(
+    report: str,
+    math: list[str],
+    role: str,
+    task: str,
+    content_provided_for_review: str,
+) -> str:
+    """
+    Format a report rendered by render_issues (see format_report). A report that can
+    be trusted (see trusted_if_without_math) is formatted with an escaped header and
+    label, since they contain text of the paper (eg. LaTeX commands in a section
+    title) that is not validated either.
+    """
+    if len(math) > 0:
+        return format_report(
+            report=report,
+            review_comment_header=make_review_comment_header(
+                role, task, content_provided_for_review
+            ),
+            label=f"{role}: {task}",
+        )
+    return trusted_if_without_math(
+        format_report(
+            report=report,
+            review_comment_header=make_review_comment_header(
+                escape_latex(role),
+                escape_latex(task),
+                escape_latex(content_provided_for_review),
+            ),
+            label=escape_latex(f"{role}: {task}"),
+        ),
+        math,
+    )
@@ -1,15 +1,20 @@
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Iterable, Mapping, Optional, Sequence
 
 from ..utils.io import write_directory
+from .includes import FileGraph
+from .section_text import SectionText, section_text
+from .tokenizer import EnvironmentSpan, LatexToken, SourceSpan
 
 # --- Data model for a parsed LaTeX document ---
 
 # --- Data models to reference content in LaTeX document ---
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ContentReferenceBase:
     """
     Data model to reference a content part in a LaTeX document
@@ -20,6 +25,7 @@ class ContentReferenceBase:
     in_appendix: bool
 
 
+@dataclass(frozen=True, slots=True)
 class PreSectionRef(ContentReferenceBase):
     r"""
     Reference content before a \section{...}.
@@ -31,7 +37,7 @@ class PreSectionRef(ContentReferenceBase):
     pass
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class SectionRef(ContentReferenceBase):
     r"""
     Reference content (in main doc, or appendix) before the first \section{...}
@@ -57,15 +63,49 @@ class SectionRef(ContentReferenceBase):
     # in the input Latex document.
     generated_label: str
 
+    # Optional short title, eg. "Intro" for "\section[Intro]{Introduction}"
+    short_title: Optional[str] = None
+
 
 @dataclass(frozen=True)
+class SourceIndex:
+    """
+    Positions of the parts of a parsed LaTeX document in its source.
+    """
+
+    # Span of each part in LatexDocument.content_dict. For a SectionRef the span
+    # starts at its \section{...} command, and ends where the next part begins.
+    sections: dict[ContentReferenceBase, SourceSpan]
+
+    # First \label{...} command for each label in the source
+    labels: dict[str, LatexToken]
+
+    environments: list[EnvironmentSpan]
+
+    comments: list[SourceSpan]
+
+    # Source file of each part in LatexDocument.content_dict (only set when
+    # included files were expanded). Spans above are offsets into the expanded source.
+    section_files: dict[ContentReferenceBase, Path] = field(default_factory=dict)
+
+    # Included files (only set when the document was parsed from files)
+    file_graph: Optional[FileGraph] = None
+
+
+@dataclass(frozen=True, slots=True)
 class LatexDocument:
+    """
+    Each part of the document is a list of lines. The lines of each part are stored
+    as one SectionText (that can be used as a read-only list of lines); lists given
+    when creating a document are converted.
+    """
+
     # --- start of document ---
-    pre_matter: list[str]
+    pre_matter: Sequence[str]
 
     # --- \begin{document} ---
 
-    begin_document: list[str]
+    begin_document: Sequence[str]
 
     # Note:
     #   \begin{abstract} ... \end{abstract} is in "begin_document"
@@ -74,18 +114,57 @@ class LatexDocument:
 
     # all sections, including sections in appendix
     # dict key order determine section order (with optional Appendix sections last)
-    content_dict: dict[ContentReferenceBase, list[str]]
+    content_dict: Mapping[ContentReferenceBase, Sequence[str]]
 
-    bibliography: list[str]
+    bibliography: Sequence[str]
 
     # --- \end{document} ---
 
     # images, bibliography files, etc.
     supporting_files: dict[Path, bytes] = field(default_factory=dict)
 
+    # Positions of sections, labels, environments and comments in the parsed source
+    # (None if document was not created by the parser)
+    source_index: Optional[SourceIndex] = field(default=None, compare=False, repr=False)
+
+    # Cached output of to_latex (documents are not modified after they are created)
+    _latex: Optional[str] = field(default=None, init=False, compare=False, repr=False)
+
+    def __post_init__(self):
+        for name in ["pre_matter", "begin_document", "bibliography"]:
+            object.__setattr__(self, name, section_text(getattr(self, name)))
+        object.__setattr__(
+            self,
+            "content_dict",
+            {
+                section_ref: section_text(content)
+                for section_ref, content in self.content_dict.items()
+            },
+        )
+
+    def section_text(self, section_ref: ContentReferenceBase) -> SectionText:
+        """
+        Content of a part (with cached content hash, and line and byte counts)
+        """
+        return section_text(self.content_dict[section_ref])
+
+    @property
+    def nr_lines(self) -> int:
+        return sum(len(part) for part in self._parts())
+
+    @property
+    def nr_bytes(self) -> int:
+        return sum(section_text(part).nr_bytes for part in self._parts())
+
+    def _parts(self) -> Iterable[Sequence[str]]:
+        yield self.pre_matter
+        yield self.begin_document
+        yield from self.content_dict.values()
+        yield self.bibliography
+
     def filter_content_dict(
         self, is_appendix: bool
-    ) -> dict[ContentReferenceBase, list[str]]:
+    ) -> dict[ContentReferenceBase, Sequence[str]]:
         return {
             section_ref: content
             for section_ref, content in self.content_dict.items()
@@ -93,52 +172,129 @@ class LatexDocument:
         }
 
 
+def _section_header(section_ref: ContentReferenceBase) -> list[str]:
+    if isinstance(section_ref, SectionRef):
+        return [
+            (
+                rf"\section{{{section_ref.title}}}"
+                if section_ref.short_title is None
+                else rf"\section[{section_ref.short_title}]{{{section_ref.title}}}"
+            ),
+            # A latex section can have multiple labels. If no label is
+            # assigned in the source document, we here ensure that this
+            # section has a label (eg. that can be used to reference the
+            # section from review comments).
+            rf"\label{{{section_ref.generated_label}}}",
+        ]
+
+    elif isinstance(section_ref, PreSectionRef):
+        return []
+
+    raise ValueError(f"Invalid part type: {section_ref}")
+
+
 def render_content_dict(
-    content_dict: dict[ContentReferenceBase, list[str]]
+    content_dict: Mapping[ContentReferenceBase, Sequence[str]]
 ) -> Iterable[str]:
 
     # input does not cross border between appendix and main document
     assert len(set(k.in_appendix for k in content_dict.keys())) == 1
 
     for section_ref, content in content_dict.items():
-        if isinstance(section_ref, PreSectionRef):
-            yield from content
+        yield from _section_header(section_ref)
+        yield from content
 
-        elif isinstance(section_ref, SectionRef):
-            yield rf"\section{{{section_ref.title}}}"
-            # A latex section can have multiple labels. If no label is
-            # assigned in the source document, we here ensure that this
-            # section has a label (eg. that can be used to reference the
-            # section from review comments).
-            yield rf"\label{{{section_ref.generated_label}}}"
-            yield from content
+
+def _text(lines: Sequence[str]) -> Optional[str]:
+    # lines joined with newlines (None if there are no lines)
+    return section_text(lines).text if len(lines) > 0 else None
+
+
+class _RenderedPartCache:
+    """
+    Cache rendered content parts by section reference and content. Documents derived
+    from another document (eg. with comments added using a CommentOverlay) share the
+    content of unchanged parts, so only changed parts are rendered again.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        # (section_ref, content) -> rendered part (or None if empty)
+        self._cache: OrderedDict[
+            tuple[ContentReferenceBase, SectionText], Optional[str]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(
+        self, section_ref: ContentReferenceBase, content: Sequence[str]
+    ) -> Optional[str]:
+        key = (section_ref, section_text(content))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        parts: list[str] = _section_header(section_ref)
+        if len(content) > 0:
+            parts.append(key[1].text)
+        rendered: Optional[str] = "\n".join(parts) if len(parts) > 0 else None
+
+        with self._lock:
+            self._cache[key] = rendered
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return rendered
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_RENDERED_PARTS = _RenderedPartCache()
+
+
+def clear_render_cache():
+    _RENDERED_PARTS.clear()
 
 
 def to_latex(obj: LatexDocument) -> str:
     """
     Convert a parsed LaTeX document back into a LaTeX document string.
-    """
 
-    def _to_latex(obj: LatexDocument):
+    The result is cached on the document, and rendered sections are cached so that
+    documents that share content with an already rendered document only render
+    their changed sections.
+    """
+    if obj._latex is not None:
+        return obj._latex
+
+    main_parts: list[Optional[str]] = []
+    appendix_parts: list[Optional[str]] = []
+    for section_ref, content in obj.content_dict.items():
+        (appendix_parts if section_ref.in_appendix else main_parts).append(
+            _RENDERED_PARTS.render(section_ref, content)
+        )
 
-        yield from obj.pre_matter
+    def _to_latex():
+        yield _text(obj.pre_matter)
         yield r"\begin{document}"
-        yield from obj.begin_document
+        yield _text(obj.begin_document)
         yield r"\maketitle"
 
-        yield from render_content_dict(obj.filter_content_dict(is_appendix=False))
+        yield from main_parts
 
         # optional appendix
-        appendix_content_dict = obj.filter_content_dict(is_appendix=True)
-        if len(appendix_content_dict) > 0:
+        if len(appendix_parts) > 0:
             yield r"\appendix"
-            yield from render_content_dict(appendix_content_dict)
+            yield from appendix_parts
 
         # bibliography end matters
-        yield from obj.bibliography
+        yield _text(obj.bibliography)
         yield r"\end{document}"
 
-    return "\n".join(_to_latex(obj))
+    result = "\n".join(part for part in _to_latex() if part is not None)
+    object.__setattr__(obj, "_latex", result)
+    return result
 
 
 def write_latex(doc: LatexDocument, output_filepath: Path):
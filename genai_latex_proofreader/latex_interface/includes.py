@@ -0,0 +1,217 @@
+r"""
+Expand \input{..}, \include{..} and \subfile{..} commands in a LaTeX document using
+the files provided with the document.
+
+Each file is tokenized separately, and the tokenized files are cached by content
+hash. When a document is parsed again after an edit, only the changed files are
+tokenized again; the expanded document is assembled from the cached tokens.
+
+Notes:
+ - Paths are resolved relative to the directory of the main file (as LaTeX does).
+ - \include{..} is expanded as \input{..} (ie. without the page breaks added by
+   \include).
+ - For \subfile{..}, only the content between \begin{document} and \end{document}
+   in the subfile is included.
+ - Commands referring to files that are not provided are left as is.
+"""
+
+import bisect
+import hashlib
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from .tokenizer import LatexToken, TokenizedLatex, TokenKind, concatenate, tokenize
+
+INCLUDE_COMMANDS: list[str] = ["input", "include", "subfile"]
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+@dataclass(frozen=True)
+class FileGraph:
+    """
+    Dependency graph of the LaTeX source files in a document.
+    """
+
+    main_file: Path
+
+    # sha256 hash of each LaTeX source file in the graph
+    content_hashes: dict[Path, str]
+
+    # files included by each file (in the order they are included)
+    includes: dict[Path, tuple[Path, ...]]
+
+    def changed_files(self, previous: "FileGraph") -> set[Path]:
+        """
+        Return files that are new or modified compared to a previous graph.
+        """
+        return {
+            path
+            for path, file_hash in self.content_hashes.items()
+            if previous.content_hashes.get(path) != file_hash
+        }
+
+
+class TokenizedFileCache:
+    """
+    Cache of tokenized LaTeX source files, keyed by content hash.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._cache: OrderedDict[str, TokenizedLatex] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def tokenize(self, content: bytes) -> tuple[str, TokenizedLatex]:
+        """
+        Return content hash and tokenized content.
+        """
+        key = content_hash(content)
+        if (tokenized := self._cache.get(key)) is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return key, tokenized
+
+        self.misses += 1
+        tokenized = tokenize(content.decode("utf-8"))
+        self._cache[key] = tokenized
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return key, tokenized
+
+
+# Default cache used when parsing documents from files
+TOKENIZED_FILE_CACHE = TokenizedFileCache()
+
+
+@dataclass(frozen=True)
+class ExpandedSource:
+    """
+    A LaTeX document with all included files expanded.
+    """
+
+    tokenized: TokenizedLatex
+    file_graph: FileGraph
+
+    # Offsets (into the expanded text) where content from a file starts, and the
+    # corresponding file. Sorted by offset.
+    _segment_starts: list[int]
+    _segment_files: list[Path]
+
+    def file_at(self, offset: int) -> Path:
+        """
+        Return the source file of the content at an offset in the expanded text.
+        """
+        idx = bisect.bisect_right(self._segment_starts, offset) - 1
+        return self._segment_files[max(idx, 0)]
+
+
+def _resolve(main_file: Path, arg: str, files: dict[Path, bytes]) -> Optional[Path]:
+    arg = arg.strip()
+    for candidate in [arg, f"{arg}.tex"]:
+        path = Path(os.path.normpath(main_file.parent / candidate))
+        if path in files:
+            return path
+    return None
+
+
+def _document_body(tokenized: TokenizedLatex) -> tuple[int, int]:
+    r"""
+    Offsets of content between \begin{document} and \end{document} (eg. in a subfile).
+    If there is no document environment, return offsets of all content.
+    """
+    begin: Optional[LatexToken] = None
+    for token in tokenized.tokens:
+        if token.name == "document":
+            if token.kind == TokenKind.BEGIN and begin is None:
+                begin = token
+            elif token.kind == TokenKind.END and begin is not None:
+                return begin.span.end, token.span.start
+
+    return 0, len(tokenized.text)
+
+
+def expand_includes(
+    files: dict[Path, bytes],
+    main_file: Path,
+    cache: TokenizedFileCache = TOKENIZED_FILE_CACHE,
+) -> ExpandedSource:
+    r"""
+    Recursively expand \input{..}, \include{..} and \subfile{..} commands in the main
+    file with the content of the provided files.
+    """
+    content_hashes: dict[Path, str] = {}
+    includes: dict[Path, tuple[Path, ...]] = {}
+
+    # parts of tokenized files to concatenate: (tokenized file, start, end), and
+    # the file of each part
+    parts: list[tuple[TokenizedLatex, int, int]] = []
+    part_files: list[Path] = []
+
+    def _expand(
+        path: Path, start: Optional[int], end: Optional[int], stack: list[Path]
+    ):
+        if path in stack:
+            raise Exception(
+                "Cyclic inclusion of files: "
+                + " -> ".join(str(p) for p in [*stack, path])
+            )
+
+        content_hashes[path], tokenized = cache.tokenize(files[path])
+        start = 0 if start is None else start
+        end = len(tokenized.text) if end is None else end
+
+        included: list[Path] = []
+        pos: int = start
+        for token in tokenized.tokens:
+            if not (
+                start <= token.span.start < end
+                and token.kind == TokenKind.COMMAND
+                and token.name in INCLUDE_COMMANDS
+                and len(token.args) == 1
+            ):
+                continue
+
+            if (included_path := _resolve(main_file, token.args[0], files)) is None:
+                print(f" - Note: {token.name}{{{token.args[0]}}}: file not found")
+                continue
+
+            parts.append((tokenized, pos, token.span.start))
+            part_files.append(path)
+
+            if token.name == "subfile":
+                _, included_tokenized = cache.tokenize(files[included_path])
+                body_start, body_end = _document_body(included_tokenized)
+                _expand(included_path, body_start, body_end, [*stack, path])
+            else:
+                _expand(included_path, None, None, [*stack, path])
+
+            included.append(included_path)
+            pos = token.span.end
+
+        parts.append((tokenized, pos, end))
+        part_files.append(path)
+        includes[path] = tuple(included)
+
+    _expand(main_file, None, None, [])
+
+    segment_starts: list[int] = []
+    offset: int = 0
+    for _, start, end in parts:
+        segment_starts.append(offset)
+        offset += end - start
+
+    return ExpandedSource(
+        tokenized=concatenate(parts),
+        file_graph=FileGraph(
+            main_file=main_file, content_hashes=content_hashes, includes=includes
+        ),
+        _segment_starts=segment_starts,
+        _segment_files=part_files,
+    )
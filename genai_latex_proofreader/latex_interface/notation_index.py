@@ -0,0 +1,402 @@
+r"""
+Local (ie. without GenAI queries) index of the notation, definitions and labels in
+a parsed LaTeX document:
+
+ - Macros defined in the pre-matter with \newcommand, \renewcommand,
+   \providecommand, \def or \DeclareMathOperator.
+ - Labels, with the environment (eg. equation, theorem) and section they are in.
+ - Theorem-like environments (eg. definitions, theorems, lemmas).
+ - Terms at their first use, ie. the first \emph{..} of each term (authors usually
+   emphasize a term where it is defined).
+
+The index can be rendered as compact context for GenAI prompts (see `to_prompt`).
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Iterable, Optional, Sequence
+
+from .data_model import (
+    ContentReferenceBase,
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+)
+from .section_text import section_text
+from .tokenizer import TokenizedLatex, TokenKind, tokenize
+
+# Theorem-like environments that are indexed (in addition to environments declared
+# with \newtheorem in the pre-matter)
+THEOREM_ENVIRONMENTS: list[str] = [
+    "definition",
+    "theorem",
+    "lemma",
+    "proposition",
+    "corollary",
+    "conjecture",
+    "assumption",
+    "remark",
+    "example",
+]
+
+# Commands that reference labels
+REF_COMMANDS: list[str] = ["ref", "eqref", "pageref", "autoref", "cref", "Cref"]
+
+# Maximum number of characters in excerpts included in the index
+MAX_EXCERPT_CHARS: int = 300
+
+
+@dataclass(frozen=True)
+class MacroDefinition:
+    # name of the macro, eg. "\R"
+    name: str
+    nr_args: int
+    definition: str
+
+
+@dataclass(frozen=True)
+class LabelEntry:
+    label: str
+
+    # innermost environment (other than the document) containing the label, eg.
+    # "equation", or None for a label directly in a section
+    environment: Optional[str]
+
+    # part of the document with the label (None if in pre-matter, abstract, etc.)
+    section_ref: Optional[ContentReferenceBase]
+
+    # content of the environment (or of the line) with the label
+    excerpt: str
+
+
+@dataclass(frozen=True)
+class StatementEntry:
+    # environment, eg. "definition"
+    kind: str
+
+    # optional title, eg. "Main theorem" for \begin{theorem}[Main theorem]
+    title: Optional[str]
+    label: Optional[str]
+    section_ref: Optional[ContentReferenceBase]
+    excerpt: str
+
+
+@dataclass(frozen=True)
+class TermEntry:
+    term: str
+    section_ref: Optional[ContentReferenceBase]
+    excerpt: str
+
+
+@dataclass(frozen=True)
+class NotationIndex:
+    macros: list[MacroDefinition]
+    labels: dict[str, LabelEntry]
+    statements: list[StatementEntry]
+    terms: list[TermEntry]
+
+
+# --- Macros ---
+
+
+def _braced(text: str, pos: int) -> Optional[tuple[str, int]]:
+    """
+    Read "{...}" (with nested braces) at 'pos'. Returns content and end offset.
+    """
+    if pos >= len(text) or text[pos] != "{":
+        return None
+    depth, idx = 0, pos
+    while idx < len(text):
+        if text[idx] == "\\":
+            idx += 2
+            continue
+        if text[idx] == "{":
+            depth += 1
+        elif text[idx] == "}":
+            depth -= 1
+            if depth == 0:
+                return text[pos + 1 : idx], idx + 1
+        idx += 1
+    return None
+
+
+_MACRO_PATTERNS: list[re.Pattern] = [
+    # \newcommand{\name}[nr_args][default]{definition} (braces around name optional)
+    re.compile(
+        r"\\(?:re|provide)?newcommand\*?\s*\{?\s*(\\[a-zA-Z@]+)\s*\}?\s*"
+        r"(?:\[(\d)\])?\s*(?:\[[^\]]*\])?\s*(?=\{)"
+    ),
+    # \def\name#1#2{definition}
+    re.compile(r"\\def\s*(\\[a-zA-Z@]+)((?:#\d)*)\s*(?=\{)"),
+    # \DeclareMathOperator{\name}{definition}
+    re.compile(r"\\DeclareMathOperator\*?\s*\{\s*(\\[a-zA-Z@]+)\s*\}\s*()(?=\{)"),
+]
+
+_NEWTHEOREM_PATTERN = re.compile(r"\\newtheorem\*?\s*\{([a-zA-Z*]+)\}")
+
+
+def _macros(text: str) -> list[MacroDefinition]:
+    macros: list[tuple[int, MacroDefinition]] = []
+    for pattern in _MACRO_PATTERNS:
+        for match in pattern.finditer(text):
+            if (definition := _braced(text, match.end())) is None:
+                continue
+            nr_args: str = match.group(2) or ""
+            macros.append(
+                (
+                    match.start(),
+                    MacroDefinition(
+                        name=match.group(1),
+                        nr_args=(
+                            nr_args.count("#") if "#" in nr_args else int(nr_args or 0)
+                        ),
+                        definition=definition[0].strip(),
+                    ),
+                )
+            )
+    return [macro for _, macro in sorted(macros, key=lambda x: x[0])]
+
+
+# --- Labels, statements and terms ---
+
+
+def _excerpt(text: str) -> str:
+    text = " ".join(text.split())
+    if len(text) > MAX_EXCERPT_CHARS:
+        return text[: MAX_EXCERPT_CHARS - 4] + " ..."
+    return text
+
+
+def _optional_argument(text: str, pos: int) -> Optional[str]:
+    # "[...]" at 'pos' (eg. title of a theorem)
+    if pos < len(text) and text[pos] == "[" and (end := text.find("]", pos)) != -1:
+        return text[pos + 1 : end].strip()
+    return None
+
+
+_EMPH_PATTERN = re.compile(r"\\emph\{([^{}]+)\}")
+
+
+def _index_part(
+    tokenized: TokenizedLatex,
+    section_ref: Optional[ContentReferenceBase],
+    theorem_environments: set[str],
+    labels: dict[str, LabelEntry],
+    statements: list[StatementEntry],
+    terms: dict[str, TermEntry],
+):
+    text = tokenized.text
+
+    for env in tokenized.environments:
+        if env.name not in theorem_environments:
+            continue
+        body_start = text.find("}", env.span.start) + 1
+        env_labels = [
+            token.args[0]
+            for token in tokenized.tokens
+            if env.span.start <= token.span.start < env.span.end
+            and token.kind == TokenKind.COMMAND
+            and token.name == "label"
+            and len(token.args) == 1
+        ]
+        statements.append(
+            StatementEntry(
+                kind=env.name,
+                title=_optional_argument(text, body_start),
+                label=env_labels[0] if len(env_labels) > 0 else None,
+                section_ref=section_ref,
+                excerpt=_excerpt(text[env.span.start : env.span.end]),
+            )
+        )
+
+    for token in tokenized.tokens:
+        if not (
+            token.kind == TokenKind.COMMAND
+            and token.name == "label"
+            and len(token.args) == 1
+        ):
+            continue
+        environments = [env for env in token.environments if env != "document"]
+        if len(environments) > 0:
+            # innermost environment containing the label
+            env_span = [
+                env.span
+                for env in tokenized.environments
+                if env.name == environments[-1]
+                and env.span.start <= token.span.start < env.span.end
+            ][-1]
+            excerpt = text[env_span.start : env_span.end]
+        else:
+            lines = tokenized.lines
+            excerpt = text[
+                lines.line_starts[token.span.start_line] : lines.line_end(
+                    token.span.end_line
+                )
+            ]
+        labels.setdefault(
+            token.args[0],
+            LabelEntry(
+                label=token.args[0],
+                environment=environments[-1] if len(environments) > 0 else None,
+                section_ref=section_ref,
+                excerpt=_excerpt(excerpt),
+            ),
+        )
+
+    for match in _EMPH_PATTERN.finditer(text):
+        term = " ".join(match.group(1).split())
+        if term.lower() in terms:
+            continue
+        line = tokenized.lines.line_of(match.start())
+        terms[term.lower()] = TermEntry(
+            term=term,
+            section_ref=section_ref,
+            excerpt=_excerpt(
+                text[tokenized.lines.line_starts[line] : tokenized.lines.line_end(line)]
+            ),
+        )
+
+
+def _parts(
+    doc: LatexDocument,
+) -> Iterable[tuple[Optional[ContentReferenceBase], Sequence[str]]]:
+    yield None, doc.begin_document
+    yield from doc.content_dict.items()
+
+
+def build_notation_index(doc: LatexDocument) -> NotationIndex:
+    """
+    Build notation index for a document.
+    """
+    pre_matter: str = section_text(doc.pre_matter).text
+    theorem_environments: set[str] = {
+        *THEOREM_ENVIRONMENTS,
+        *_NEWTHEOREM_PATTERN.findall(pre_matter),
+    }
+
+    labels: dict[str, LabelEntry] = {}
+    statements: list[StatementEntry] = []
+    terms: dict[str, TermEntry] = {}
+
+    for section_ref, lines in _parts(doc):
+        if isinstance(section_ref, SectionRef):
+            # labels generated for sections (see data_model.to_latex)
+            for label in [section_ref.label, section_ref.generated_label]:
+                if label is not None:
+                    labels.setdefault(
+                        label,
+                        LabelEntry(
+                            label=label,
+                            environment=None,
+                            section_ref=section_ref,
+                            excerpt=rf"\section{{{section_ref.title}}}",
+                        ),
+                    )
+
+        _index_part(
+            tokenize(section_text(lines).text),
+            section_ref,
+            theorem_environments,
+            labels,
+            statements,
+            terms,
+        )
+
+    return NotationIndex(
+        macros=_macros(pre_matter),
+        labels=labels,
+        statements=statements,
+        terms=list(terms.values()),
+    )
+
+
+# --- Use of index ---
+
+
+def _section_name(section_ref: Optional[ContentReferenceBase]) -> str:
+    if isinstance(section_ref, SectionRef):
+        return f"section '{section_ref.title}'"
+    elif isinstance(section_ref, PreSectionRef):
+        return "before first section"
+    return "abstract"
+
+
+def to_prompt(index: NotationIndex) -> str:
+    """
+    Render index as compact text that can be included in prompts.
+    """
+
+    def _lines() -> Iterable[str]:
+        if len(index.macros) > 0:
+            yield "Macros defined in the preamble:"
+            for macro in index.macros:
+                args = f" (with {macro.nr_args} arguments)" if macro.nr_args else ""
+                yield f" - {macro.name}{args}: {macro.definition}"
+
+        if len(index.statements) > 0:
+            yield "Definitions, theorems and similar statements:"
+            for statement in index.statements:
+                title = f" ({statement.title})" if statement.title else ""
+                label = f" [label: {statement.label}]" if statement.label else ""
+                yield (
+                    f" - {statement.kind}{title}{label} in "
+                    f"{_section_name(statement.section_ref)}: {statement.excerpt}"
+                )
+
+        other_labels = [
+            entry for entry in index.labels.values() if entry.environment is not None
+        ]
+        if len(other_labels) > 0:
+            yield "Other labels:"
+            for entry in other_labels:
+                yield (
+                    f" - {entry.label} ({entry.environment} in "
+                    f"{_section_name(entry.section_ref)}): {entry.excerpt}"
+                )
+
+        section_labels = [
+            entry for entry in index.labels.values() if entry.environment is None
+        ]
+        if len(section_labels) > 0:
+            yield "Section labels:"
+            for entry in section_labels:
+                yield f" - {entry.label}: {_section_name(entry.section_ref)}"
+
+        if len(index.terms) > 0:
+            yield "Terms (where first emphasized):"
+            for term in index.terms:
+                yield f" - {term.term} ({_section_name(term.section_ref)})"
+
+    return "\n".join(_lines())
+
+
+_REF_PATTERN = re.compile(
+    r"\\(" + "|".join(REF_COMMANDS) + r")\*?\s*\{([^{}]*)\}",
+)
+
+
+def unknown_references(index: NotationIndex, latex: str) -> list[str]:
+    r"""
+    Return labels referenced (eg. with \ref{..}) in 'latex' that are not in the index.
+    """
+    result: list[str] = []
+    for match in _REF_PATTERN.finditer(latex):
+        for label in match.group(2).split(","):
+            if label.strip() not in index.labels and label.strip() not in result:
+                result.append(label.strip())
+    return result
+
+
+def replace_unknown_references(index: NotationIndex, latex: str) -> str:
+    r"""
+    Replace references to labels that are not in the index (eg. \ref{sec:typo}) by
+    the label as text (shown in bold with a question mark).
+    """
+
+    def _replace(match: re.Match) -> str:
+        labels = [label.strip() for label in match.group(2).split(",")]
+        if all(label in index.labels for label in labels):
+            return match.group(0)
+        return rf"\textbf{{[?~\detokenize{{{match.group(2)}}}]}}"
+
+    return _REF_PATTERN.sub(_replace, latex)
@@ -1,77 +1,184 @@
-from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Callable, Iterable, Optional, Tuple
-
-from genai_latex_proofreader.utils.splitters import (
-    split_at_first_lambda,
-    split_list_at_lambda,
-    split_list_at_lambdas,
+from typing import Callable, Iterable, Optional
+
+from ..utils.tracing import traced
+from .data_model import (
+    ContentReferenceBase,
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+    SourceIndex,
 )
+from .includes import TOKENIZED_FILE_CACHE, ExpandedSource, TokenizedFileCache
+from .includes import expand_includes as _expand_includes
+from .tokenizer import LatexToken, SourceSpan, TokenizedLatex, TokenKind, tokenize
 
-from .data_model import ContentReferenceBase, LatexDocument, PreSectionRef, SectionRef
+# --- Bibliography parsing ---
 
+# Patterns to detect start of (optional) bibliography
+# (A line starting with any of these is considered the first line of the bibliography)
+BIBLIOGRAPHY_STARTS = [
+    r"\bibliography",
+    r"%\bibliography",
+    r"\begin{thebibliography}",
+    "% --- bibliography ---",
+]
 
-def _parse_arg_to_latex_command(latex_command: str, line: str) -> str:
-    r"""
-    Parse argument to a latex-commands.
 
-    Examples:
-    parse_latex_parameter(r"\subsection", r"\subsection{foo}") = "foo"
+class _ParsedSource:
+    """
+    Internal helper to look up the (cleaned) lines of a tokenized LaTeX document.
+
+    Lines are cleaned as follows:
+     - lines starting with a comment are removed (except comments that mark the
+       start of the bibliography, see BIBLIOGRAPHY_STARTS)
+     - comments at the end of lines are removed. Keeping these in the document may
+       mess up the proofreading comments if they are included in "change <this
+       excerpt> to <this>".
+     - whitespace at start and end of lines is removed.
+    """
 
-    Input line is assumed to be trimmed so that when there is a
-    match, there are no spaces before/after eg "\subsection{foo}".
+    def __init__(self, tokenized: TokenizedLatex):
+        self.tokenized = tokenized
+        self.text = tokenized.text
+        self.lines = tokenized.lines
+
+        # for each line with a comment: offset where the comment starts
+        self.comment_starts: dict[int, int] = {}
+        for token in tokenized.tokens:
+            if token.kind != TokenKind.COMMENT:
+                continue
+            line: int = token.span.start_line
+            if line in self.comment_starts:
+                continue
+            if self.is_at_line_start(token) and _is_bibliography_start(token):
+                continue
+            self.comment_starts[line] = token.span.start
+
+    def is_at_line_start(self, token: LatexToken) -> bool:
+        line_start = self.lines.line_starts[token.span.start_line]
+        return self.text[line_start : token.span.start].strip() == ""
+
+    def is_alone_on_line(self, token: LatexToken) -> bool:
+        """
+        Is token the only content on its line(s) (ignoring whitespace and comments)?
+        """
+        line_end = self.lines.line_end(token.span.end_line)
+        line_end = min(line_end, self.comment_starts.get(token.span.end_line, line_end))
+        return (
+            self.is_at_line_start(token)
+            and self.text[token.span.end : line_end].strip() == ""
+        )
 
-    Raises ValueError if line does not start with latex_command.
-    """
-    if line.startswith(latex_command):
-        result = line.replace(latex_command, "", 1)
-        assert result[0] == "{"
-        assert result[-1] == "}"
-        return result[1:-1]
+    def lines_between(self, start: int, end: int) -> list[str]:
+        """
+        Return the cleaned lines between offsets 'start' and 'end'.
+
+        Lines that are only partially in the range (ie. that are cut by a command at
+        'start' or 'end') are included only if they have content in the range.
+        """
+        result: list[str] = []
+        for line in range(self.lines.line_of(start), self.lines.line_of(end) + 1):
+            line_start = self.lines.line_starts[line]
+            line_end = self.lines.line_end(line)
+            segment_start, segment_end = max(start, line_start), min(end, line_end)
+            if segment_start > segment_end:
+                continue
+
+            comment_start: Optional[int] = self.comment_starts.get(line)
+            if comment_start == line_start:
+                # line is a comment
+                continue
+            elif comment_start is not None:
+                segment_end = max(segment_start, min(segment_end, comment_start))
+
+            segment: str = self.text[segment_start:segment_end].strip()
+            is_partial_line = (
+                segment_start > line_start or min(end, line_end) < line_end
+            )
+            if is_partial_line and segment == "":
+                continue
+
+            result.append(segment)
+
+        return result
 
-    raise ValueError(f"Expected '{line}' to start with '{latex_command}'.")
+    def span(self, start: int, end: int) -> SourceSpan:
+        return self.lines.span(start, end)
 
 
-@dataclass(frozen=True)
-class _DetectedLineMatch:
-    matched_line: str
+def _is_bibliography_start(token: LatexToken) -> bool:
+    if token.kind == TokenKind.COMMAND:
+        return token.name.startswith("bibliography")
+    elif token.kind == TokenKind.BEGIN:
+        return token.name == "thebibliography"
+    elif token.kind == TokenKind.COMMENT:
+        return any(
+            token.name.startswith(pattern)
+            for pattern in BIBLIOGRAPHY_STARTS
+            if pattern.startswith("%")
+        )
+    return False
+
 
+def _is_command(*names: str) -> Callable[[LatexToken], bool]:
+    return lambda token: token.kind == TokenKind.COMMAND and token.name in names
 
-def _create_line_prefix_detector(
-    *detect_prefix: str,
-) -> Callable[[str], _DetectedLineMatch | None]:
-    def f(line):
-        if any(line.startswith(prefix) for prefix in detect_prefix):
-            return _DetectedLineMatch(line)
-        return None
 
-    return f
+def _is_top_level(token: LatexToken) -> bool:
+    # token is not inside any environment (except the document environment)
+    return token.environments in [(), ("document",)]
 
 
-def _create_line_match_detector(
-    detect_prefix: str,
-) -> Callable[[str], _DetectedLineMatch | None]:
-    def f(line):
-        if line == detect_prefix:
-            return _DetectedLineMatch(line)
-        return None
+def _find_token(
+    tokens: list[LatexToken],
+    start_idx: int,
+    predicate: Callable[[LatexToken], bool],
+    end_offset: Optional[int] = None,
+) -> Optional[int]:
+    """
+    Return index of first token (at or after 'start_idx', and before 'end_offset')
+    for which 'predicate' is true.
+    """
+    for idx in range(start_idx, len(tokens)):
+        if end_offset is not None and tokens[idx].span.start >= end_offset:
+            break
+        if predicate(tokens[idx]):
+            return idx
 
-    return f
+    return None
 
 
 # --- Functions to parse Sections ---
 
 
-def _extract_label(lines: list[str]) -> Optional[str]:
+def _normalize_argument(arg: str) -> str:
+    # Argument spanning multiple lines: strip each line (as for other lines)
+    if "\n" in arg:
+        return "\n".join(line.strip() for line in arg.split("\n"))
+    return arg
+
+
+def _extract_label(
+    tokens: list[LatexToken], start_idx: int, end_offset: int
+) -> Optional[str]:
     r"""
     Find first label (eg \label{mylabel}) before any subsections, or subsubsections.
+    Labels inside environments (eg. equations) are skipped.
     If no label is found, return None
     """
-    for line in lines:
-        if line.startswith(r"\label"):
-            return _parse_arg_to_latex_command(r"\label", line)
-        elif line.startswith(r"\subsection") or line.startswith(r"\subsubsection"):
+    for token_idx in range(start_idx, len(tokens)):
+        token = tokens[token_idx]
+        if token.span.start >= end_offset:
             break
+        if token.kind != TokenKind.COMMAND:
+            continue
+        if token.name.startswith("subsection") or token.name.startswith(
+            "subsubsection"
+        ):
+            break
+        if token.name == "label" and len(token.args) == 1 and _is_top_level(token):
+            return token.args[0]
 
     return None
 
@@ -83,165 +190,194 @@ def _generated_label(section_idx: int, is_appendix: bool) -> str:
     return f"sec:genai:generated:label:{section_idx}"
 
 
-def _extract_sections(
-    lines: list[str], is_appendix: bool
-) -> dict[ContentReferenceBase, list[str]]:
-    """
-    Internal function to extract sections from a list of lines.
-    """
-    pre_sections, sections = split_list_at_lambda(
-        lines, _create_line_prefix_detector(r"\section")
+def _is_section(token: LatexToken) -> bool:
+    return (
+        token.kind == TokenKind.COMMAND
+        and token.name == "section"
+        and len(token.args) == 1
+        and _is_top_level(token)
     )
-    return {
-        PreSectionRef(in_appendix=is_appendix): pre_sections,
-        **{
-            SectionRef(
-                in_appendix=is_appendix,
-                title=_parse_arg_to_latex_command(
-                    r"\section", new_section_line.matched_line
-                ),
-                label=_extract_label(section_lines),
-                generated_label=_generated_label(
-                    section_idx=section_idx, is_appendix=is_appendix
-                ),
-            ): section_lines
-            for section_idx, (new_section_line, section_lines) in enumerate(sections)
-        },
-    }
 
 
-def _parse_content_to_sections(
-    lines: list[str],
-) -> Tuple[
-    dict[ContentReferenceBase, list[str]],
-    Optional[dict[ContentReferenceBase, list[str]]],
+def _extract_sections(
+    source: _ParsedSource,
+    start: int,
+    end: int,
+    is_appendix: bool,
+) -> tuple[
+    dict[ContentReferenceBase, list[str]], dict[ContentReferenceBase, SourceSpan]
 ]:
-    pre_appendix_lines, appendix_line, post_appendix_lines = split_at_first_lambda(
-        lines, _create_line_match_detector(r"\appendix")
-    )
-    # is there an \appendix in the document (potentially empty)?
-    if appendix_line is None:
-        # no
-        assert len(post_appendix_lines) == 0
-        assert lines == pre_appendix_lines
-        return _extract_sections(lines, is_appendix=False), None
-    else:
-        return (
-            _extract_sections(pre_appendix_lines, is_appendix=False),
-            _extract_sections(post_appendix_lines, is_appendix=True),
-        )
-
-
-# --- Bibliography parsing ---
-
-# Patterns to detect start of (optional) bibliography
-# (A line starting with any of these is considered the first line of the bibliography)
-BIBLIOGRAPHY_STARTS = [
-    r"\bibliography",
-    r"%\bibliography",
-    r"\begin{thebibliography}",
-    "% --- bibliography ---",
-]
-
-
-_bibliography_start_detector = _create_line_prefix_detector(*BIBLIOGRAPHY_STARTS)
-
+    """
+    Internal function to extract sections between offsets 'start' and 'end'.
 
-def _is_comment_line(line: str) -> bool:
-    return (
-        line.startswith("%")
-        # -
-        and _bibliography_start_detector(line) is None
-    )
+    Returns content and source spans for each part.
+    """
+    tokens = source.tokenized.tokens
+    section_idxs: list[int] = [
+        idx
+        for idx, token in enumerate(tokens)
+        if start <= token.span.start < end and _is_section(token)
+    ]
+    section_starts: list[int] = [tokens[idx].span.start for idx in section_idxs]
 
+    pre_section_ref = PreSectionRef(in_appendix=is_appendix)
+    pre_section_end: int = section_starts[0] if len(section_starts) > 0 else end
+    content_dict: dict[ContentReferenceBase, list[str]] = {
+        pre_section_ref: source.lines_between(start, pre_section_end)
+    }
+    spans: dict[ContentReferenceBase, SourceSpan] = {
+        pre_section_ref: source.span(start, pre_section_end)
+    }
 
-def _strip_comment(line: str) -> str:
-    """
-    Strip any comments at end of line
+    for section_idx, (token_idx, section_end) in enumerate(
+        zip(section_idxs, [*section_starts[1:], end])
+    ):
+        token = tokens[token_idx]
+        section_ref = SectionRef(
+            in_appendix=is_appendix,
+            title=_normalize_argument(token.args[0]),
+            label=_extract_label(tokens, token_idx + 1, section_end),
+            generated_label=_generated_label(
+                section_idx=section_idx, is_appendix=is_appendix
+            ),
+            short_title=(
+                _normalize_argument(token.optional_args[0])
+                if len(token.optional_args) > 0
+                else None
+            ),
+        )
+        content_dict[section_ref] = source.lines_between(token.span.end, section_end)
+        spans[section_ref] = source.span(token.span.start, section_end)
 
-    Keeping these in the document may mess up the proofreading comments if they are
-    included in "change <this excerpt> to <this>".
-    """
-    if "%" in line and line.index("%") > 0:
-        return line.split("%")[0]
-    return line
+    return content_dict, spans
 
 
-def parse_from_latex(
-    input_latex: str, supporting_files: dict[Path, bytes] = {}
+def _parse_tokenized(
+    tokenized: TokenizedLatex,
+    supporting_files: dict[Path, bytes],
+    expanded: Optional[ExpandedSource] = None,
 ) -> LatexDocument:
-    """
-    Main interface to parse an input LaTeX document into LatexDocument data model
-    """
+    source = _ParsedSource(tokenized)
+    tokens = tokenized.tokens
+
+    def _find_required(
+        start_idx: int, predicate: Callable[[LatexToken], bool], description: str
+    ) -> int:
+        idx = _find_token(tokens, start_idx, predicate)
+        if idx is None:
+            raise Exception(f"parse_latex: {description} not found.")
+        return idx
+
+    # Note: \begin{document}, \maketitle, \appendix and \end{document} are only
+    # recognized when they are alone on a line.
+    documentclass_idx = _find_required(
+        0, _is_command("documentclass"), r"\documentclass"
+    )
+    begin_document_idx = _find_required(
+        documentclass_idx + 1,
+        lambda t: t.kind == TokenKind.BEGIN
+        and t.name == "document"
+        and source.is_alone_on_line(t),
+        r"\begin{document}",
+    )
+    maketitle_idx = _find_required(
+        begin_document_idx + 1,
+        lambda t: _is_command("maketitle")(t) and source.is_alone_on_line(t),
+        r"\maketitle",
+    )
+    end_document_idx = _find_required(
+        maketitle_idx + 1,
+        lambda t: t.kind == TokenKind.END
+        and t.name == "document"
+        and source.is_alone_on_line(t),
+        r"\end{document}",
+    )
+    documentclass, begin_document, maketitle, end_document = (
+        tokens[documentclass_idx],
+        tokens[begin_document_idx],
+        tokens[maketitle_idx],
+        tokens[end_document_idx],
+    )
 
-    latex_document: list[str] = [
-        _strip_comment(line).strip()
-        for line in input_latex.split("\n")
-        if not _is_comment_line(line)
-    ]
-    print(f" - Read {len(latex_document)} lines (after removing comment lines)")
-
-    no_content, splits = split_list_at_lambdas(
-        latex_document,
-        [
-            _create_line_prefix_detector(r"\documentclass"),
-            _create_line_match_detector(r"\begin{document}"),
-            _create_line_match_detector(r"\maketitle"),
-            _bibliography_start_detector,
-            _create_line_match_detector(r"\end{document}"),
-        ],
+    bibliography_idx = _find_token(
+        tokens,
+        maketitle_idx + 1,
+        lambda t: _is_bibliography_start(t) and source.is_at_line_start(t),
+        end_offset=end_document.span.start,
+    )
+    content_end: int = (
+        end_document.span.start
+        if bibliography_idx is None
+        else tokens[bibliography_idx].span.start
     )
-    if len(no_content) > 0:
+
+    if len(source.lines_between(0, documentclass.span.start)) > 0:
         raise Exception(
             rf"parse_latex: \documentclass expected to be at start of of file."
         )
 
-    if len(splits) not in [4, 5]:
-        raise Exception(
-            f"parse_latex: expected 4 (no bibliography) or 5 (with bibliography) "
-            f"splits, but got {len(splits)}."
+    if len(source.lines_between(end_document.span.end, len(tokenized.text))) > 0:
+        raise Exception(r"Did not expect content after \end{document}. Please delete.")
+
+    # --- content (sections), with optional appendix ---
+    content_start: int = maketitle.span.end
+    appendix_idx = _find_token(
+        tokens,
+        maketitle_idx + 1,
+        lambda t: _is_command("appendix")(t) and source.is_alone_on_line(t),
+        end_offset=content_end,
+    )
+    if appendix_idx is None:
+        content_dict, section_spans = _extract_sections(
+            source, content_start, content_end, is_appendix=False
+        )
+    else:
+        appendix = tokens[appendix_idx]
+        main_content_dict, main_spans = _extract_sections(
+            source, content_start, appendix.span.start, is_appendix=False
+        )
+        appendix_content_dict, appendix_spans = _extract_sections(
+            source, appendix.span.end, content_end, is_appendix=True
         )
+        content_dict = {**main_content_dict, **appendix_content_dict}
+        section_spans = {**main_spans, **appendix_spans}
+
+    labels: dict[str, LatexToken] = {}
+    for token in tokens:
+        if _is_command("label")(token) and len(token.args) == 1:
+            labels.setdefault(token.args[0], token)
 
-    # create empty LatexDocument
     result = LatexDocument(
-        pre_matter=[],
-        begin_document=[],
-        content_dict={},
-        bibliography=[],
+        pre_matter=source.lines_between(
+            documentclass.span.start, begin_document.span.start
+        ),
+        begin_document=source.lines_between(
+            begin_document.span.end, maketitle.span.start
+        ),
+        content_dict=content_dict,
+        bibliography=(
+            []
+            if bibliography_idx is None
+            else source.lines_between(content_end, end_document.span.start)
+        ),
         supporting_files=supporting_files,
+        source_index=SourceIndex(
+            sections=section_spans,
+            labels=labels,
+            environments=tokenized.environments,
+            comments=[t.span for t in tokens if t.kind == TokenKind.COMMENT],
+            section_files=(
+                {}
+                if expanded is None
+                else {
+                    ref: expanded.file_at(span.start)
+                    for ref, span in section_spans.items()
+                }
+            ),
+            file_graph=None if expanded is None else expanded.file_graph,
+        ),
     )
 
-    # fill with parsed components
-    for line, content in splits:
-        if line.matched_line.startswith(r"\documentclass"):
-            result = replace(result, pre_matter=[line.matched_line, *content])
-        elif line.matched_line == r"\begin{document}":
-            result = replace(result, begin_document=content)
-        elif line.matched_line == r"\maketitle":
-            main_content_dict, optional_appendix_content_dict = (
-                _parse_content_to_sections(content)
-            )
-            if optional_appendix_content_dict is None:
-                result = replace(result, content_dict=main_content_dict)
-            else:
-                result = replace(
-                    result,
-                    content_dict={
-                        **main_content_dict,
-                        **optional_appendix_content_dict,
-                    },
-                )
-
-        elif _bibliography_start_detector(line.matched_line) is not None:
-            result = replace(result, bibliography=[line.matched_line, *content])
-        elif line.matched_line == r"\end{document}":
-            if len(content) > 0:
-                raise Exception(
-                    r"Did not expect content after \end{document}. Please delete."
-                )
-        else:
-            raise Exception(f"Unexpected line: {line}")
-
     # Raise exception if there are duplicate labels in the sections (incl. Appendix
     # sections). Also check that source Latex document does not use the same labels as
     # (our internal) labels generated when parsing the Latex.
@@ -261,15 +397,56 @@ def parse_from_latex(
     return result
 
 
-def parse_latex_from_files(files: dict[Path, bytes], main_file: Path) -> LatexDocument:
+@traced()
+def parse_from_latex(
+    input_latex: str, supporting_files: dict[Path, bytes] = {}
+) -> LatexDocument:
     """
+    Main interface to parse an input LaTeX document into LatexDocument data model
+    """
+    tokenized: TokenizedLatex = tokenize(input_latex)
+    print(
+        f" - Read {len(tokenized.lines)} lines "
+        f"({len(tokenized.tokens)} tokens, {len(tokenized.environments)} environments)"
+    )
+
+    return _parse_tokenized(tokenized, supporting_files)
+
+
+@traced()
+def parse_latex_from_files(
+    files: dict[Path, bytes],
+    main_file: Path,
+    expand_includes: bool = True,
+    cache: TokenizedFileCache = TOKENIZED_FILE_CACHE,
+) -> LatexDocument:
+    r"""
     Convenience function to parse dictionary of files (where one file is the main LaTeX
     source) into a LatexDocument
+
+    Args:
+        files:           All files of the document (LaTeX sources, images, etc.)
+        main_file:       The main LaTeX source in 'files'
+        expand_includes: Expand \input{..}, \include{..} and \subfile{..} commands
+                         with the content of the included files in 'files'.
+        cache:           Cache of tokenized files (used when expanding included files)
     """
     if main_file not in files:
         raise Exception(f"Main file {main_file} not found in files {files.keys()}.")
 
-    return parse_from_latex(
-        input_latex=files[main_file].decode("utf-8"),
-        supporting_files={f: content for f, content in files.items() if f != main_file},
+    supporting_files = {f: content for f, content in files.items() if f != main_file}
+    if not expand_includes:
+        return parse_from_latex(
+            input_latex=files[main_file].decode("utf-8"),
+            supporting_files=supporting_files,
+        )
+
+    expanded: ExpandedSource = _expand_includes(files, main_file, cache)
+    tokenized = expanded.tokenized
+    print(
+        f" - Read {len(tokenized.lines)} lines from "
+        f"{len(expanded.file_graph.content_hashes)} file(s) "
+        f"({len(tokenized.tokens)} tokens, {len(tokenized.environments)} environments)"
     )
+
+    return _parse_tokenized(tokenized, supporting_files, expanded)
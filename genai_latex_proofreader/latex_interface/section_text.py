@@ -0,0 +1,147 @@
+"""
+Compact, immutable storage for the lines of one part of a LaTeX document.
+
+A `SectionText` stores the lines as one text buffer (lines joined with "\\n") and an
+array with the offset of each line. It behaves as a read-only list of lines, so
+existing code that indexes, iterates or compares the lines of a document part works
+unchanged, while code that needs the whole part (eg. to render it) can use the text
+buffer directly.
+
+Content hash, number of lines and number of (UTF-8) bytes are computed once.
+"""
+
+import hashlib
+from array import array
+from typing import Iterable, Iterator, Optional, Sequence, overload
+
+
+class SectionText(Sequence[str]):
+    __slots__ = (
+        "text",
+        "_line_starts",
+        "_splittable",
+        "_hash",
+        "_content_hash",
+        "_nr_bytes",
+    )
+
+    def __init__(self, lines: Iterable[str] = ()):
+        lines = list(lines)
+        self.text: str = "\n".join(lines)
+
+        # offset of the first character of each line in 'text'
+        self._line_starts: array = array("q")
+        offset = 0
+        for line in lines:
+            self._line_starts.append(offset)
+            offset += len(line) + 1
+
+        # Lines may contain newlines (eg. a multi-line comment). If not, the lines can
+        # be recovered by splitting the text.
+        self._splittable: bool = self.text.count("\n") == max(len(lines) - 1, 0)
+
+        self._hash: Optional[int] = None
+        self._content_hash: Optional[str] = None
+        self._nr_bytes: Optional[int] = None
+
+    @property
+    def nr_lines(self) -> int:
+        # number of lines (entries in the list view)
+        return len(self._line_starts)
+
+    @property
+    def nr_bytes(self) -> int:
+        """
+        Number of bytes in the UTF-8 encoded text (ie. lines joined with newlines).
+        """
+        if self._nr_bytes is None:
+            self._nr_bytes = (
+                len(self.text) if self.text.isascii() else len(self.text.encode())
+            )
+        return self._nr_bytes
+
+    @property
+    def content_hash(self) -> str:
+        """
+        sha256 hash of the lines (the same lines give the same hash)
+        """
+        if self._content_hash is None:
+            h = hashlib.sha256(str(self.nr_lines).encode())
+            h.update(b"\0")
+            h.update(self.text.encode("utf-8"))
+            if not self._splittable:
+                h.update(self._line_starts.tobytes())
+            self._content_hash = h.hexdigest()
+        return self._content_hash
+
+    # --- list-style (read-only) view of lines ---
+
+    def __len__(self) -> int:
+        return len(self._line_starts)
+
+    def _line(self, idx: int) -> str:
+        start = self._line_starts[idx]
+        if idx + 1 < len(self._line_starts):
+            return self.text[start : self._line_starts[idx + 1] - 1]
+        return self.text[start:]
+
+    @overload
+    def __getitem__(self, idx: int) -> str: ...
+
+    @overload
+    def __getitem__(self, idx: slice) -> list[str]: ...
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._line(i) for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("SectionText index out of range")
+        return self._line(idx)
+
+    def __iter__(self) -> Iterator[str]:
+        if len(self) == 0:
+            return iter([])
+        if self._splittable:
+            return iter(self.text.split("\n"))
+        return (self._line(idx) for idx in range(len(self)))
+
+    def __contains__(self, line: object) -> bool:
+        if not isinstance(line, str):
+            return False
+        return line in self.text and any(line == x for x in self)
+
+    def __add__(self, other: Iterable[str]) -> "SectionText":
+        return SectionText([*self, *other])
+
+    def __radd__(self, other: Iterable[str]) -> "SectionText":
+        return SectionText([*other, *self])
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, SectionText):
+            return self is other or (
+                hash(self) == hash(other)
+                and self.text == other.text
+                and self._line_starts == other._line_starts
+            )
+        if isinstance(other, list):
+            return len(self) == len(other) and list(self) == other
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash((self.nr_lines, self.text))
+        return self._hash
+
+    def __repr__(self) -> str:
+        return f"SectionText({list(self)!r})"
+
+
+def section_text(lines: Sequence[str]) -> SectionText:
+    """
+    Return lines as a SectionText (without copying if 'lines' is a SectionText).
+    """
+    if isinstance(lines, SectionText):
+        return lines
+    return SectionText(lines)
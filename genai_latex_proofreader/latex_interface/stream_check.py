@@ -0,0 +1,123 @@
+r"""
+Incremental check of LaTeX that is generated as a stream of text (eg. a proofreading
+report returned by GenAI), so that output that goes off-format can be aborted early.
+
+The checker tracks:
+ - that the output starts with a required prefix (eg. "\begin{enumerate}"),
+ - the balance of braces, and of \begin{..} and \end{..} of environments,
+ - sectioning commands (eg. \section), that are not allowed in comments.
+
+Text is checked as it arrives. A command (or comment) at the end of the text received
+so far is only checked when it is complete.
+"""
+
+import re
+from typing import Optional
+
+# Commands that are not allowed in proofreading comments
+SECTIONING_COMMANDS: list[str] = [r"\section", r"\subsection", r"\subsubsection"]
+
+_TOKEN_PATTERN = re.compile(
+    r"\\(?:begin|end)(?![a-zA-Z])(?:\s*\{[^{}]*\}?)?"  # \begin{..} and \end{..}
+    r"|\\[a-zA-Z]+\*?"  # commands
+    r"|\\."  # escaped characters (eg. \{ or \\)
+    r"|\\"  # backslash at the end of the text
+    r"|%[^\n]*"  # comments
+    r"|[{}]"
+    r"|[^\\{}%]+",
+    flags=re.DOTALL,
+)
+_ENVIRONMENT_PATTERN = re.compile(r"\\(begin|end)\s*\{([^{}]*)\}")
+
+
+class OffFormatOutput(Exception):
+    """
+    Generated LaTeX is off-format (eg. unbalanced, or with sectioning commands).
+    """
+
+
+class IncrementalLatexChecker:
+    """
+    Check generated LaTeX as it arrives (see `feed` and `finish`).
+    """
+
+    def __init__(self, required_prefix: Optional[str] = r"\begin{enumerate}"):
+        self.required_prefix = required_prefix
+        self._text: str = ""
+        # position up to which the text is checked
+        self._position: int = 0
+        self._prefix_checked: bool = required_prefix is None
+        self._brace_depth: int = 0
+        self._environments: list[str] = []
+
+    def _check_prefix(self, final: bool):
+        if self._prefix_checked or self.required_prefix is None:
+            return
+        text = self._text.lstrip()
+        if len(text) >= len(self.required_prefix) or final:
+            if not text.startswith(self.required_prefix):
+                raise OffFormatOutput(
+                    f"Output does not start with {self.required_prefix}: "
+                    f"{text[: len(self.required_prefix) + 20]!r}"
+                )
+            self._prefix_checked = True
+        elif not self.required_prefix.startswith(text):
+            raise OffFormatOutput(
+                f"Output does not start with {self.required_prefix}: {text!r}"
+            )
+
+    def _check_token(self, token: str):
+        if token.startswith((r"\begin", r"\end")):
+            if (match := _ENVIRONMENT_PATTERN.fullmatch(token)) is None:
+                raise OffFormatOutput(f"Malformed environment command: {token!r}")
+            command, environment = match.groups()
+            if command == "begin":
+                self._environments.append(environment)
+            elif len(self._environments) == 0:
+                raise OffFormatOutput(f"\\end{{{environment}}} without \\begin")
+            elif (expected := self._environments.pop()) != environment:
+                raise OffFormatOutput(
+                    f"\\end{{{environment}}} does not match \\begin{{{expected}}}"
+                )
+        elif token.rstrip("*") in SECTIONING_COMMANDS:
+            raise OffFormatOutput(f"Sectioning command {token} is not allowed")
+        elif token == "{":
+            self._brace_depth += 1
+        elif token == "}":
+            self._brace_depth -= 1
+            if self._brace_depth < 0:
+                raise OffFormatOutput("Unbalanced closing brace")
+
+    def _check(self, final: bool):
+        self._check_prefix(final)
+        while self._position < len(self._text):
+            match = _TOKEN_PATTERN.match(self._text, self._position)
+            assert match is not None
+            token = match.group(0)
+            if (
+                not final
+                and match.end() == len(self._text)
+                and token.startswith(("\\", "%"))
+            ):
+                # the command (or comment) may continue in the next text
+                return
+            self._check_token(token)
+            self._position = match.end()
+
+    def feed(self, text: str):
+        """
+        Check the next part of the generated text (raises OffFormatOutput).
+        """
+        self._text += text
+        self._check(final=False)
+
+    def finish(self) -> str:
+        """
+        Check the complete text (raises OffFormatOutput), and return it.
+        """
+        self._check(final=True)
+        if self._brace_depth != 0:
+            raise OffFormatOutput(f"{self._brace_depth} unclosed brace(s)")
+        if len(self._environments) > 0:
+            raise OffFormatOutput(f"Unclosed environments: {self._environments}")
+        return self._text
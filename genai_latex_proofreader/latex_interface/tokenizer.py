@@ -0,0 +1,431 @@
+r"""
+Single-pass tokenizer for the parts of a LaTeX document that are needed to parse it
+into sections: commands (with their arguments), environments and comments.
+
+The input is scanned once. Every token records its position in the input (character,
+byte and line offsets). Only commands listed in `COMMAND_ARGUMENTS` are returned as
+tokens; other commands and text are skipped.
+
+Arguments may span multiple lines, eg.
+
+    \section[Short title]{A long title
+        that continues on the next line}
+
+The content of verbatim-like environments (see `VERBATIM_ENVIRONMENTS`) and of
+\verb|...| is not tokenized.
+"""
+
+import bisect
+import re
+from dataclasses import dataclass, replace
+from enum import Enum
+from typing import Optional
+
+# Commands returned as tokens, and the number of mandatory {...} arguments to parse
+# for each command. An optional [...] argument before the first mandatory argument
+# is also parsed.
+COMMAND_ARGUMENTS: dict[str, int] = {
+    "documentclass": 1,
+    "begin": 1,
+    "end": 1,
+    "maketitle": 0,
+    "appendix": 0,
+    "section": 1,
+    "section*": 1,
+    "subsection": 1,
+    "subsection*": 1,
+    "subsubsection": 1,
+    "subsubsection*": 1,
+    "label": 1,
+    "bibliography": 1,
+    "bibliographystyle": 1,
+    "input": 1,
+    "include": 1,
+    "subfile": 1,
+}
+
+# Environments where the content is not LaTeX (eg. "%" does not start a comment)
+VERBATIM_ENVIRONMENTS: set[str] = {"verbatim", "verbatim*", "lstlisting", "comment"}
+
+
+@dataclass(frozen=True)
+class SourceSpan:
+    """
+    Position of a part of a LaTeX source. All end offsets are exclusive.
+    """
+
+    # offsets into the source string
+    start: int
+    end: int
+
+    # offsets into the UTF-8 encoded source
+    start_byte: int
+    end_byte: int
+
+    # line numbers (0-based) of the first and the last character in the span
+    start_line: int
+    end_line: int
+
+
+class TokenKind(Enum):
+    # a command, eg. \section{Introduction}
+    COMMAND = "command"
+
+    # start and end of environments, ie. \begin{...} and \end{...}
+    BEGIN = "begin"
+    END = "end"
+
+    # a comment starting with "%" (until end of line)
+    COMMENT = "comment"
+
+
+@dataclass(frozen=True)
+class LatexToken:
+    kind: TokenKind
+
+    # COMMAND: name of command without backslash, eg. "section"
+    # BEGIN, END: name of environment, eg. "proof"
+    # COMMENT: the comment, eg. "% a comment"
+    name: str
+
+    span: SourceSpan
+
+    # Optional [...] and mandatory {...} arguments of a command (without brackets and
+    # comments). A mandatory argument that is missing in the source is not included.
+    optional_args: tuple[str, ...] = ()
+    args: tuple[str, ...] = ()
+
+    # Names of the environments that enclose the token (outermost first), eg.
+    # ("document", "theorem") for a \label inside a theorem.
+    environments: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class EnvironmentSpan:
+    name: str
+
+    # From start of \begin{..} until end of \end{..}
+    span: SourceSpan
+
+
+class LineTable:
+    """
+    Convert offsets in a text into line numbers and byte offsets.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+
+        # offset of the first character on each line
+        self.line_starts: list[int] = [0]
+        while (idx := text.find("\n", self.line_starts[-1])) != -1:
+            self.line_starts.append(idx + 1)
+
+        # byte offset of the first character on each line
+        self.line_start_bytes: list[int] = self.line_starts
+        if not text.isascii():
+            self.line_start_bytes = [0]
+            for line_start, next_line_start in zip(
+                self.line_starts, self.line_starts[1:]
+            ):
+                self.line_start_bytes.append(
+                    self.line_start_bytes[-1]
+                    + _nr_bytes(text, line_start, next_line_start)
+                )
+
+    def __len__(self) -> int:
+        return len(self.line_starts)
+
+    def line_of(self, offset: int) -> int:
+        return bisect.bisect_right(self.line_starts, offset) - 1
+
+    def line_end(self, line: int) -> int:
+        """
+        Offset of the end of a line (excluding the newline character).
+        """
+        if line + 1 < len(self.line_starts):
+            return self.line_starts[line + 1] - 1
+        return len(self.text)
+
+    def byte_offset(self, offset: int) -> int:
+        line = self.line_of(offset)
+        return self.line_start_bytes[line] + _nr_bytes(
+            self.text, self.line_starts[line], offset
+        )
+
+    def span(self, start: int, end: int) -> SourceSpan:
+        return SourceSpan(
+            start=start,
+            end=end,
+            start_byte=self.byte_offset(start),
+            end_byte=self.byte_offset(end),
+            start_line=self.line_of(start),
+            end_line=self.line_of(max(start, end - 1)),
+        )
+
+
+def _nr_bytes(text: str, start: int, end: int) -> int:
+    part = text[start:end]
+    return len(part) if part.isascii() else len(part.encode("utf-8"))
+
+
+@dataclass(frozen=True)
+class TokenizedLatex:
+    text: str
+    lines: LineTable
+    tokens: list[LatexToken]
+    environments: list[EnvironmentSpan]
+
+
+# "%" or a backslash followed by a command name or by a single character
+_TOKEN_PATTERN = re.compile(r"%|\\(?:([a-zA-Z@]+\*?)|.)", re.DOTALL)
+
+
+def _comment_end(text: str, start: int) -> int:
+    end = text.find("\n", start)
+    return len(text) if end == -1 else end
+
+
+def _skip_whitespace(text: str, pos: int) -> int:
+    """
+    Skip spaces and tabs, and at most one newline (braces after an empty line are
+    not arguments to a command before the empty line).
+    """
+    newline_seen = False
+    while pos < len(text) and text[pos] in " \t\n":
+        if text[pos] == "\n":
+            if newline_seen:
+                break
+            newline_seen = True
+        pos += 1
+    return pos
+
+
+def _read_group(
+    text: str, pos: int, open: str, close: str, comments: list[tuple[int, int]]
+) -> Optional[tuple[str, int]]:
+    """
+    Read a balanced group (eg. "{...}") starting at 'pos'. Returns the content of the
+    group without comments, and the offset after the group. Returns None if there is
+    no (closed) group starting at 'pos'.
+
+    Comments in the group are appended to 'comments' as (start, end) offsets.
+    """
+    if pos >= len(text) or text[pos] != open:
+        return None
+
+    depth, idx, part_start = 0, pos, pos + 1
+    parts: list[str] = []
+    group_comments: list[tuple[int, int]] = []
+    while idx < len(text):
+        char = text[idx]
+        if char == "\\":
+            idx += 2
+            continue
+        elif char == "%":
+            end = _comment_end(text, idx)
+            group_comments.append((idx, end))
+            parts.append(text[part_start:idx])
+            idx, part_start = end, end
+            continue
+        elif char == "{" or char == open:
+            depth += 1
+        elif char == "}" or char == close:
+            depth -= 1
+            if depth == 0:
+                if char != close:
+                    # eg. "[" closed by "}"
+                    return None
+                parts.append(text[part_start:idx])
+                comments.extend(group_comments)
+                return "".join(parts), idx + 1
+        idx += 1
+
+    return None
+
+
+def _read_arguments(
+    text: str, pos: int, nr_args: int, comments: list[tuple[int, int]]
+) -> tuple[tuple[str, ...], tuple[str, ...], int]:
+    """
+    Read an optional [...] argument followed by 'nr_args' mandatory {...} arguments.
+    Returns optional arguments, mandatory arguments and the offset after the last
+    argument that was read.
+    """
+    if nr_args == 0:
+        return (), (), pos
+
+    optional_args: list[str] = []
+    optional = _read_group(text, _skip_whitespace(text, pos), "[", "]", comments)
+    if optional is not None:
+        optional_args.append(optional[0])
+        pos = optional[1]
+
+    args: list[str] = []
+    while len(args) < nr_args:
+        arg = _read_group(text, _skip_whitespace(text, pos), "{", "}", comments)
+        if arg is None:
+            break
+        args.append(arg[0])
+        pos = arg[1]
+
+    return tuple(optional_args), tuple(args), pos
+
+
+def _scan(text: str, lines: LineTable) -> list[LatexToken]:
+    """
+    Scan text and return tokens (without enclosing environments).
+    """
+    tokens: list[LatexToken] = []
+
+    def _add_token(kind: TokenKind, name: str, start: int, end: int, **kwargs):
+        tokens.append(
+            LatexToken(kind=kind, name=name, span=lines.span(start, end), **kwargs)
+        )
+
+    pos = 0
+    while (match := _TOKEN_PATTERN.search(text, pos)) is not None:
+        start = match.start()
+
+        if match.group(0) == "%":
+            pos = _comment_end(text, start)
+            _add_token(TokenKind.COMMENT, text[start:pos], start, pos)
+            continue
+
+        name: Optional[str] = match.group(1)
+        if name is None:
+            # escaped character, eg. "\%" or "\\"
+            pos = match.end()
+
+        elif name in ["verb", "verb*"]:
+            # \verb|...| where "|" can be any character
+            end = text.find(text[match.end() : match.end() + 1], match.end() + 1)
+            pos = match.end() + 1 if end == -1 else end + 1
+
+        elif name in COMMAND_ARGUMENTS:
+            comments: list[tuple[int, int]] = []
+            optional_args, args, pos = _read_arguments(
+                text, match.end(), COMMAND_ARGUMENTS[name], comments
+            )
+
+            if name == "begin" and len(args) == 1:
+                _add_token(TokenKind.BEGIN, args[0], start, pos)
+
+                if args[0] in VERBATIM_ENVIRONMENTS:
+                    # skip content until the matching \end{...}
+                    end = text.find(rf"\end{{{args[0]}}}", pos)
+                    pos = len(text) if end == -1 else end
+
+            elif name == "end" and len(args) == 1:
+                _add_token(TokenKind.END, args[0], start, pos)
+
+            else:
+                _add_token(
+                    TokenKind.COMMAND,
+                    name,
+                    start,
+                    pos,
+                    optional_args=optional_args,
+                    args=args,
+                )
+
+            # comments inside arguments
+            for comment_start, comment_end in comments:
+                _add_token(
+                    TokenKind.COMMENT,
+                    text[comment_start:comment_end],
+                    comment_start,
+                    comment_end,
+                )
+
+        else:
+            pos = match.end()
+
+    return tokens
+
+
+def _track_environments(
+    text: str, lines: LineTable, tokens: list[LatexToken]
+) -> TokenizedLatex:
+    r"""
+    Set the enclosing environments of each token, and pair \begin{..} and \end{..}
+    tokens into environment spans.
+    """
+    result: list[LatexToken] = []
+    environments: list[EnvironmentSpan] = []
+
+    # open environments (name, offset of \begin), and their names
+    open_environments: list[tuple[str, int]] = []
+    enclosing: tuple[str, ...] = ()
+
+    for token in tokens:
+        if token.kind == TokenKind.END and token.name in enclosing:
+            # close environment (and any unclosed environments inside it)
+            while open_environments:
+                env_name, env_start = open_environments.pop()
+                if env_name == token.name:
+                    break
+            environments.append(
+                EnvironmentSpan(
+                    name=token.name, span=lines.span(env_start, token.span.end)
+                )
+            )
+            enclosing = tuple(env_name for env_name, _ in open_environments)
+
+        if token.environments != enclosing:
+            token = replace(token, environments=enclosing)
+        result.append(token)
+
+        if token.kind == TokenKind.BEGIN:
+            open_environments.append((token.name, token.span.start))
+            enclosing = (*enclosing, token.name)
+
+    return TokenizedLatex(
+        text=text,
+        lines=lines,
+        tokens=result,
+        environments=sorted(environments, key=lambda env: env.span.start),
+    )
+
+
+def tokenize(text: str) -> TokenizedLatex:
+    """
+    Tokenize a LaTeX document in a single pass.
+    """
+    lines = LineTable(text)
+    return _track_environments(text, lines, _scan(text, lines))
+
+
+def concatenate(parts: list[tuple[TokenizedLatex, int, int]]) -> TokenizedLatex:
+    """
+    Concatenate parts (start, end offsets) of tokenized texts into one tokenized text,
+    without tokenizing the text again. The start and end offsets of each part should
+    not be inside a token.
+    """
+    texts: list[str] = []
+    for tokenized, start, end in parts:
+        texts.append(tokenized.text[start:end])
+    text = "".join(texts)
+    lines = LineTable(text)
+
+    tokens: list[LatexToken] = []
+    offset: int = 0
+    for tokenized, start, end in parts:
+        token_starts = [token.span.start for token in tokenized.tokens]
+        for idx in range(
+            bisect.bisect_left(token_starts, start),
+            bisect.bisect_left(token_starts, end),
+        ):
+            token = tokenized.tokens[idx]
+            tokens.append(
+                replace(
+                    token,
+                    span=lines.span(
+                        token.span.start - start + offset,
+                        token.span.end - start + offset,
+                    ),
+                )
+            )
+        offset += end - start
+
+    return _track_environments(text, lines, tokens)
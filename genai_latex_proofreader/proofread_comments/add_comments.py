@@ -1,8 +1,98 @@
-from dataclasses import replace
+from dataclasses import dataclass, replace
+from typing import Optional
 
 from ..latex_interface.data_model import ContentReferenceBase, LatexDocument
+from ..latex_interface.stream_check import SECTIONING_COMMANDS
+from ..utils.tracing import traced
 
 
+def _check_comments(
+    doc: LatexDocument, section_ref: ContentReferenceBase, comments: list[str]
+):
+    if any(forbidden_command in comments for forbidden_command in SECTIONING_COMMANDS):
+        raise ValueError(
+            f"Section comment should not define any section:s, subsection:s, or subsubsection:s."
+        )
+
+    if not section_ref in doc.content_dict:
+        raise ValueError(f"Section reference {section_ref} not found in document.")
+
+
+@dataclass(frozen=True)
+class _OverlayEntry:
+    section_ref: ContentReferenceBase
+    comments: tuple[str, ...]
+
+    # entry added before this one (entries form a linked list, newest first)
+    previous: Optional["_OverlayEntry"]
+
+
+@dataclass(frozen=True)
+class CommentOverlay:
+    """
+    Proofreading comments layered on top of a (shared, unmodified) LaTeX document.
+
+    Adding comments returns a new overlay that shares the base document and all
+    previously added comments, so adding a comment does not copy the document. The
+    document with comments is only created by `materialize()`, eg. when rendering.
+
+    As with add_comments, comments are inserted at the start of a section, and
+    comments added later are inserted before comments added earlier.
+    """
+
+    base: LatexDocument
+
+    _last: Optional[_OverlayEntry] = None
+
+    def add(
+        self, section_ref: ContentReferenceBase, comments: list[str]
+    ) -> "CommentOverlay":
+        _check_comments(self.base, section_ref, comments)
+        return replace(
+            self, _last=_OverlayEntry(section_ref, tuple(comments), self._last)
+        )
+
+    def _entries(self):
+        # newest first
+        entry = self._last
+        while entry is not None:
+            yield entry
+            entry = entry.previous
+
+    def comments(self) -> dict[ContentReferenceBase, list[str]]:
+        """
+        Return comments for each section with comments (in the order they are
+        inserted into the section).
+        """
+        result: dict[ContentReferenceBase, list[str]] = {}
+        for entry in self._entries():
+            result.setdefault(entry.section_ref, []).extend(entry.comments)
+        return result
+
+    @traced("add_comments: materialize")
+    def materialize(self) -> LatexDocument:
+        """
+        Return the base document with all comments added. Content of sections without
+        comments is shared with the base document.
+        """
+        if self._last is None:
+            return self.base
+
+        comments = self.comments()
+        return replace(
+            self.base,
+            content_dict={
+                section_ref: (
+                    [*comments[section_ref], *content]
+                    if section_ref in comments
+                    else content
+                )
+                for section_ref, content in self.base.content_dict.items()
+            },
+        )
+
+
+@traced()
 def add_comments(
     doc: LatexDocument,
     section_ref: ContentReferenceBase,
@@ -10,22 +100,8 @@ def add_comments(
 ) -> LatexDocument:
     """
     Add proofreading comments to a LaTeX document.
-    """
-    if any(
-        forbidden_command in comments
-        for forbidden_command in [r"\section", r"\subsection", r"\subsubsection"]
-    ):
-        raise ValueError(
-            f"Section comment should not define any section:s, subsection:s, or subsubsection:s."
-        )
 
-    if not section_ref in doc.content_dict:
-        raise ValueError(f"Section reference {section_ref} not found in document.")
-
-    return replace(
-        doc,
-        content_dict={
-            _section_ref: (comments if _section_ref == section_ref else []) + content
-            for _section_ref, content in doc.content_dict.items()
-        },
-    )
+    To add many comments, use a CommentOverlay (that only creates a new document
+    once all comments are added).
+    """
+    return CommentOverlay(doc).add(section_ref, comments).materialize()
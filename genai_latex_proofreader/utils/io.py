@@ -1,5 +1,7 @@
 from pathlib import Path
 
+from .profiling import count_bytes_read, count_bytes_written
+
 
 def read_directory(directory: Path) -> dict[Path, bytes]:
     """
@@ -16,6 +18,7 @@ def read_directory(directory: Path) -> dict[Path, bytes]:
     for file_path in directory.glob("**/*"):
         if file_path.is_file():
             files[file_path.relative_to(directory)] = file_path.read_bytes()
+    count_bytes_read(sum(len(content) for content in files.values()))
     return files
 
 
@@ -38,3 +41,4 @@ def write_directory(files: dict[Path, bytes], directory: Path) -> None:
             raise Exception(
                 f"Content for {file_path} is not bytes, but type is {type(content)}."
             )
+    count_bytes_written(sum(len(content) for content in files.values()))
@@ -0,0 +1,206 @@
+"""
+Profile of a run (see --profile): cProfile around the proofreading pipeline, and
+tracemalloc snapshots at the boundaries of the stages of the run (eg. parsing,
+proofreading, compiling the report). The profile reports:
+
+ - the top functions by cumulative time,
+ - the time, peak memory and memory growth of each stage (with the top allocation
+   sites of the growth),
+ - the number of TeX invocations, and the bytes copied by read_directory and
+   write_directory (eg. when files are copied to and from compile directories).
+
+Note: cProfile only profiles the thread where it is enabled (the main thread). Time
+spent in worker threads (eg. GenAI queries) is seen as waits in the main thread.
+
+Profiling is disabled by default. Then `stage` does nothing, and the `count_*`
+functions only check a global.
+"""
+
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+_MB: int = 1024**2
+
+
+@dataclass(frozen=True)
+class StageProfile:
+    name: str
+    seconds: float
+    # peak traced memory during the stage, and memory growth over the stage
+    peak_bytes: int
+    growth_bytes: int
+    # allocation sites with the largest growth over the stage
+    top_allocations: list[str]
+
+
+class RunProfiler:
+    """
+    Profile of a run (see `start`, `stage` and `stop`).
+    """
+
+    def __init__(self, top_functions: int = 25, top_allocations: int = 3):
+        self.top_functions = top_functions
+        self.top_allocations = top_allocations
+        self._profile = cProfile.Profile()
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self.stages: list[StageProfile] = []
+
+        self._lock = threading.Lock()
+        self.tex_invocations: int = 0
+        self.read_calls: int = 0
+        self.bytes_read: int = 0
+        self.write_calls: int = 0
+        self.bytes_written: int = 0
+
+    def start(self):
+        tracemalloc.start()
+        self._snapshot = self._take_snapshot()
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        tracemalloc.stop()
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            [
+                # allocations of the profiler itself
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            ]
+        )
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Profile the time and memory of a stage of the run.
+        """
+        tracemalloc.reset_peak()
+        current_before, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            current_after, peak = tracemalloc.get_traced_memory()
+            snapshot = self._take_snapshot()
+            top_allocations: list[str] = []
+            if self._snapshot is not None:
+                top_allocations = [
+                    str(diff)
+                    for diff in snapshot.compare_to(self._snapshot, "lineno")[
+                        : self.top_allocations
+                    ]
+                ]
+            self._snapshot = snapshot
+            self.stages.append(
+                StageProfile(
+                    name=name,
+                    seconds=seconds,
+                    peak_bytes=peak,
+                    growth_bytes=current_after - current_before,
+                    top_allocations=top_allocations,
+                )
+            )
+
+    def _count(
+        self,
+        tex_invocations: int = 0,
+        read_bytes: Optional[int] = None,
+        written_bytes: Optional[int] = None,
+    ):
+        with self._lock:
+            self.tex_invocations += tex_invocations
+            if read_bytes is not None:
+                self.read_calls += 1
+                self.bytes_read += read_bytes
+            if written_bytes is not None:
+                self.write_calls += 1
+                self.bytes_written += written_bytes
+
+    def top_functions_report(self) -> str:
+        output = io.StringIO()
+        pstats.Stats(self._profile, stream=output).sort_stats(
+            pstats.SortKey.CUMULATIVE
+        ).print_stats(self.top_functions)
+        return output.getvalue()
+
+    def summary(self) -> str:
+        def _summary() -> Iterable[str]:
+            yield "--- Profile ---"
+            yield "Stages (time, peak memory, memory growth):"
+            for stage in self.stages:
+                yield (
+                    f" - {stage.name}: {stage.seconds:.2f}s, "
+                    f"peak {stage.peak_bytes / _MB:.1f} MB, "
+                    f"growth {stage.growth_bytes / _MB:+.1f} MB"
+                )
+                for allocation in stage.top_allocations:
+                    yield f"     {allocation}"
+            yield f"TeX invocations: {self.tex_invocations}"
+            yield (
+                f"read_directory: {self.bytes_read / _MB:.1f} MB "
+                f"({self.read_calls} calls)"
+            )
+            yield (
+                f"write_directory: {self.bytes_written / _MB:.1f} MB "
+                f"({self.write_calls} calls)"
+            )
+            yield f"Top {self.top_functions} functions by cumulative time:"
+            yield self.top_functions_report()
+
+        return "\n".join(_summary())
+
+
+# profiler of the run (None: profiling is disabled)
+_profiler: Optional[RunProfiler] = None
+
+
+def start_profiling(profiler: RunProfiler) -> RunProfiler:
+    global _profiler
+    _profiler = profiler
+    profiler.start()
+    return profiler
+
+
+def stop_profiling():
+    global _profiler
+    if _profiler is not None:
+        _profiler.stop()
+    _profiler = None
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Stage of the run (profiled if profiling is enabled).
+    """
+    if _profiler is None:
+        yield
+    else:
+        with _profiler.stage(name):
+            yield
+
+
+def count_tex_invocations(invocations: int):
+    if _profiler is not None:
+        _profiler._count(tex_invocations=invocations)
+
+
+def count_bytes_read(read_bytes: int):
+    if _profiler is not None:
+        _profiler._count(read_bytes=read_bytes)
+
+
+def count_bytes_written(written_bytes: int):
+    if _profiler is not None:
+        _profiler._count(written_bytes=written_bytes)
@@ -1,14 +1,70 @@
 """
 Helper functions to to run commands in a subprocess, and collect results
 (ie., files, stdout, errout and error codes).
+
+Each command runs under resource limits (see `CommandLimits`). A command that
+exceeds its limits, or that appears to be stuck in a loop, is killed and reported
+with a `CommandStatus` other than `CommandStatus.COMPLETED`.
 """
 
+import os
+import signal
 import subprocess
 import tempfile
+import threading
+import time
 from dataclasses import dataclass
+from enum import Enum
 from pathlib import Path
+from typing import IO, Optional
 
 from .io import read_directory, write_directory
+from .tracing import span, traced
+
+
+class CommandStatus(Enum):
+    # command ran to completion (with any return code)
+    COMPLETED = "completed"
+
+    # command was killed after exceeding the wall-clock limit
+    TIMED_OUT = "timed-out"
+
+    # command was killed by the kernel after exceeding the CPU-time limit
+    CPU_LIMIT_EXCEEDED = "cpu-limit-exceeded"
+
+    # command was killed since it kept repeating the same output, or its output
+    # (stdout or *.log files) grew beyond the output limit
+    LOOP_DETECTED = "loop-detected"
+
+
+@dataclass(frozen=True)
+class CommandLimits:
+    """
+    Limits for one command. A limit set to None is not enforced.
+    """
+
+    # Wall-clock time limit (in seconds)
+    wall_clock_seconds: Optional[float] = 300.0
+
+    # CPU-time limit (in seconds), applies to the shell and its child processes
+    cpu_seconds: Optional[int] = 240
+
+    # Address-space (virtual memory) limit (in bytes)
+    address_space_bytes: Optional[int] = 4 * 1024**3
+
+    # Kill command if the same (non-empty) line is written this many times in a row
+    # to stdout. Eg. a runaway \loop in TeX typically prints the same warning.
+    max_repeated_lines: Optional[int] = 1000
+
+    # Kill command if stdout, or any *.log file in the working directory, grows
+    # beyond this size (in bytes).
+    max_output_bytes: Optional[int] = 64 * 1024**2
+
+    # How often the limits above are checked (in seconds)
+    poll_interval_seconds: float = 0.1
+
+
+DEFAULT_COMMAND_LIMITS = CommandLimits()
 
 
 @dataclass(frozen=True)
@@ -17,6 +73,11 @@ class CommandResult:
     stderr: str
     returncode: int
     output_files: dict[Path, bytes]
+    status: CommandStatus = CommandStatus.COMPLETED
+
+    @property
+    def succeeded(self) -> bool:
+        return self.status == CommandStatus.COMPLETED and self.returncode == 0
 
     def __str__(self):
         def _list_files():
@@ -25,6 +86,7 @@ class CommandResult:
 
         return (
             f"CommandResult("
+            f"  status={self.status.value}, \n"
             f"  returncode={self.returncode}, \n"
             f"  stdout={self.stdout}, \n"
             f"  stderr={self.stderr}, \n"
@@ -36,18 +98,141 @@ class CommandResult:
         return str(self)
 
 
-def _execute_command(command: str, cwd: Path) -> CommandResult:
-    result = subprocess.run(
-        command, shell=True, capture_output=True, text=True, cwd=cwd, check=False
+def _with_resource_limits(command: str, limits: CommandLimits) -> str:
+    """
+    Prefix command with `ulimit` calls. The limits are then inherited by all
+    processes started by the command (eg. pdflatex started by the shell).
+
+    Note: this avoids subprocess' `preexec_fn` which is not safe to use when
+    commands are run from multiple threads. The limits are best-effort: if a limit
+    can not be set (eg. the hard limit is already lower), the command still runs.
+    """
+    ulimits: list[str] = []
+    if limits.cpu_seconds is not None:
+        # At the soft limit the kernel sends SIGXCPU, and SIGKILL at the hard limit
+        ulimits.append(f"ulimit -S -t {limits.cpu_seconds} 2>/dev/null")
+        ulimits.append(f"ulimit -H -t {limits.cpu_seconds + 5} 2>/dev/null")
+    if limits.address_space_bytes is not None:
+        ulimits.append(f"ulimit -v {limits.address_space_bytes // 1024} 2>/dev/null")
+
+    return "; ".join([*ulimits, command])
+
+
+def _log_files_size(cwd: Path) -> int:
+    return max((p.stat().st_size for p in cwd.glob("*.log")), default=0)
+
+
+class _OutputReader:
+    """
+    Collect output from a pipe (in a background thread), and detect if the output
+    looks like it comes from a process stuck in a loop.
+    """
+
+    def __init__(self, pipe: IO[str], limits: CommandLimits, detect_loops: bool):
+        self.lines: list[str] = []
+        self.loop_detected = threading.Event()
+        self._limits = limits
+        self._detect_loops = detect_loops
+        self._thread = threading.Thread(target=self._read, args=(pipe,), daemon=True)
+        self._thread.start()
+
+    def _read(self, pipe: IO[str]):
+        previous_line, repeats, total_bytes = None, 0, 0
+        for line in pipe:
+            self.lines.append(line)
+            if not self._detect_loops:
+                continue
+
+            total_bytes += len(line)
+            if line.strip() != "" and line == previous_line:
+                repeats += 1
+            else:
+                previous_line, repeats = line, 1
+
+            if (
+                self._limits.max_repeated_lines is not None
+                and repeats >= self._limits.max_repeated_lines
+            ) or (
+                self._limits.max_output_bytes is not None
+                and total_bytes > self._limits.max_output_bytes
+            ):
+                self.loop_detected.set()
+
+    def output(self) -> str:
+        self._thread.join()
+        return "".join(self.lines).strip()
+
+
+def _execute_command(command: str, cwd: Path, limits: CommandLimits) -> CommandResult:
+    process = subprocess.Popen(
+        _with_resource_limits(command, limits),
+        shell=True,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        # run command in a new process group, so that the shell and all its
+        # children can be killed together
+        start_new_session=True,
     )
+    assert process.stdout is not None and process.stderr is not None
+    stdout = _OutputReader(process.stdout, limits, detect_loops=True)
+    stderr = _OutputReader(process.stderr, limits, detect_loops=False)
+
+    started = time.monotonic()
+    status = CommandStatus.COMPLETED
+    while True:
+        try:
+            process.wait(timeout=limits.poll_interval_seconds)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+
+        if (
+            limits.wall_clock_seconds is not None
+            and time.monotonic() - started > limits.wall_clock_seconds
+        ):
+            status = CommandStatus.TIMED_OUT
+        elif stdout.loop_detected.is_set() or (
+            limits.max_output_bytes is not None
+            and _log_files_size(cwd) > limits.max_output_bytes
+        ):
+            status = CommandStatus.LOOP_DETECTED
+        else:
+            continue
+
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait()
+        break
+
+    returncode: int = process.returncode
+    if status == CommandStatus.COMPLETED and returncode in [
+        -signal.SIGXCPU,
+        128 + signal.SIGXCPU,
+    ]:
+        status = CommandStatus.CPU_LIMIT_EXCEEDED
+
+    if status != CommandStatus.COMPLETED and returncode == 0:
+        # a killed command should never look successful
+        returncode = -signal.SIGKILL
 
     command_result = CommandResult(
-        stdout=result.stdout.strip(),
-        stderr=result.stderr.strip(),
-        returncode=result.returncode,
+        stdout=stdout.output(),
+        stderr=stderr.output(),
+        returncode=returncode,
         output_files=read_directory(cwd),
+        status=status,
     )
-    if command_result.stderr != "" and command_result.returncode == 0:
+    if status != CommandStatus.COMPLETED:
+        print(
+            f"Warning: command '{command}' was stopped after "
+            f"{time.monotonic() - started:.1f} seconds ({status.value})."
+        )
+    elif command_result.stderr != "" and command_result.returncode == 0:
         print(
             f"Warning: "
             f"return code is 0, but stderr is not empty ({command_result.stderr})."
@@ -56,7 +241,12 @@ def _execute_command(command: str, cwd: Path) -> CommandResult:
     return command_result
 
 
-def run_commands(files: dict[Path, bytes], commands: list[str]) -> list[CommandResult]:
+@traced()
+def run_commands(
+    files: dict[Path, bytes],
+    commands: list[str],
+    limits: CommandLimits = DEFAULT_COMMAND_LIMITS,
+) -> list[CommandResult]:
     """
     Run a list of commands in a temp directory populated with provided files. After
     the commands are run, outputs (stdout, stderr, return code) are returned.
@@ -65,6 +255,7 @@ def run_commands(files: dict[Path, bytes], commands: list[str]) -> list[CommandR
     Args:
         files: files to create in the temp directory
         commands: list of commands to run.
+        limits: time, memory and output limits for each command.
 
     Returns:
         List of CommandResult objects, one for each command that has completed,
@@ -76,6 +267,9 @@ def run_commands(files: dict[Path, bytes], commands: list[str]) -> list[CommandR
           - Only the last element in the return value may have a return code != 0.
           - Eg., if the first command fails, we only return one CommandResult object.
           - All commands ran successfully if the return code of the last element is 0.
+
+        A command killed for exceeding its limits has a status other than
+        CommandStatus.COMPLETED, and a return code != 0.
     """
     if len(commands) == 0:
         raise Exception("No compile commands provided")
@@ -87,7 +281,12 @@ def run_commands(files: dict[Path, bytes], commands: list[str]) -> list[CommandR
 
         def _get_results():
             for command in commands:
-                command_result = _execute_command(command, temp_path)
+                with span("run_command", command=command) as command_span:
+                    command_result = _execute_command(command, temp_path, limits)
+                    command_span.set(
+                        status=command_result.status.value,
+                        returncode=command_result.returncode,
+                    )
 
                 yield command_result
                 if command_result.returncode != 0:
@@ -0,0 +1,367 @@
+r"""
+Run store: GenAI queries and LaTeX compiles of runs, stored in one SQLite database
+(instead of one text file per query).
+
+Records are written by a background writer thread, so that queries (and compiles)
+do not wait for the database. Prompts, responses and compile output are stored as
+compressed blobs; the run id, persona, section, model, token usage, latency and
+compile outcome are stored in (indexed) columns, eg.:
+
+    SELECT persona, SUM(output_tokens), MAX(latency_seconds)
+    FROM queries WHERE run_id = ? GROUP BY persona
+
+The text logs of queries can be exported on demand:
+
+    python3 -m genai_latex_proofreader.utils.run_store \
+        --run_store runs.sqlite --output_directory gen-ai-queries [--run_id RUN_ID]
+"""
+
+import datetime
+import itertools
+import queue
+import sqlite3
+import threading
+import uuid
+import zlib
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Union
+
+from ..genai_interface.query_log import query_log_filename, query_log_text
+
+_SCHEMA: list[str] = [
+    """
+    CREATE TABLE IF NOT EXISTS runs (
+        run_id TEXT PRIMARY KEY,
+        started TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS queries (
+        id INTEGER PRIMARY KEY,
+        run_id TEXT NOT NULL,
+        call_id INTEGER NOT NULL,
+        timestamp TEXT NOT NULL,
+        label TEXT NOT NULL,
+        persona TEXT,
+        section TEXT,
+        model TEXT,
+        route TEXT,
+        escalated INTEGER NOT NULL,
+        input_tokens INTEGER NOT NULL,
+        output_tokens INTEGER NOT NULL,
+        latency_seconds REAL NOT NULL,
+        system_prompt BLOB NOT NULL,
+        user_prompt BLOB NOT NULL,
+        response BLOB NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS compiles (
+        id INTEGER PRIMARY KEY,
+        run_id TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        label TEXT NOT NULL,
+        status TEXT NOT NULL,
+        returncode INTEGER NOT NULL,
+        succeeded INTEGER NOT NULL,
+        seconds REAL NOT NULL,
+        stdout BLOB NOT NULL,
+        stderr BLOB NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS queries_run_id ON queries (run_id)",
+    "CREATE INDEX IF NOT EXISTS queries_persona ON queries (persona)",
+    "CREATE INDEX IF NOT EXISTS queries_section ON queries (section)",
+    "CREATE INDEX IF NOT EXISTS queries_model ON queries (model)",
+    "CREATE INDEX IF NOT EXISTS queries_tokens ON queries (output_tokens)",
+    "CREATE INDEX IF NOT EXISTS queries_latency ON queries (latency_seconds)",
+    "CREATE INDEX IF NOT EXISTS compiles_run_id ON compiles (run_id, succeeded)",
+]
+
+
+def persona_of_label(label: str) -> Optional[str]:
+    """
+    Return the persona (role) of a query label, or None. Labels of persona queries
+    are "<role>: <task>" (eg. English language expert: Proofread "..." of paper).
+    """
+    return label.split(": ", 1)[0] if ": " in label else None
+
+
+def _compress(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"))
+
+
+def _decompress(blob: bytes) -> str:
+    return zlib.decompress(blob).decode("utf-8")
+
+
+@dataclass(frozen=True)
+class QueryRecord:
+    call_id: int
+    label: str
+    system_prompt: str
+    user_prompt: str
+    response: str
+    model: Optional[str] = None
+    route: Optional[str] = None
+    escalated: bool = False
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency_seconds: float = 0.0
+    # title of the reviewed section (None: not a query about one section)
+    section: Optional[str] = None
+    timestamp: datetime.datetime = field(default_factory=datetime.datetime.now)
+
+
+@dataclass(frozen=True)
+class CompileRecord:
+    label: str
+    status: str
+    returncode: int
+    succeeded: bool
+    seconds: float
+    stdout: str
+    stderr: str
+    timestamp: datetime.datetime = field(default_factory=datetime.datetime.now)
+
+
+class RunStore:
+    """
+    Thread-safe writer of the queries and compiles of one run to a SQLite database.
+    Records are queued, and written by a background thread (see `close`).
+
+    If writing fails, the error is reported, and later records are dropped (and
+    counted). `close` then raises.
+    """
+
+    def __init__(self, path: Path, run_id: Optional[str] = None):
+        self.path = path
+        self.run_id: str = (
+            run_id
+            if run_id is not None
+            else f"{datetime.datetime.now():%Y-%m-%d_%H-%M-%S}-{uuid.uuid4().hex[:8]}"
+        )
+        self._lock = threading.Lock()
+        self.queries: int = 0
+        self.compiles: int = 0
+        # error of the writer thread, and the number of records that were not stored
+        self.error: Optional[Exception] = None
+        self.dropped: int = 0
+
+        self._queue: queue.Queue[Union[QueryRecord, CompileRecord, None]] = (
+            queue.Queue()
+        )
+        # the database is created (or opened) before records are queued, so that
+        # errors are raised to the caller
+        with sqlite3.connect(path) as connection:
+            for statement in _SCHEMA:
+                connection.execute(statement)
+            connection.execute(
+                "INSERT INTO runs (run_id, started) VALUES (?, ?)",
+                (self.run_id, datetime.datetime.now().isoformat()),
+            )
+        connection.close()
+
+        self._writer = threading.Thread(
+            target=self._write, name="run-store", daemon=True
+        )
+        self._writer.start()
+
+    def record_query(self, record: QueryRecord):
+        with self._lock:
+            if self.error is not None:
+                self.dropped += 1
+                return
+            self.queries += 1
+        self._queue.put(record)
+
+    def record_compile(self, record: CompileRecord):
+        with self._lock:
+            if self.error is not None:
+                self.dropped += 1
+                return
+            self.compiles += 1
+        self._queue.put(record)
+
+    def close(self):
+        """
+        Write all queued records, and stop the writer thread. Raises if records were
+        not stored.
+        """
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        if self.error is not None:
+            raise Exception(
+                f"Run store: {self.dropped} records were not stored in {self.path}"
+            ) from self.error
+
+    def _insert(
+        self, connection: sqlite3.Connection, record: Union[QueryRecord, CompileRecord]
+    ):
+        if isinstance(record, QueryRecord):
+            connection.execute(
+                "INSERT INTO queries (run_id, call_id, timestamp, label, persona, "
+                "section, model, route, escalated, input_tokens, output_tokens, "
+                "latency_seconds, system_prompt, user_prompt, response) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.run_id,
+                    record.call_id,
+                    record.timestamp.isoformat(),
+                    record.label,
+                    persona_of_label(record.label),
+                    record.section,
+                    record.model,
+                    record.route,
+                    int(record.escalated),
+                    record.input_tokens,
+                    record.output_tokens,
+                    record.latency_seconds,
+                    _compress(record.system_prompt),
+                    _compress(record.user_prompt),
+                    _compress(record.response),
+                ),
+            )
+        else:
+            connection.execute(
+                "INSERT INTO compiles (run_id, timestamp, label, status, returncode, "
+                "succeeded, seconds, stdout, stderr) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.run_id,
+                    record.timestamp.isoformat(),
+                    record.label,
+                    record.status,
+                    record.returncode,
+                    int(record.succeeded),
+                    record.seconds,
+                    _compress(record.stdout),
+                    _compress(record.stderr),
+                ),
+            )
+
+    def _write(self):
+        # write records in batches (one transaction for the records queued so far).
+        # After an error, the queue is still drained (and the records are dropped)
+        connection: Optional[sqlite3.Connection] = None
+        closed: bool = False
+        while not closed:
+            batch = [self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get())
+            closed = None in batch
+            records = [record for record in batch if record is not None]
+
+            if self.error is None:
+                try:
+                    if connection is None:
+                        connection = sqlite3.connect(self.path)
+                    with connection:
+                        for record in records:
+                            self._insert(connection, record)
+                    continue
+                except Exception as e:
+                    print(
+                        f"Run store: writing to {self.path} failed ({e!r}), "
+                        "later records are not stored"
+                    )
+                    with self._lock:
+                        self.error = e
+            with self._lock:
+                self.dropped += len(records)
+
+        if connection is not None:
+            connection.close()
+
+    def summary(self) -> str:
+        return (
+            f"--- Run store ---\n"
+            f" - Run id: {self.run_id}\n"
+            f" - Stored: {self.queries} queries, {self.compiles} compiles "
+            f"(in {self.path})"
+        ) + (
+            f"\n - Not stored: {self.dropped} records ({self.error!r})"
+            if self.error is not None
+            else ""
+        )
+
+
+def export_text_logs(
+    path: Path, output_directory: Path, run_id: Optional[str] = None
+) -> list[Path]:
+    """
+    Write the text log of each query in the run store (of one run, or all runs) to
+    'output_directory', as written by GenAI clients without a run store. Existing
+    logs with the same name are overwritten.
+
+    Returns:
+        Paths of the written logs.
+    """
+    output_directory.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(path)
+    try:
+        rows = connection.execute(
+            "SELECT call_id, timestamp, label, system_prompt, user_prompt, response "
+            "FROM queries WHERE ? IS NULL OR run_id = ? ORDER BY id",
+            (run_id, run_id),
+        ).fetchall()
+    finally:
+        connection.close()
+
+    written: list[Path] = []
+    names: set[str] = set()
+    for call_id, timestamp, label, system_prompt, user_prompt, response in rows:
+        # queries of different runs may have the same name
+        for attempt in itertools.count():
+            name = query_log_filename(
+                datetime.datetime.fromisoformat(timestamp),
+                call_id,
+                label,
+                f"-{attempt}" if attempt > 0 else "",
+            )
+            if name not in names:
+                break
+        names.add(name)
+        log_path = output_directory / name
+        log_path.write_text(
+            query_log_text(
+                call_id,
+                _decompress(system_prompt),
+                _decompress(user_prompt),
+                _decompress(response),
+            )
+        )
+        written.append(log_path)
+    return written
+
+
+def args():
+    parser = ArgumentParser(description="Export text logs of queries in a run store")
+    parser.add_argument(
+        "--run_store",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--output_directory",
+        required=True,
+        type=Path,
+    )
+    parser.add_argument(
+        "--run_id",
+        required=False,
+        type=str,
+        default=None,
+        help="Only export the queries of this run (default: all runs).",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logs = export_text_logs(
+        args().run_store, args().output_directory, run_id=args().run_id
+    )
+    print(f"Exported {len(logs)} query logs to {args().output_directory}")
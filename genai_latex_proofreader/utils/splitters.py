@@ -1,9 +1,105 @@
-from typing import Callable, Optional, TypeVar
+from typing import Callable, Optional, Sequence, TypeVar
 
 A = TypeVar("A")
 B = TypeVar("B")
 
 
+# --- Index based splitters ---
+#
+# The functions below do not copy the input. Rather, they return index ranges
+# (python `range` objects) into the input sequence. The list based splitters further
+# below are thin wrappers around these.
+
+
+def _find_first(
+    xs: Sequence[A], f: Callable[[A], Optional[B]], start: int
+) -> tuple[int, Optional[B]]:
+    """
+    Return (index, f(xs[index])) for the first index >= start where 'f' returns a
+    non-null value. If there is no such index, return (len(xs), None).
+    """
+    for idx in range(start, len(xs)):
+        if (b := f(xs[idx])) is not None:
+            return idx, b
+
+    return len(xs), None
+
+
+def split_indices_at_lambdas(
+    xs: Sequence[A], split_lambdas: list[Callable[[A], Optional[B]]]
+) -> tuple[range, list[tuple[B, range]]]:
+    """
+    Index based version of split_list_at_lambdas.
+
+    Returns:
+        A tuple with the index range of the first part (before the first split), and
+        a list of tuples containing the non-NULL values returned by the lambdas and
+        the index ranges of the corresponding split parts (excluding the split
+        entries themselves).
+
+    No recursion. Entries up to the last match are scanned once, but a lambda that
+    does not match scans all remaining entries before the next lambda is tried from
+    the same position. The worst case is O(n * k) lambda calls (for n entries and k
+    lambdas), eg. when most lambdas do not match.
+    """
+    head_end: Optional[int] = None
+    splits: list[tuple[int, B]] = []
+
+    start: int = 0
+    for split_lambda in split_lambdas:
+        idx, b = _find_first(xs, split_lambda, start)
+        if b is None:
+            # lambda did not find a match (split point), so skip to the next lambda
+            continue
+
+        if head_end is None:
+            head_end = idx
+        splits.append((idx, b))
+        start = idx + 1
+
+    return _to_ranges(len(xs), head_end, splits)
+
+
+def split_indices_at_lambda(
+    xs: Sequence[A], split_lambda: Callable[[A], Optional[B]]
+) -> tuple[range, list[tuple[B, range]]]:
+    """
+    Index based version of split_list_at_lambda: a single pass over 'xs'.
+    """
+    head_end: Optional[int] = None
+    splits: list[tuple[int, B]] = []
+
+    for idx, a in enumerate(xs):
+        if (b := split_lambda(a)) is not None:
+            if head_end is None:
+                head_end = idx
+            splits.append((idx, b))
+
+    return _to_ranges(len(xs), head_end, splits)
+
+
+def _to_ranges(
+    nr_entries: int, head_end: Optional[int], splits: list[tuple[int, B]]
+) -> tuple[range, list[tuple[B, range]]]:
+    """
+    Convert split points (index of split entry, lambda value) into index ranges.
+    """
+    if head_end is None:
+        return range(0, nr_entries), []
+
+    ends: list[int] = [idx for idx, _ in splits[1:]] + [nr_entries]
+    return range(0, head_end), [
+        (b, range(idx + 1, end)) for (idx, b), end in zip(splits, ends)
+    ]
+
+
+def _slice(xs: Sequence[A], r: range) -> list[A]:
+    return list(xs[r.start : r.stop])
+
+
+# --- List based splitters ---
+
+
 def split_at_first_lambda(
     xs: list[A], f: Callable[[A], Optional[B]]
 ) -> tuple[list[A], Optional[B], list[A]]:
@@ -16,9 +112,9 @@ def split_at_first_lambda(
         [1, 2, 3], None, []:      f returns None for all x in xs.
 
     """
-    for idx, a in enumerate(xs):
-        if (b := f(a)) is not None:
-            return xs[:idx], b, xs[idx + 1 :]
+    idx, b = _find_first(xs, f, 0)
+    if b is not None:
+        return xs[:idx], b, xs[idx + 1 :]
 
     return list(xs), None, []
 
@@ -43,20 +139,8 @@ def split_list_at_lambdas(
     order as the lambdas. If a lambda does not return a non-NULL value, the split
     will not occur and the next lambda will be used to determine the split point.
     """
-    if len(split_lambdas) == 0:
-        return xs, []
-
-    head_lambda, *tail_lambdas = split_lambdas
-    xs_head, b, xs_tail = split_at_first_lambda(xs, head_lambda)
-
-    if b is None:
-        # head_lambda did not find a match (split point), so skip to the next lambda
-        assert xs_head == xs
-        assert xs_tail == []
-        return split_list_at_lambdas(xs, tail_lambdas)
-
-    xs_tail_head, remaining_splits = split_list_at_lambdas(xs_tail, tail_lambdas)
-    return xs_head, [(b, xs_tail_head), *remaining_splits]
+    head, splits = split_indices_at_lambdas(xs, split_lambdas)
+    return _slice(xs, head), [(b, _slice(xs, r)) for b, r in splits]
 
 
 def split_list_at_lambda(
@@ -66,11 +150,5 @@ def split_list_at_lambda(
     Same as split_list_at_lambdas, but with a single lambda function that can split
     input into multiple parts.
     """
-    xs_head, b, xs_tail = split_at_first_lambda(xs, split_lambda)
-
-    if b is None:
-        assert len(xs_tail) == 0
-        return xs, []
-
-    xs_tail_head, remaining_splits = split_list_at_lambda(xs_tail, split_lambda)
-    return xs_head, [(b, xs_tail_head), *remaining_splits]
+    head, splits = split_indices_at_lambda(xs, split_lambda)
+    return _slice(xs, head), [(b, _slice(xs, r)) for b, r in splits]
@@ -0,0 +1,196 @@
+"""
+Lightweight tracing of the stages of a run (eg. parsing, compiles, GenAI queries and
+LaTeX guard fix-ups) with nested spans, that have attributes and durations.
+
+Traces are exported as Chrome trace events (JSON), that can be opened in a trace
+viewer (eg. https://ui.perfetto.dev or chrome://tracing). Spans in the same thread
+are shown nested by their start and end time.
+
+Tracing is disabled by default. Then `span` returns a shared no-op span, and functions
+decorated with `traced` are called directly (the only cost is a check of a global).
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Callable, Iterable, Optional, Type, TypeVar, Union, cast
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Span:
+    """
+    Span of a traced stage (use as a context manager). Attributes can be added while
+    the span is open (eg. the return code of a compile).
+    """
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: dict[str, Any]):
+        self._tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self._start_ns: int = 0
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ):
+        if exc is not None:
+            self.attributes["error"] = repr(exc)
+        self._tracer._record(self, self._start_ns, time.perf_counter_ns())
+
+
+class _NoSpan:
+    # span returned when tracing is disabled
+    def set(self, **attributes: Any):
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """
+    Thread-safe collection of the spans of a run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._origin_ns: int = time.perf_counter_ns()
+        self._events: list[dict[str, Any]] = []
+        self._thread_names: dict[int, str] = {}
+
+    def _record(self, span: Span, start_ns: int, end_ns: int):
+        thread = threading.current_thread()
+        event = {
+            "name": span.name,
+            "ph": "X",  # complete event (with a duration)
+            "ts": (start_ns - self._origin_ns) / 1000,  # microseconds
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": {key: _json_value(value) for key, value in span.attributes.items()},
+        }
+        with self._lock:
+            self._events.append(event)
+            if thread.ident is not None:
+                self._thread_names[thread.ident] = thread.name
+
+    def chrome_trace(self) -> dict[str, Any]:
+        """
+        Return the spans as Chrome trace events.
+        """
+        with self._lock:
+            thread_names = [
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+                for tid, name in self._thread_names.items()
+            ]
+            return {
+                "traceEvents": thread_names + list(self._events),
+                "displayTimeUnit": "ms",
+            }
+
+    def write_chrome_trace(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.chrome_trace()))
+
+    def summary(self) -> str:
+        """
+        Total time and number of spans, per span name. Time in nested spans is
+        included in the time of the enclosing span.
+        """
+        totals: dict[str, tuple[int, float]] = {}
+        with self._lock:
+            for event in self._events:
+                count, seconds = totals.get(event["name"], (0, 0.0))
+                totals[event["name"]] = (count + 1, seconds + event["dur"] / 1e6)
+
+        def _summary() -> Iterable[str]:
+            yield "--- Trace (total time per span) ---"
+            for name, (count, seconds) in sorted(
+                totals.items(), key=lambda item: -item[1][1]
+            ):
+                yield f" - {name}: {seconds:.2f}s ({count} spans)"
+
+        return "\n".join(_summary())
+
+
+def _json_value(value: Any) -> Union[str, int, float, bool, None]:
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+# tracer of the run (None: tracing is disabled)
+_tracer: Optional[Tracer] = None
+
+
+def enable_tracing() -> Tracer:
+    """
+    Enable tracing, and return the tracer where spans are collected.
+    """
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disable_tracing():
+    global _tracer
+    _tracer = None
+
+
+def span(name: str, **attributes: Any) -> Union[Span, _NoSpan]:
+    """
+    Return a span (to use as a context manager) for a stage of the run, eg.:
+
+        with span("compile_latex", label=label) as compile_span:
+            ...
+            compile_span.set(returncode=returncode)
+    """
+    if _tracer is None:
+        return _NO_SPAN
+    return Span(_tracer, name, attributes)
+
+
+def traced(name: Optional[str] = None) -> Callable[[F], F]:
+    """
+    Decorator: calls of the function are traced as spans (named after the function).
+    """
+
+    def _decorator(function: F) -> F:
+        span_name: str = name if name is not None else function.__qualname__
+
+        @functools.wraps(function)
+        def _traced(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with Span(_tracer, span_name, {}):
+                return function(*args, **kwargs)
+
+        return cast(F, _traced)
+
+    return _decorator
@@ -38,7 +38,7 @@ def test_e2e_proofread_empty_paper(tmp_path: Path):
 
     (tmp_path / "input.tex").write_text(to_latex(doc))
 
-    report = proofread_paper(client, doc)
+    report = proofread_paper(client, doc).materialize()
 
     # color package should be loaded in the report
     assert r"\usepackage{color}" in to_latex(report)
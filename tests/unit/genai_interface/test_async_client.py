@@ -0,0 +1,251 @@
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import AsyncIterator, Callable, Optional
+
+import pytest
+
+# the GenAI client requires the Anthropic SDK (and httpx)
+pytest.importorskip("httpx")
+
+from genai_latex_proofreader.genai_interface import anthropic
+from genai_latex_proofreader.genai_interface.anthropic import AsyncGenAIClient
+from genai_latex_proofreader.genai_interface.hedging import QueryCancelled
+from genai_latex_proofreader.genai_interface.spend import SpendGuard, SpendLimits
+from genai_latex_proofreader.utils.run_store import RunStore
+
+
+class _FakeAPI:
+    """
+    Replaces async_make_query: answers with the user prompt after a number of
+    response parts, and records the maximum number of concurrent queries.
+    """
+
+    def __init__(self, parts: int = 5):
+        self.parts = parts
+        self.active: int = 0
+        self.max_active: int = 0
+
+    async def __call__(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        on_usage: Callable[[dict], None] = lambda usage: None,
+        model: str = anthropic.MODEL,
+        cancelled: Optional[threading.Event] = None,
+    ) -> str:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            for part in range(self.parts):
+                if cancelled is not None and cancelled.is_set():
+                    raise QueryCancelled()
+                on_usage({"input_tokens": 10, "output_tokens": part + 1})
+                await asyncio.sleep(0.01)
+            return f"response to {user_prompt}"
+        finally:
+            self.active -= 1
+
+
+def test_concurrency_is_bounded(tmp_path: Path, monkeypatch):
+    api = _FakeAPI()
+    monkeypatch.setattr(anthropic, "async_make_query", api)
+    client = AsyncGenAIClient(tmp_path, max_tokens=1000, max_concurrency=3)
+
+    async def _main() -> list[str]:
+        return await asyncio.gather(
+            *[
+                client.make_query("system", f"prompt {idx}", "Expert")
+                for idx in range(10)
+            ]
+        )
+
+    results = asyncio.run(_main())
+
+    assert results == [f"response to prompt {idx}" for idx in range(10)]
+    assert api.max_active == 3
+    assert client.calls == 10
+    # one log per call (with the same label, in the same second)
+    assert len(list(tmp_path.glob("*.txt"))) == 10
+    assert len(client.usage.queries) == 10
+
+
+def test_identical_queries_in_flight_are_shared(tmp_path: Path, monkeypatch):
+    api = _FakeAPI()
+    monkeypatch.setattr(anthropic, "async_make_query", api)
+    client = AsyncGenAIClient(tmp_path, max_tokens=1000)
+
+    async def _main() -> list[str]:
+        return await asyncio.gather(
+            *[client.make_query("system", "prompt", "Expert") for _ in range(3)]
+        )
+
+    assert asyncio.run(_main()) == 3 * ["response to prompt"]
+    assert len(client.usage.queries) == 1
+    assert client.usage.deduplicated == ["Expert", "Expert"]
+
+
+def test_cancel(tmp_path: Path, monkeypatch):
+    api = _FakeAPI(parts=100)
+    monkeypatch.setattr(anthropic, "async_make_query", api)
+    spend = SpendGuard(SpendLimits(max_output_tokens=100_000))
+    client = AsyncGenAIClient(tmp_path, max_tokens=1000, max_concurrency=2, spend=spend)
+
+    async def _main() -> list:
+        queries = [
+            asyncio.create_task(client.make_query("system", f"prompt {idx}", "Expert"))
+            for idx in range(4)
+        ]
+        await asyncio.sleep(0.05)
+        client.cancel()
+        return await asyncio.gather(*queries, return_exceptions=True)
+
+    results = asyncio.run(_main())
+
+    assert all(isinstance(result, QueryCancelled) for result in results)
+    # the waiting queries were not made
+    assert api.max_active == 2
+    # the reservations of the cancelled queries are replaced by their usage
+    assert spend.output_tokens < 2 * 100
+    assert spend._reserved_output_tokens == 0
+
+
+def test_cancelling_task_closes_query(tmp_path: Path, monkeypatch):
+    api = _FakeAPI(parts=100)
+    monkeypatch.setattr(anthropic, "async_make_query", api)
+    spend = SpendGuard(SpendLimits(max_output_tokens=100_000))
+    client = AsyncGenAIClient(tmp_path, max_tokens=1000, spend=spend)
+
+    async def _main():
+        query = asyncio.create_task(client.make_query("system", "prompt", "Expert"))
+        await asyncio.sleep(0.05)
+        query.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await query
+
+    asyncio.run(_main())
+
+    assert api.active == 0
+    assert spend._reserved_output_tokens == 0
+    assert len(client.usage.queries) == 1
+
+
+def test_cancelling_leader_of_identical_queries(tmp_path: Path, monkeypatch):
+    api = _FakeAPI(parts=10)
+    monkeypatch.setattr(anthropic, "async_make_query", api)
+    client = AsyncGenAIClient(tmp_path, max_tokens=1000)
+
+    async def _main() -> str:
+        leader = asyncio.create_task(client.make_query("system", "prompt", "Expert"))
+        await asyncio.sleep(0.02)
+        follower = asyncio.create_task(client.make_query("system", "prompt", "Expert"))
+        await asyncio.sleep(0.02)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    # the follower makes the query itself
+    assert asyncio.run(_main()) == "response to prompt"
+    assert client.usage.deduplicated == []
+
+
+class _FakeAsyncStream:
+    """
+    Event stream of a response (as messages.stream of the async SDK client).
+    """
+
+    def __init__(self, text_parts: list[str]):
+        self.text_parts = text_parts
+        self.closed: bool = False
+
+    async def __aenter__(self) -> "_FakeAsyncStream":
+        return self
+
+    async def __aexit__(self, *args):
+        self.closed = True
+
+    async def __aiter__(self) -> AsyncIterator[SimpleNamespace]:
+        yield SimpleNamespace(
+            type="message_start",
+            message=SimpleNamespace(
+                usage=SimpleNamespace(input_tokens=100, output_tokens=1)
+            ),
+        )
+        for text in self.text_parts:
+            await asyncio.sleep(0.01)
+            yield SimpleNamespace(
+                type="content_block_delta",
+                delta=SimpleNamespace(type="text_delta", text=text),
+            )
+        yield SimpleNamespace(
+            type="message_delta",
+            usage=SimpleNamespace(output_tokens=len(self.text_parts)),
+        )
+
+
+def test_async_make_query_streams_events(monkeypatch):
+    streams: list[_FakeAsyncStream] = []
+
+    def _stream(**kwargs) -> _FakeAsyncStream:
+        streams.append(_FakeAsyncStream(["x" * 40] * 100))
+        return streams[-1]
+
+    sdk = SimpleNamespace(messages=SimpleNamespace(stream=_stream))
+    monkeypatch.setattr(anthropic, "_async_anthropic_client", lambda: sdk)
+
+    usages: list[dict] = []
+    cancelled = threading.Event()
+
+    async def _main() -> str:
+        query = asyncio.create_task(
+            anthropic.async_make_query(
+                "system", "user", 1000, on_usage=usages.append, cancelled=cancelled
+            )
+        )
+        await asyncio.sleep(0.055)
+        cancelled.set()
+        return await query
+
+    with pytest.raises(QueryCancelled):
+        asyncio.run(_main())
+
+    # the response is closed before its end, and the output tokens are estimated
+    assert streams[0].closed
+    assert usages[0] == {"input_tokens": 100, "output_tokens": 1}
+    assert usages[-1]["input_tokens"] == 100
+    assert 10 * 3 <= usages[-1]["output_tokens"] < 10 * 100
+
+    streams.clear()
+    text = asyncio.run(anthropic.async_make_query("system", "user", 1000))
+    assert text == "x" * 4000
+
+
+def test_queries_are_recorded_in_run_store(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(anthropic, "async_make_query", _FakeAPI())
+    run_store = RunStore(tmp_path / "runs.sqlite", run_id="run-1")
+    client = AsyncGenAIClient(tmp_path / "logs", max_tokens=1000, run_store=run_store)
+
+    async def _main() -> list[str]:
+        return await asyncio.gather(
+            *[
+                client.for_section(f"S{idx}").make_query(
+                    "system", f"prompt {idx}", f"Expert: Proofread 'Section 'S{idx}''"
+                )
+                for idx in range(3)
+            ]
+        )
+
+    asyncio.run(_main())
+    run_store.close()
+
+    # no text logs are written
+    assert list((tmp_path / "logs").iterdir()) == []
+    connection = sqlite3.connect(tmp_path / "runs.sqlite")
+    rows = connection.execute(
+        "SELECT persona, section, model, output_tokens FROM queries ORDER BY section"
+    ).fetchall()
+    assert rows == [("Expert", f"S{idx}", anthropic.MODEL, 5) for idx in range(3)]
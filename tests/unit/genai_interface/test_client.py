@@ -0,0 +1,120 @@
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Iterator
+
+import pytest
+
+# the GenAI client requires the Anthropic SDK (and httpx)
+pytest.importorskip("httpx")
+
+from genai_latex_proofreader.genai_interface import anthropic
+from genai_latex_proofreader.genai_interface.anthropic import GenAIClient
+from genai_latex_proofreader.genai_interface.hedging import Hedger, HedgingPolicy
+from genai_latex_proofreader.genai_interface.spend import SpendGuard, SpendLimits
+
+
+class _FakeStream:
+    """
+    Event stream of a response (as messages.stream of the SDK), with a delay before
+    each part of the text.
+    """
+
+    def __init__(self, text_parts: list[str], delay: float):
+        self.text_parts = text_parts
+        self.delay = delay
+        self.closed: bool = False
+
+    def __enter__(self) -> "_FakeStream":
+        return self
+
+    def __exit__(self, *args):
+        self.closed = True
+
+    def __iter__(self) -> Iterator[SimpleNamespace]:
+        yield SimpleNamespace(
+            type="message_start",
+            message=SimpleNamespace(
+                usage=SimpleNamespace(input_tokens=100, output_tokens=1)
+            ),
+        )
+        for text in self.text_parts:
+            time.sleep(self.delay)
+            yield SimpleNamespace(
+                type="content_block_delta",
+                delta=SimpleNamespace(type="text_delta", text=text),
+            )
+        yield SimpleNamespace(
+            type="message_delta",
+            usage=SimpleNamespace(output_tokens=len(self.text_parts)),
+        )
+
+
+class _FakeSDK:
+    """
+    Replaces the Anthropic client: the first request with the user prompt "slow" is
+    slow, other requests are fast.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.streams: list[_FakeStream] = []
+        self.messages = self
+
+    def stream(self, messages: list[dict], **kwargs) -> _FakeStream:
+        with self.lock:
+            slow = messages[0]["content"] == "slow" and all(
+                stream.delay < 1 for stream in self.streams
+            )
+            stream = _FakeStream(["a", "b", "c"], delay=1 if slow else 0.001)
+            self.streams.append(stream)
+            return stream
+
+
+def test_hedged_query_settles_usage_of_cancelled_request(tmp_path: Path, monkeypatch):
+    sdk = _FakeSDK()
+    monkeypatch.setattr(anthropic, "_anthropic_client", lambda: sdk)
+    spend = SpendGuard(SpendLimits())
+    hedger = Hedger(
+        HedgingPolicy(
+            percentile=0.9, min_samples=3, min_delay_seconds=0.05, max_hedge_fraction=1
+        )
+    )
+    client = GenAIClient(tmp_path, max_tokens=1000, spend=spend, hedging=hedger)
+
+    # latency history
+    for idx in range(3):
+        assert client.make_query("system", f"fast {idx}", "Expert") == "abc"
+
+    # the slow request is hedged, the hedge wins, and the slow request is closed
+    assert client.make_query("system", "slow", "Expert") == "abc"
+    assert (hedger.hedged, hedger.hedge_wins) == (1, 1)
+    time.sleep(1.5)
+    assert len(sdk.streams) == 5
+    assert all(stream.closed for stream in sdk.streams)
+
+    # the usage of the cancelled request is settled and recorded
+    labels = [query.label for query in client.usage.queries]
+    assert sorted(labels) == ["Expert"] * 4 + ["Expert (hedge)"]
+    assert client.usage.input_tokens == 5 * 100
+    assert spend.input_tokens == 5 * 100
+    assert spend.output_tokens == client.usage.output_tokens
+    assert spend.output_tokens >= 4 * 3 + 1
+
+
+def test_aborted_stream_estimates_output_tokens(tmp_path: Path, monkeypatch):
+    stream = _FakeStream(["x" * 40] * 10, delay=0)
+    sdk = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kwargs: stream))
+    monkeypatch.setattr(anthropic, "_anthropic_client", lambda: sdk)
+    spend = SpendGuard(SpendLimits())
+    client = GenAIClient(tmp_path, max_tokens=1000, spend=spend)
+
+    response = client.stream_query("system", "user", "Expert")
+    assert [next(response), next(response)] == ["x" * 40] * 2
+    response.close()
+
+    # 80 characters received (only the output tokens at the start were reported)
+    assert stream.closed
+    assert client.usage.queries[0].output_tokens == 20
+    assert (spend.input_tokens, spend.output_tokens) == (100, 20)
@@ -0,0 +1,82 @@
+import threading
+import time
+from dataclasses import replace
+
+import pytest
+
+from genai_latex_proofreader.genai_interface.hedging import (
+    Hedger,
+    HedgingPolicy,
+    QueryCancelled,
+    percentile,
+)
+
+POLICY = HedgingPolicy(
+    percentile=0.9, min_samples=3, min_delay_seconds=0.01, max_hedge_fraction=0.25
+)
+
+
+def _request(delays: dict[bool, float], cancelled_requests: list[bool]):
+    # request that takes delays[is_hedge] seconds (unless cancelled)
+    def _run(cancelled: threading.Event, is_hedge: bool) -> str:
+        if cancelled.wait(timeout=delays[is_hedge]):
+            cancelled_requests.append(is_hedge)
+            raise QueryCancelled()
+        return "hedge" if is_hedge else "primary"
+
+    return _run
+
+
+def test_percentile():
+    assert percentile([3.0, 1.0, 2.0, 4.0], 0.5) == 2.0
+    assert percentile([3.0, 1.0, 2.0, 4.0], 0.9) == 4.0
+    assert percentile([1.0], 0.0) == 1.0
+
+
+def test_hedged_requests():
+    hedger = Hedger(POLICY)
+    cancelled: list[bool] = []
+
+    # not hedged without enough latency history
+    assert hedger.threshold("route") is None
+    for _ in range(3):
+        assert hedger.run("route", _request({False: 0.02, True: 0}, [])) == "primary"
+    assert hedger.threshold("route") == pytest.approx(0.02, abs=0.02)
+    assert hedger.hedged == 0
+
+    # a slow request is hedged; the hedge wins, and the primary request is cancelled
+    start = time.perf_counter()
+    assert hedger.run("route", _request({False: 5, True: 0.01}, cancelled)) == "hedge"
+    assert time.perf_counter() - start < 1
+    assert (hedger.hedged, hedger.hedge_wins) == (1, 1)
+
+    time.sleep(0.05)
+    assert cancelled == [False]
+
+    # cap on hedged requests: at most a quarter of the queries (1 of 5)
+    assert hedger.run("route", _request({False: 0.2, True: 0}, [])) == "primary"
+    assert (hedger.queries, hedger.hedged) == (5, 1)
+    assert "Hedge won: 1 (100%)" in hedger.summary()
+
+
+def test_hedged_request_failures():
+    hedger = Hedger(replace(POLICY, percentile=0.5, max_hedge_fraction=1.0))
+    for _ in range(3):
+        hedger.run("route", _request({False: 0, True: 0}, []))
+
+    def _failing(fail_primary: bool, fail_hedge: bool):
+        def _run(cancelled: threading.Event, is_hedge: bool) -> str:
+            time.sleep(0.1 if not is_hedge else 0)
+            if fail_hedge if is_hedge else fail_primary:
+                raise RuntimeError("hedge failed" if is_hedge else "primary failed")
+            return "hedge" if is_hedge else "primary"
+
+        return _run
+
+    # a failed hedge does not fail the request
+    assert hedger.run("route", _failing(False, True)) == "primary"
+
+    # if all requests fail, the error of the primary request is raised
+    with pytest.raises(RuntimeError, match="primary failed"):
+        hedger.run("route", _failing(True, True))
+    assert hedger.hedged == 2
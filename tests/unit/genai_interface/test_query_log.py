@@ -0,0 +1,31 @@
+import datetime
+from pathlib import Path
+
+from genai_latex_proofreader.genai_interface.query_log import (
+    query_log_filename,
+    write_query_log,
+)
+
+
+def test_query_log_filename():
+    timestamp = datetime.datetime(2024, 5, 1, 12, 30, 15, 123456)
+    assert (
+        query_log_filename(timestamp, 7, r"Expert: Proofread '$\alpha$' of paper")
+        == "2024-05-01_12-30-15-0007-Expert_Proofread_alpha_of_paper.txt"
+    )
+
+
+def test_logs_of_clients_sharing_directory_do_not_collide(tmp_path: Path):
+    timestamp = datetime.datetime(2024, 5, 1, 12, 30, 15)
+    paths = [
+        write_query_log(tmp_path, timestamp, 0, "Expert", "system", "user", response)
+        for response in ["first", "second", "third"]
+    ]
+
+    assert [path.name for path in paths] == [
+        "2024-05-01_12-30-15-0000-Expert.txt",
+        "2024-05-01_12-30-15-0000-Expert-1.txt",
+        "2024-05-01_12-30-15-0000-Expert-2.txt",
+    ]
+    assert "RESPONSE:" in paths[1].read_text()
+    assert "second" in paths[1].read_text()
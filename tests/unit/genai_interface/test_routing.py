@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from genai_latex_proofreader.genai_interface.routing import (
+    Route,
+    RoutingDecision,
+    RoutingTable,
+    load_routing_table,
+)
+
+
+def test_routing_table():
+    table = RoutingTable(
+        routes={
+            "latex-guard": Route(model="fast", escalate_to="strong"),
+            "English language expert": Route(model="medium", max_tokens=500),
+            "English language expert: Proofread abstract": Route(model="strong"),
+        },
+    )
+
+    assert table.route("latex-guard", "default-model", 2000) == RoutingDecision(
+        route="latex-guard", model="fast", max_tokens=2000, escalated=False
+    )
+    assert table.route("latex-guard", "default-model", 2000, escalated=True) == (
+        RoutingDecision(
+            route="latex-guard", model="strong", max_tokens=2000, escalated=True
+        )
+    )
+
+    # the longest matching prefix is used; max_tokens is at most that of the client
+    assert table.route("English language expert: Proofread section", "d", 2000) == (
+        RoutingDecision(
+            route="English language expert",
+            model="medium",
+            max_tokens=500,
+            escalated=False,
+        )
+    )
+    assert table.route("English language expert: Proofread section", "d", 100) == (
+        RoutingDecision(
+            route="English language expert",
+            model="medium",
+            max_tokens=100,
+            escalated=False,
+        )
+    )
+    assert (
+        table.route("English language expert: Proofread abstract", "d", 2000).model
+        == "strong"
+    )
+
+    # no match (routes without a cascade are not escalated)
+    assert table.route("Domain Expert: ...", "d", 2000, escalated=True) == (
+        RoutingDecision(route="default", model="d", max_tokens=2000, escalated=False)
+    )
+
+
+def test_load_routing_table(tmp_path: Path):
+    path = tmp_path / "routing.json"
+    path.write_text(
+        json.dumps(
+            {
+                "latex-guard": {"model": "fast", "escalate_to": "strong"},
+                "default": {"model": "strong", "max_tokens": 1000},
+            }
+        )
+    )
+    assert load_routing_table(path) == RoutingTable(
+        routes={"latex-guard": Route(model="fast", escalate_to="strong")},
+        default=Route(model="strong", max_tokens=1000),
+    )
+
+    path.write_text(json.dumps({"latex-guard": {"model": "fast", "retries": 2}}))
+    with pytest.raises(ValueError, match="unknown keys"):
+        load_routing_table(path)
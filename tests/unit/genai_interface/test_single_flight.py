@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from genai_latex_proofreader.genai_interface.single_flight import (
+    SingleFlight,
+    prompt_key,
+)
+
+
+def test_prompt_key():
+    assert prompt_key("model", "prompt") == prompt_key("model", "prompt")
+    assert prompt_key("model", "prompt") != prompt_key("model", "prompt.")
+    assert prompt_key("ab", "c") != prompt_key("a", "bc")
+
+
+def test_single_flight_threads():
+    group: SingleFlight[str] = SingleFlight()
+    calls: list[str] = []
+
+    def _call(key: str) -> str:
+        calls.append(key)
+        time.sleep(0.1)
+        return f"response to {key}"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(
+                lambda idx: group.do(f"key {idx % 2}", lambda: _call(f"key {idx % 2}")),
+                range(8),
+            )
+        )
+
+    assert sorted(calls) == ["key 0", "key 1"]
+    assert [response for response, _ in results] == [
+        f"response to key {idx % 2}" for idx in range(8)
+    ]
+    assert sum(shared for _, shared in results) == group.shared == 6
+
+    # calls that are done are not cached
+    assert group.do("key 0", lambda: "again") == ("again", False)
+
+
+def test_single_flight_exceptions():
+    group: SingleFlight[str] = SingleFlight()
+    started = threading.Event()
+
+    def _fail() -> str:
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("query failed")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(group.do, "key", _fail)
+        started.wait()
+        follower = executor.submit(group.do, "key", lambda: "not called")
+
+        for future in [leader, follower]:
+            with pytest.raises(RuntimeError, match="query failed"):
+                future.result()
+    assert group.shared == 1
+
+
+def test_single_flight_asyncio_and_threads():
+    group: SingleFlight[str] = SingleFlight()
+    calls: list[str] = []
+
+    async def _call() -> str:
+        calls.append("async")
+        await asyncio.sleep(0.2)
+        return "response"
+
+    async def _main():
+        # a thread joins the call made by the asyncio tasks
+        def _in_thread() -> tuple[str, bool]:
+            time.sleep(0.05)
+            return group.do("key", lambda: "not called")
+
+        in_thread = asyncio.get_running_loop().run_in_executor(None, _in_thread)
+        return await asyncio.gather(
+            *[group.do_async("key", _call) for _ in range(4)], in_thread
+        )
+
+    results = asyncio.run(_main())
+    assert calls == ["async"]
+    assert [response for response, _ in results] == 5 * ["response"]
+    assert group.shared == 4
+
+
+def test_single_flight_cancelled_leader():
+    group: SingleFlight[str] = SingleFlight()
+    calls: list[str] = []
+
+    def _call(caller: str):
+        async def _run() -> str:
+            calls.append(caller)
+            await asyncio.sleep(0.1)
+            return f"response of {caller}"
+
+        return _run
+
+    async def _main():
+        leader = asyncio.create_task(group.do_async("key", _call("leader")))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(group.do_async("key", _call("follower")))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        # the follower is not cancelled, and makes the call instead
+        assert await follower == ("response of follower", False)
+
+    asyncio.run(_main())
+    assert calls == ["leader", "follower"]
+    assert group.shared == 0
@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from genai_latex_proofreader.genai_interface.spend import (
+    BudgetExceeded,
+    SpendGuard,
+    SpendLimits,
+    TokenPrices,
+)
+
+PRICES = TokenPrices(input_usd_per_mtok=3.0, output_usd_per_mtok=15.0)
+
+# prompt of 100 (estimated) tokens
+PROMPT: str = 400 * "x"
+
+
+def test_token_limits():
+    guard = SpendGuard(SpendLimits(max_input_tokens=250, max_output_tokens=1500))
+
+    first = guard.admit("first", "", PROMPT, max_tokens=1000, prices=PRICES)
+    assert (first.input_tokens, first.max_tokens) == (100, 1000)
+
+    # rerouted with the remaining output tokens (reserved by the first query)
+    second = guard.admit("second", "", PROMPT, max_tokens=1000, prices=PRICES)
+    assert second.max_tokens == 500
+    assert guard.rerouted == ["second"]
+
+    # refused: input tokens would exceed the limit
+    with pytest.raises(BudgetExceeded, match="third"):
+        guard.admit("third", "", PROMPT, max_tokens=100, prices=PRICES)
+    assert guard.refused == ["third"]
+
+    # reservations are replaced by the reported usage
+    guard.settle(first, input_tokens=90, output_tokens=200)
+    guard.settle(second, input_tokens=0, output_tokens=0)
+    assert (guard.input_tokens, guard.output_tokens) == (90, 200)
+    assert (
+        guard.admit("fourth", "", PROMPT, max_tokens=1000, prices=PRICES).max_tokens
+        == 1000
+    )
+
+    assert guard.partial
+    assert " - Refused queries: 1" in guard.summary()
+
+
+def test_cost_limit():
+    # 0.1 USD: eg. 200 input tokens and 6626 output tokens
+    guard = SpendGuard(SpendLimits(max_cost_usd=0.1))
+    first = guard.admit("first", "", PROMPT, max_tokens=4000, prices=PRICES)
+    second = guard.admit("second", "", PROMPT, max_tokens=4000, prices=PRICES)
+    assert (first.max_tokens, second.max_tokens) == (4000, 2626)
+
+    # too few output tokens remain to reroute the query
+    with pytest.raises(BudgetExceeded):
+        guard.admit("third", "", PROMPT, max_tokens=200, prices=PRICES)
+
+    guard.settle(first, input_tokens=100, output_tokens=0)
+    guard.settle(second, input_tokens=100, output_tokens=0)
+    assert guard.cost_usd == pytest.approx(0.0006)
+    assert (
+        guard.admit("fourth", "", PROMPT, max_tokens=4000, prices=PRICES).max_tokens
+        == 4000
+    )
+
+
+def test_cost_limit_with_prices_per_model():
+    guard = SpendGuard(SpendLimits(max_cost_usd=0.003))
+    fast = TokenPrices(input_usd_per_mtok=0.25, output_usd_per_mtok=1.25)
+
+    # the budget is too small for the query with PRICES, but not with 'fast'
+    with pytest.raises(BudgetExceeded):
+        guard.admit("slow", "", PROMPT, max_tokens=200, prices=PRICES)
+    admission = guard.admit("fast", "", PROMPT, max_tokens=2000, prices=fast)
+    assert admission.max_tokens == 2000
+
+    guard.settle(admission, input_tokens=100, output_tokens=1000)
+    assert guard.cost_usd == pytest.approx(fast.cost(100, 1000))
+
+
+def test_admission_is_thread_safe():
+    guard = SpendGuard(SpendLimits(max_output_tokens=10_000))
+
+    def _admit(idx: int) -> int:
+        try:
+            return guard.admit(
+                f"query {idx}", "", PROMPT, max_tokens=1000, prices=PRICES
+            ).max_tokens
+        except BudgetExceeded:
+            return 0
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        admitted = list(executor.map(_admit, range(100)))
+
+    assert sum(admitted) == 10_000
+    assert len(guard.refused) == 90
@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from genai_latex_proofreader.genai_interface.usage import UsageLedger
+
+
+def test_usage_ledger():
+    ledger = UsageLedger()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(
+            executor.map(
+                lambda idx: ledger.record_query(f"query {idx}", 100, 10), range(100)
+            )
+        )
+    ledger.record_context_savings("review", 1000, 300)
+    ledger.record_deduplicated("query 1")
+
+    assert len(ledger.queries) == 100
+    assert (ledger.input_tokens, ledger.output_tokens) == (10_000, 1_000)
+    assert ledger.saved_tokens == 700
+    assert ledger.summary() == "\n".join(
+        [
+            "--- GenAI usage ---",
+            " - Queries: 100",
+            " - Input tokens: 10000",
+            " - Output tokens: 1000",
+            " - Deduplicated: 1 queries (identical to a query in flight)",
+            " - Compressed context: 1 queries, 700 of 1000 (estimated) context "
+            "tokens saved",
+        ]
+    )
+
+
+def test_usage_ledger_routing_summary():
+    ledger = UsageLedger()
+    ledger.record_query("Domain Expert: ...", 100, 10, model="strong", route="default")
+    for escalated in [False, False, False, True]:
+        ledger.record_query(
+            "latex-guard",
+            10,
+            10,
+            model="strong" if escalated else "fast",
+            route="latex-guard",
+            escalated=escalated,
+        )
+
+    assert ledger.summary().split("\n")[-3:] == [
+        " - Routing:",
+        "   - default: 1 queries (strong: 1), 0 escalated (0%)",
+        "   - latex-guard: 4 queries (fast: 3, strong: 1), 1 escalated (25%)",
+    ]
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+import pytest
+
+# the GenAI client requires the Anthropic SDK (and httpx)
+pytest.importorskip("httpx")
+
+from genai_latex_proofreader.genai_interface import anthropic
+from genai_latex_proofreader.genai_interface.anthropic import AsyncGenAIClient
+from genai_latex_proofreader.genai_proofreader.async_reviews import review_section
+from genai_latex_proofreader.genai_proofreader.proofreaders.language_expert import (
+    proofread_one_section_for_language,
+)
+from genai_latex_proofreader.latex_interface.data_model import (
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+)
+
+SECTION_REF = SectionRef(
+    in_appendix=False, title="Results", label=None, generated_label="label:0"
+)
+
+
+def _doc(nr_paragraphs: int) -> LatexDocument:
+    return LatexDocument(
+        pre_matter=[r"\documentclass{article}"],
+        begin_document=[],
+        content_dict={
+            PreSectionRef(in_appendix=False): [],
+            SECTION_REF: [
+                line
+                for idx in range(nr_paragraphs)
+                for line in [*[f"Paragraph {idx}, line {n}." for n in range(5)], ""]
+            ],
+        },
+        bibliography=[],
+    )
+
+
+class _FakeAPI:
+    """
+    Replaces async_make_query: answers with one (numbered) issue after a delay, and
+    records the maximum number of concurrent queries.
+    """
+
+    def __init__(self, delay: float = 0.02):
+        self.delay = delay
+        self.queries: int = 0
+        self.active: int = 0
+        self.max_active: int = 0
+
+    async def __call__(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        on_usage: Callable[[dict], None] = lambda usage: None,
+        model: str = anthropic.MODEL,
+        cancelled: Optional[threading.Event] = None,
+    ) -> str:
+        self.queries += 1
+        query = self.queries
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            on_usage({"input_tokens": 10, "output_tokens": 1})
+            await asyncio.sleep(self.delay)
+            return f"\\begin{{enumerate}}\n\\item Issue {query}\n\\end{{enumerate}}"
+        finally:
+            self.active -= 1
+
+
+def test_review_section_with_async_client(tmp_path: Path, monkeypatch):
+    api = _FakeAPI()
+    monkeypatch.setattr(anthropic, "async_make_query", api)
+    client = AsyncGenAIClient(tmp_path, max_tokens=1000, max_concurrency=2)
+
+    [(ref, report)] = asyncio.run(
+        review_section(
+            proofread_one_section_for_language,
+            client,
+            _doc(8),
+            SECTION_REF,
+            max_chunk_tokens=60,
+        )
+    )
+
+    # the parts of the section are proofread by the async client (at most 2 at a
+    # time), and their reports are merged
+    assert ref == SECTION_REF
+    assert api.queries > 2
+    assert api.max_active == 2
+    assert report.count(r"\item Issue") == api.queries
+    assert len(client.usage.queries) == api.queries
+
+
+def test_cancel_review_section(tmp_path: Path, monkeypatch):
+    api = _FakeAPI(delay=10)
+    monkeypatch.setattr(anthropic, "async_make_query", api)
+    client = AsyncGenAIClient(tmp_path, max_tokens=1000)
+
+    async def _main():
+        review = asyncio.create_task(
+            review_section(
+                proofread_one_section_for_language, client, _doc(1), SECTION_REF
+            )
+        )
+        await asyncio.sleep(0.1)
+        assert api.active == 1
+        review.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await review
+        await asyncio.sleep(0.05)
+
+    asyncio.run(_main())
+
+    # the query of the review is closed
+    assert api.active == 0
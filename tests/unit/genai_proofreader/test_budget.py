@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from genai_latex_proofreader.genai_interface.usage import UsageLedger
+from genai_latex_proofreader.genai_proofreader.budget import RunBudget, TaskMode
+
+
+def test_token_budget():
+    usage = UsageLedger()
+    budget = RunBudget(max_tokens=1000, usage=usage)
+    assert budget.used_fraction() == 0
+    assert budget.task_mode("appendix", priority=2) == TaskMode.FULL
+
+    # 50% used: appendix is degraded
+    usage.record_query("query", input_tokens=400, output_tokens=100)
+    assert budget.task_mode("abstract", priority=0) == TaskMode.FULL
+    assert budget.task_mode("section", priority=1) == TaskMode.FULL
+    assert budget.task_mode("appendix", priority=2) == TaskMode.DEGRADED
+
+    # 90% used: only the abstract is reviewed (degraded)
+    usage.record_query("query", input_tokens=400, output_tokens=0)
+    assert budget.task_mode("abstract", priority=0) == TaskMode.DEGRADED
+    assert budget.task_mode("section", priority=1) == TaskMode.SKIPPED
+    assert budget.task_mode("appendix", priority=2) == TaskMode.SKIPPED
+
+    # priorities without thresholds use the closest lower priority
+    assert budget.task_mode("appendix-2", priority=5) == TaskMode.SKIPPED
+
+    assert budget.tasks(TaskMode.DEGRADED) == ["abstract"]
+    assert sorted(budget.tasks(TaskMode.SKIPPED)) == [
+        "appendix",
+        "appendix-2",
+        "section",
+    ]
+    assert "3 task(s) skipped" in budget.summary()
+
+
+def test_deadline():
+    budget = RunBudget(deadline_seconds=0.05)
+    assert budget.task_mode("section", priority=1) == TaskMode.FULL
+    time.sleep(0.06)
+    assert budget.task_mode("section", priority=1) == TaskMode.SKIPPED
+    assert budget.task_mode("abstract", priority=0) == TaskMode.DEGRADED
+
+
+def test_token_budget_requires_usage():
+    with pytest.raises(ValueError, match="usage ledger"):
+        RunBudget(max_tokens=1000)
@@ -0,0 +1,81 @@
+from genai_latex_proofreader.genai_proofreader.chunking import (
+    chunk_section,
+    estimate_tokens,
+    merge_reports,
+    split_report,
+)
+
+
+def _paragraph(idx: int, nr_lines: int = 5) -> list[str]:
+    return [f"Paragraph {idx}, line {line_idx}." for line_idx in range(nr_lines)]
+
+
+def test_chunk_section_at_paragraphs_and_subsections():
+    lines = [
+        *_paragraph(0),
+        "",
+        *_paragraph(1),
+        r"\subsection{A subsection}",
+        *_paragraph(2),
+    ]
+    paragraph_tokens = sum(estimate_tokens(line) + 1 for line in _paragraph(0))
+
+    # everything fits in one chunk
+    [chunk] = chunk_section(lines, max_tokens=10 * paragraph_tokens)
+    assert chunk.lines == lines and chunk.overlap == 0
+
+    # one paragraph (or subsection) per chunk, without overlap
+    chunks = chunk_section(lines, max_tokens=paragraph_tokens + 10, overlap_tokens=0)
+    assert [chunk.lines for chunk in chunks] == [
+        [*_paragraph(0), ""],
+        _paragraph(1),
+        [r"\subsection{A subsection}", *_paragraph(2)],
+    ]
+
+    # with overlap
+    chunks = chunk_section(lines, max_tokens=paragraph_tokens + 10, overlap_tokens=10)
+    assert [chunk.overlap for chunk in chunks] == [0, 2, 1]
+    assert chunks[1].lines[:2] == [_paragraph(0)[-1], ""]
+    assert chunks[2].lines[0] == _paragraph(1)[-1]
+
+
+def test_chunk_long_paragraph():
+    lines = _paragraph(0, nr_lines=1000)
+    chunks = chunk_section(lines, max_tokens=100, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert [line for chunk in chunks for line in chunk.lines] == lines
+    assert all(
+        sum(estimate_tokens(line) + 1 for line in chunk.lines) <= 100
+        for chunk in chunks
+    )
+
+
+def test_merge_reports():
+    report_1 = r"""\begin{enumerate}
+\item Issue A
+\item Issue B with a list \begin{itemize}\item sub-issue\end{itemize}
+\end{enumerate}
+Summary 1"""
+    report_2 = r"""\begin{enumerate}
+\item   Issue  B with a list \begin{itemize}\item sub-issue\end{itemize}
+\item Issue C
+\end{enumerate}
+Summary 2"""
+
+    assert split_report(report_1) == (
+        ["Issue A", r"Issue B with a list \begin{itemize}\item sub-issue\end{itemize}"],
+        "Summary 1",
+    )
+    assert split_report("No list") == (["No list"], "")
+
+    assert merge_reports([report_1, report_2]) == "\n".join(
+        [
+            r"\begin{enumerate}",
+            r"\item Issue A",
+            r"\item Issue B with a list \begin{itemize}\item sub-issue\end{itemize}",
+            r"\item Issue C",
+            r"\end{enumerate}",
+            "Summary 1",
+            "Summary 2",
+        ]
+    )
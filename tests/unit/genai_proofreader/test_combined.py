@@ -0,0 +1,98 @@
+from pathlib import Path
+
+import pytest
+
+# the GenAI client requires the Anthropic SDK (and httpx)
+pytest.importorskip("httpx")
+
+from genai_latex_proofreader.genai_interface.anthropic import GenAIClient
+from genai_latex_proofreader.genai_proofreader.proofreaders import (
+    domain_expert,
+    language_expert,
+)
+from genai_latex_proofreader.genai_proofreader.proofreaders.combined import (
+    proofread_one_section_combined,
+    split_persona_reports,
+)
+from genai_latex_proofreader.latex_interface.data_model import (
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+)
+
+SECTION_REF = SectionRef(
+    in_appendix=False, title="Introduction", label=None, generated_label="0"
+)
+
+DOC = LatexDocument(
+    pre_matter=[r"\documentclass{article}"],
+    begin_document=[],
+    content_dict={
+        PreSectionRef(in_appendix=False): [],
+        SECTION_REF: ["Some text."],
+    },
+    bibliography=[],
+)
+
+
+class _FakeClient(GenAIClient):
+    def __init__(self, log_output_path: Path, response: str):
+        super().__init__(log_output_path, max_tokens=2000)
+        self.response = response
+        self.user_prompts: list[str] = []
+
+    def make_query(self, system_prompt: str, user_prompt: str, label: str) -> str:
+        self._next_call_id()
+        self.user_prompts.append(user_prompt)
+        return self.response
+
+
+def test_split_persona_reports():
+    response = (
+        "<domain_report>\nDomain report\n</domain_report>\n"
+        "ignored\n<language_report>Language\nreport</language_report>"
+    )
+    assert split_persona_reports(response, ["language", "domain", "other"]) == {
+        "language": "Language\nreport",
+        "domain": "Domain report",
+        "other": None,
+    }
+
+
+def test_proofread_one_section_combined(tmp_path: Path):
+    client = _FakeClient(
+        tmp_path,
+        r"<language_report>\begin{enumerate}\item Typo\end{enumerate}</language_report>",
+    )
+    comments = list(proofread_one_section_combined(client, DOC, SECTION_REF))
+
+    # one query for both personas
+    assert client.calls == 1
+    assert '<reviewer name="language">' in client.user_prompts[0]
+    assert '<reviewer name="domain">' in client.user_prompts[0]
+    assert "Some text." in client.user_prompts[0]
+    # the personas get the same instructions as in separate reviews
+    for prompt in [
+        language_expert.SYSTEM_PROMPT,
+        language_expert.REVIEW_ASPECTS,
+        domain_expert.SYSTEM_PROMPT,
+        domain_expert.REVIEW_ASPECTS,
+    ]:
+        assert prompt.strip() in client.user_prompts[0]
+
+    # one comment per persona
+    assert [ref for ref, _ in comments] == [SECTION_REF, SECTION_REF]
+    assert r"\item Typo" in comments[0][1]
+    assert "English language expert" in comments[0][1]
+    assert "No report returned" in comments[1][1]
+    assert "Domain Expert" in comments[1][1]
+
+    # content before the first section is not reviewed
+    assert (
+        list(
+            proofread_one_section_combined(
+                client, DOC, PreSectionRef(in_appendix=False)
+            )
+        )
+        == []
+    )
@@ -0,0 +1,114 @@
+from pathlib import Path
+
+import pytest
+
+# the GenAI client requires the Anthropic SDK (and httpx)
+pytest.importorskip("httpx")
+
+from genai_latex_proofreader.genai_interface.anthropic import GenAIClient
+from genai_latex_proofreader.genai_proofreader.context import (
+    OMITTED_MARKER,
+    SUMMARY_MARKER,
+    SectionSummaries,
+    section_review_context,
+)
+from genai_latex_proofreader.latex_interface.data_model import (
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+)
+from genai_latex_proofreader.latex_interface.notation_index import (
+    build_notation_index,
+)
+
+
+def _section_ref(idx: int) -> SectionRef:
+    return SectionRef(
+        in_appendix=False, title=f"Section {idx}", label=None, generated_label=f"{idx}"
+    )
+
+
+DOC = LatexDocument(
+    pre_matter=[r"\documentclass{article}"],
+    begin_document=[],
+    content_dict={
+        PreSectionRef(in_appendix=False): ["Before first section"],
+        **{
+            _section_ref(idx): [f"Long content of section {idx}."] * 100
+            for idx in range(3)
+        },
+    },
+    bibliography=[],
+)
+
+
+class _FakeClient(GenAIClient):
+    def __init__(self, log_output_path: Path):
+        super().__init__(log_output_path, max_tokens=2000)
+        self.labels: list[str] = []
+
+    def make_query(self, system_prompt: str, user_prompt: str, label: str) -> str:
+        self._next_call_id()
+        self.labels.append(label)
+        return f"Summary ({label})"
+
+
+def test_full_context(tmp_path: Path):
+    client = _FakeClient(tmp_path)
+    context = section_review_context(client, DOC, _section_ref(1), None, "review")
+    assert SUMMARY_MARKER not in context
+    assert client.calls == 0
+    assert client.usage.savings == []
+
+
+def test_compressed_context(tmp_path: Path):
+    client = _FakeClient(tmp_path)
+    summaries = SectionSummaries(client)
+
+    contexts = [
+        section_review_context(client, DOC, _section_ref(idx), summaries, f"{idx}")
+        for idx in range(3)
+    ]
+
+    # sections are summarized once
+    assert sorted(client.labels) == [
+        f"Summary of section 'Section {idx}'" for idx in range(3)
+    ]
+
+    for idx, context in enumerate(contexts):
+        assert context.count(SUMMARY_MARKER) == 2
+        assert "Before first section" in context
+        assert context.count(f"Long content of section {idx}.") == 100
+        assert f"Summary of section 'Section {idx}'" not in context
+        assert all(
+            f"Long content of section {other_idx}." not in context
+            for other_idx in range(3)
+            if other_idx != idx
+        )
+
+    # savings are recorded in the usage ledger
+    assert [savings.label for savings in client.usage.savings] == ["0", "1", "2"]
+    assert client.usage.saved_tokens > 0
+    assert "context tokens saved" in client.usage.summary()
+
+
+def test_notation_context(tmp_path: Path):
+    client = _FakeClient(tmp_path)
+    context = section_review_context(
+        client,
+        DOC,
+        _section_ref(1),
+        None,
+        "review",
+        notation_index=build_notation_index(DOC),
+    )
+
+    # no queries are needed to build the context
+    assert client.calls == 0
+    assert context.startswith("<notation_index>")
+    assert " - 0: section 'Section 0'" in context
+    assert context.count(OMITTED_MARKER) == 2
+    assert "Before first section" in context
+    assert context.count("Long content of section 1.") == 100
+    assert "Long content of section 0." not in context
+    assert client.usage.saved_tokens > 0
@@ -0,0 +1,144 @@
+from dataclasses import replace
+from pathlib import Path
+
+from genai_latex_proofreader.genai_proofreader.incremental import (
+    IncrementalReviews,
+    ProofreadState,
+    StalenessPolicy,
+    load_state,
+    save_state,
+    section_fingerprint,
+)
+from genai_latex_proofreader.latex_interface.data_model import (
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+)
+
+INTRO = SectionRef(
+    in_appendix=False,
+    title="Introduction",
+    label=None,
+    generated_label="sec:genai:generated:label:0",
+)
+METHOD = SectionRef(
+    in_appendix=False,
+    title="Method",
+    label=None,
+    generated_label="sec:genai:generated:label:1",
+)
+
+DOC = LatexDocument(
+    pre_matter=[r"\documentclass{amsart}"],
+    begin_document=[],
+    content_dict={
+        PreSectionRef(in_appendix=False): [],
+        INTRO: ["Intro text."],
+        METHOD: ["Method text."],
+    },
+    bibliography=[],
+)
+
+
+def _run_reviews(
+    doc: LatexDocument, incremental: IncrementalReviews
+) -> tuple[list[str], list[str]]:
+    """
+    Review each section (with a language and a domain reviewer), and return the
+    executed reviews and all comments.
+    """
+    executed: list[str] = []
+    comments: list[str] = []
+
+    def _reviewer(task: str, section_ref: SectionRef):
+        def _run():
+            executed.append(f"{task}:{section_ref.title}")
+            return [(section_ref, f"{task} comment on {section_ref.title}")]
+
+        return _run
+
+    for section_ref in [INTRO, METHOD]:
+        for task, uses_context in [("language", False), ("domain", True)]:
+            for _, comment in incremental.review(
+                task=task,
+                content_fingerprint=section_fingerprint(doc, section_ref),
+                section_ref=section_ref,
+                run=_reviewer(task, section_ref),
+                uses_context=uses_context,
+            ):
+                comments.append(comment)
+
+    return executed, comments
+
+
+def _rerun(
+    doc: LatexDocument, previous: ProofreadState, policy: StalenessPolicy
+) -> tuple[IncrementalReviews, list[str], list[str]]:
+    incremental = IncrementalReviews(doc, previous=previous, policy=policy)
+    executed, comments = _run_reviews(doc, incremental)
+    return incremental, executed, comments
+
+
+def test_incremental_reviews():
+    first, executed, first_comments = _rerun(DOC, ProofreadState(), StalenessPolicy())
+    assert len(executed) == 4
+    assert (first.reused, first.executed) == (0, 4)
+
+    # unchanged document: all reviews are reused
+    second, executed, comments = _rerun(DOC, first.state, StalenessPolicy())
+    assert executed == []
+    assert comments == first_comments
+
+    # changed section: with default policy, reviews using context are also re-run
+    changed_doc = replace(
+        DOC, content_dict={**DOC.content_dict, METHOD: ["New method text."]}
+    )
+    _, executed, _ = _rerun(changed_doc, second.state, StalenessPolicy())
+    assert executed == ["domain:Introduction", "language:Method", "domain:Method"]
+
+    # reviews with outdated context can be reused for one run
+    third, executed, _ = _rerun(
+        changed_doc, second.state, StalenessPolicy(max_stale_runs=1)
+    )
+    assert executed == ["language:Method", "domain:Method"]
+
+    # ... but not for two runs
+    changed_again_doc = replace(
+        DOC, content_dict={**DOC.content_dict, METHOD: ["Newer method text."]}
+    )
+    _, executed, _ = _rerun(
+        changed_again_doc, third.state, StalenessPolicy(max_stale_runs=1)
+    )
+    assert executed == ["domain:Introduction", "language:Method", "domain:Method"]
+
+
+def test_state_file(tmp_path: Path):
+    incremental, _, _ = _rerun(DOC, ProofreadState(), StalenessPolicy())
+
+    state_file = tmp_path / "state" / "state.json"
+    assert load_state(state_file) == ProofreadState()
+
+    save_state(incremental.state, state_file)
+    assert load_state(state_file) == incremental.state
+
+
+def test_reviews_that_are_not_run_are_kept():
+    first, _, _ = _rerun(DOC, ProofreadState(), StalenessPolicy())
+
+    # the domain review of the method is outdated (the introduction changed), and
+    # is not run (eg. it was skipped for the budget of the run)
+    changed_doc = replace(
+        DOC, content_dict={**DOC.content_dict, INTRO: ["New intro text."]}
+    )
+    second = IncrementalReviews(changed_doc, previous=first.state)
+    method_fingerprint = section_fingerprint(changed_doc, METHOD)
+    assert second.reuse("domain", method_fingerprint, uses_context=True) is None
+    second.keep("domain", method_fingerprint)
+    # unknown reviews are not kept
+    second.keep("domain", section_fingerprint(changed_doc, INTRO))
+
+    assert second.state.reviews == {
+        f"domain:{method_fingerprint}": first.state.reviews[
+            f"domain:{method_fingerprint}"
+        ]
+    }
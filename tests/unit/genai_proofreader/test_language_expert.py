@@ -0,0 +1,160 @@
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+# the GenAI client requires the Anthropic SDK (and httpx)
+pytest.importorskip("httpx")
+
+from genai_latex_proofreader.genai_interface.anthropic import GenAIClient
+from genai_latex_proofreader.genai_proofreader.proofreaders.language_expert import (
+    proofread_one_section_for_language,
+)
+from genai_latex_proofreader.genai_proofreader.structured_report import RenderedLatex
+from genai_latex_proofreader.latex_interface.data_model import (
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+)
+
+
+def _paragraph(idx: int, nr_lines: int = 5) -> list[str]:
+    return [f"Paragraph {idx}, line {line_idx}." for line_idx in range(nr_lines)]
+
+
+class _Tracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active: int = 0
+        self.max_active: int = 0
+        self.sections: list[Optional[str]] = []
+        self.user_prompts: list[str] = []
+
+
+class _FakeClient(GenAIClient):
+    """
+    Client that returns one item per query, and records the maximum number of
+    concurrent queries, and the sections of the queries (shared with the clients
+    returned by for_section).
+    """
+
+    def __init__(self, log_output_path: Path):
+        super().__init__(log_output_path, max_tokens=2000)
+        self.tracker = _Tracker()
+
+    def make_query(self, system_prompt: str, user_prompt: str, label: str) -> str:
+        tracker = self.tracker
+        with tracker.lock:
+            call_id = self._next_call_id()
+            tracker.active += 1
+            tracker.max_active = max(tracker.max_active, tracker.active)
+            tracker.sections.append(self.section)
+            tracker.user_prompts.append(user_prompt)
+        time.sleep(0.05)
+        with tracker.lock:
+            tracker.active -= 1
+        return "\\begin{enumerate}\n\\item Issue in query\n" + (
+            f"\\item Issue {call_id}\n\\end{{enumerate}}"
+        )
+
+
+def test_proofread_long_section_in_parallel(tmp_path: Path):
+    section_ref = SectionRef(
+        in_appendix=False, title="Long", label=None, generated_label="label:0"
+    )
+    doc = LatexDocument(
+        pre_matter=[r"\documentclass{article}"],
+        begin_document=[],
+        content_dict={
+            PreSectionRef(in_appendix=False): [],
+            section_ref: [line for idx in range(8) for line in [*_paragraph(idx), ""]],
+        },
+        bibliography=[],
+    )
+
+    client = _FakeClient(tmp_path)
+    [(ref, report)] = proofread_one_section_for_language(
+        client, doc, section_ref, max_chunk_tokens=60, max_workers=4
+    )
+
+    assert ref == section_ref
+    assert client.calls == 8
+    assert client.tracker.max_active > 1
+    # queries are recorded with the title of the section
+    assert client.tracker.sections == 8 * ["Long"]
+
+    # duplicate issues are merged
+    assert report.count(r"\item Issue in query") == 1
+    assert all(f"\\item Issue {call_id}\n" in report for call_id in range(8))
+
+
+def test_proofread_section_with_short_report(tmp_path: Path):
+    section_ref = SectionRef(
+        in_appendix=False, title="Short", label=None, generated_label="label:0"
+    )
+    doc = LatexDocument(
+        pre_matter=[r"\documentclass{article}"],
+        begin_document=[],
+        content_dict={
+            PreSectionRef(in_appendix=False): [],
+            section_ref: _paragraph(0),
+        },
+        bibliography=[],
+    )
+
+    client = _FakeClient(tmp_path)
+    list(proofread_one_section_for_language(client, doc, section_ref))
+    list(proofread_one_section_for_language(client, doc, section_ref, max_issues=3))
+
+    full, short = client.tracker.user_prompts
+    assert "at most 3 issues" not in full
+    assert short.startswith(full) and "at most 3 issues" in short
+
+
+class _StructuredFakeClient(GenAIClient):
+    def make_structured_query(
+        self, system_prompt: str, user_prompt: str, tool: dict, label: str
+    ) -> dict:
+        call_id = self._next_call_id()
+        assert tool["name"] == "report_issues"
+        return {
+            "issues": [
+                {
+                    "location": "Paragraph 1",
+                    "category": "typo",
+                    "original": "100% of_the cases",
+                    "suggestion": "Write 100% of the cases.",
+                },
+                {"location": f"Part {call_id}", "category": "", "suggestion": "?"},
+            ],
+            "summary": "Summary",
+        }
+
+
+def test_proofread_section_with_structured_output(tmp_path: Path):
+    section_ref = SectionRef(
+        in_appendix=False, title="Long", label=None, generated_label="label:0"
+    )
+    doc = LatexDocument(
+        pre_matter=[r"\documentclass{article}"],
+        begin_document=[],
+        content_dict={
+            PreSectionRef(in_appendix=False): [],
+            section_ref: [line for idx in range(4) for line in [*_paragraph(idx), ""]],
+        },
+        bibliography=[],
+    )
+
+    client = _StructuredFakeClient(tmp_path, max_tokens=2000)
+    [(_, report)] = proofread_one_section_for_language(
+        client, doc, section_ref, max_chunk_tokens=60, structured_output=True
+    )
+
+    assert client.calls == 4
+    assert isinstance(report, RenderedLatex)
+
+    # duplicate issues are merged, and text is escaped
+    assert report.count(r"\item \textbf{Paragraph 1} (typo): ``100\% of\_the") == 1
+    assert all(f"\\item \\textbf{{Part {idx}}} --- ?" in report for idx in range(4))
@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+from genai_latex_proofreader.genai_proofreader.pipeline import PipelineStage
+
+
+def test_pipeline_stage():
+    stage = PipelineStage("square", lambda x: x * x, workers=2, queue_size=4)
+    futures = [stage.submit(x) for x in range(10)]
+    stage.close()
+
+    assert [future.result() for future in futures] == [x * x for x in range(10)]
+    assert stage.stats.processed == 10
+    assert stage.stats.max_queue_depth <= 4
+    assert 0.0 <= stage.stats.utilization <= 1.0
+    assert "Stage square: 10 item(s), 2 worker(s)" in stage.stats.summary()
+
+
+def test_pipeline_stage_queue_is_bounded():
+    release = threading.Event()
+    stage = PipelineStage("blocked", lambda x: release.wait(), queue_size=2)
+
+    submitted: list[int] = []
+
+    def _submit():
+        for x in range(5):
+            stage.submit(x)
+            submitted.append(x)
+
+    thread = threading.Thread(target=_submit)
+    thread.start()
+    time.sleep(0.1)
+
+    # one item is processed (blocked), and two items are in the queue
+    assert submitted == [0, 1, 2]
+    assert stage.stats.queue_depth == 2
+
+    release.set()
+    thread.join()
+    stage.close()
+    assert stage.stats.processed == 5
+
+
+def test_pipeline_stage_errors():
+    def _fail(x):
+        raise ValueError(f"failed {x}")
+
+    stage = PipelineStage("fail", _fail)
+    future = stage.submit(1)
+    stage.close()
+
+    with pytest.raises(ValueError, match="failed 1"):
+        future.result()
+    assert stage.stats.processed == 1
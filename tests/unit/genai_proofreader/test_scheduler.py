@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+from genai_latex_proofreader.genai_interface.usage import UsageLedger
+from genai_latex_proofreader.genai_proofreader.budget import RunBudget
+from genai_latex_proofreader.genai_proofreader.scheduler import (
+    PersonaTask,
+    run_task_graph,
+)
+
+
+class _Tracker:
+    """
+    Track the maximum number of concurrent tasks (in total, and per persona).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running: Counter[str] = Counter()
+        self.max_running: Counter[str] = Counter()
+        self.finished: list[str] = []
+
+    def task(self, name: str, persona: str, delay: float, depends_on=()):
+        def _run(dependencies):
+            with self._lock:
+                for key in [persona, "total"]:
+                    self.running[key] += 1
+                    self.max_running[key] = max(
+                        self.max_running[key], self.running[key]
+                    )
+            time.sleep(delay)
+            with self._lock:
+                for key in [persona, "total"]:
+                    self.running[key] -= 1
+                self.finished.append(name)
+            return (name, sorted(dependencies.items()))
+
+        return PersonaTask(
+            name=name, persona=persona, run=_run, depends_on=tuple(depends_on)
+        )
+
+
+def test_run_task_graph():
+    tracker = _Tracker()
+    tasks = [
+        # slow tasks first (finish last)
+        *[tracker.task(f"language:{idx}", "language", 0.05) for idx in range(4)],
+        *[tracker.task(f"domain:{idx}", "domain", 0.01) for idx in range(4)],
+        tracker.task("editor", "editor", 0, depends_on=["domain:0", "domain:3"]),
+    ]
+    results = run_task_graph(
+        tasks, persona_concurrency={"language": 2, "domain": 1}, max_workers=4
+    )
+
+    # results are in the order of the tasks (not the order they finished)
+    assert list(results.keys()) == [task.name for task in tasks]
+    assert tracker.finished != [task.name for task in tasks]
+
+    assert results["editor"] == (
+        "editor",
+        [("domain:0", ("domain:0", [])), ("domain:3", ("domain:3", []))],
+    )
+    assert tracker.finished.index("editor") > tracker.finished.index("domain:3")
+
+    assert tracker.max_running["language"] == 2
+    assert tracker.max_running["domain"] == 1
+    assert tracker.max_running["total"] <= 4
+
+
+def test_run_task_graph_invalid_graphs():
+    def _task(name: str, depends_on: tuple[str, ...] = ()) -> PersonaTask:
+        return PersonaTask(
+            name=name, persona="p", run=lambda _: None, depends_on=depends_on
+        )
+
+    with pytest.raises(ValueError, match="Duplicate"):
+        run_task_graph([_task("a"), _task("a")])
+
+    with pytest.raises(ValueError, match="unknown task"):
+        run_task_graph([_task("a", ("b",))])
+
+    with pytest.raises(ValueError, match="Cyclic"):
+        run_task_graph([_task("a", ("c",)), _task("b", ("a",)), _task("c", ("b",))])
+
+    with pytest.raises(ValueError, match="No task can be started"):
+        run_task_graph([_task("a")], persona_concurrency={"p": 0})
+
+
+def test_run_task_graph_raises_task_exceptions():
+    def _fail(_):
+        raise RuntimeError("task failed")
+
+    with pytest.raises(RuntimeError, match="task failed"):
+        run_task_graph(
+            [
+                PersonaTask(name="a", persona="p", run=_fail),
+                PersonaTask(name="b", persona="p", run=lambda _: 1, depends_on=("a",)),
+            ]
+        )
+
+
+def test_run_task_graph_with_budget():
+    usage = UsageLedger()
+    started: list[str] = []
+
+    def _task(name: str, priority: int, tokens: int) -> PersonaTask:
+        def _run(mode: str):
+            def _f(_):
+                started.append(name)
+                if mode == "full":
+                    usage.record_query(name, input_tokens=tokens, output_tokens=0)
+                return mode
+
+            return _f
+
+        return PersonaTask(
+            name=name,
+            persona="p",
+            run=_run("full"),
+            priority=priority,
+            degraded_run=_run("degraded"),
+            skipped_run=_run("skipped") if priority > 0 else None,
+        )
+
+    tasks = [
+        _task("appendix", 2, 0),
+        _task("section-1", 1, 500),
+        _task("section-2", 1, 0),
+        _task("abstract", 0, 450),
+    ]
+    results = run_task_graph(
+        tasks, max_workers=1, budget=RunBudget(max_tokens=1000, usage=usage)
+    )
+
+    # tasks are started in order of priority, and degraded or skipped as the
+    # budget is used up (results are in the order of the tasks)
+    assert started == ["abstract", "section-1", "section-2", "appendix"]
+    assert results == {
+        "appendix": "skipped",
+        "section-1": "full",
+        "section-2": "skipped",
+        "abstract": "full",
+    }
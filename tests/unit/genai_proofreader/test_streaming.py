@@ -0,0 +1,63 @@
+from pathlib import Path
+from typing import Generator
+
+import pytest
+
+# the GenAI client requires the Anthropic SDK (and httpx)
+pytest.importorskip("httpx")
+
+from genai_latex_proofreader.genai_interface.anthropic import GenAIClient
+from genai_latex_proofreader.genai_proofreader.streaming import make_checked_query
+
+VALID: str = (
+    r"\begin{enumerate} \item Replace \emph{teh} by \emph{the}. \end{enumerate}"
+)
+OFF_FORMAT: str = r"Sure! Here is my review: \section{Typos} " + "text " * 100
+
+
+class _FakeClient(GenAIClient):
+    """
+    Client that streams the next response (word by word), and records the number of
+    words streamed per query.
+    """
+
+    def __init__(self, log_output_path: Path, responses: list[str]):
+        super().__init__(log_output_path, max_tokens=2000)
+        self.responses = list(responses)
+        self.labels: list[str] = []
+        self.streamed: list[int] = []
+
+    def stream_query(
+        self, system_prompt: str, user_prompt: str, label: str
+    ) -> Generator[str, None, None]:
+        self._next_call_id()
+        self.labels.append(label)
+        self.streamed.append(0)
+        for word in self.responses.pop(0).split(" "):
+            self.streamed[-1] += 1
+            yield word + " "
+
+
+def test_off_format_output_is_aborted_and_retried(tmp_path: Path):
+    client = _FakeClient(tmp_path, [OFF_FORMAT, VALID])
+    result = make_checked_query(client, "system", "user", "Expert")
+
+    assert result == VALID + " "
+    assert client.labels == ["Expert", "Expert (retry 1)"]
+    # the off-format output was aborted after a few words
+    assert client.streamed[0] < 5
+    assert client.streamed[1] == len(VALID.split(" "))
+
+
+def test_output_of_last_attempt_is_not_aborted(tmp_path: Path):
+    client = _FakeClient(tmp_path, [OFF_FORMAT, OFF_FORMAT])
+    result = make_checked_query(client, "system", "user", "Expert", retries=1)
+
+    assert result == OFF_FORMAT + " "
+    assert len(client.labels) == 2
+
+
+def test_valid_output_is_not_retried(tmp_path: Path):
+    client = _FakeClient(tmp_path, [VALID])
+    assert make_checked_query(client, "system", "user", "Expert") == VALID + " "
+    assert client.labels == ["Expert"]
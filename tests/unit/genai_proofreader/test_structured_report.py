@@ -0,0 +1,90 @@
+from genai_latex_proofreader.genai_proofreader.structured_report import (
+    Issue,
+    RenderedLatex,
+    escape_latex,
+    format_rendered_report,
+    parse_issues,
+    render_issues,
+    render_text,
+    trusted_if_without_math,
+)
+
+
+def test_escape_latex():
+    assert escape_latex(r"50% of {a_b} & \c #1 ^ ~ $") == (
+        r"50\% of \{a\_b\} \& \textbackslash{}c \#1 \textasciicircum{} "
+        r"\textasciitilde{} \$"
+    )
+    assert escape_latex("a < b > c | d") == (
+        r"a \textless{} b \textgreater{} c \textbar{} d"
+    )
+
+
+def test_render_text_keeps_math():
+    assert render_text(r"Replace $\kappa_P$ with $\kappa_p$ (50%)") == (
+        r"Replace $\kappa_P$ with $\kappa_p$ (50\%)",
+        [r"$\kappa_P$", r"$\kappa_p$"],
+    )
+
+    # unmatched $ is escaped
+    assert render_text("costs $5") == (r"costs \$5", [])
+
+
+def test_render_issues():
+    issues, summary = parse_issues(
+        {
+            "issues": [
+                {
+                    "location": "Section 1",
+                    "category": "typo",
+                    "original": "teh",
+                    "suggestion": "Replace with 'the'.",
+                },
+                {"location": "Eq. 2", "category": "", "suggestion": "Use $x_1$."},
+                "not an issue",
+            ],
+            "summary": "Good.",
+        }
+    )
+    assert issues == [
+        Issue("Section 1", "typo", "teh", "Replace with 'the'."),
+        Issue("Eq. 2", "", None, "Use $x_1$."),
+    ]
+
+    report, math = render_issues(issues, summary)
+    assert report == "\n".join(
+        [
+            r"\begin{enumerate}",
+            r"\item \textbf{Section 1} (typo): ``teh'' --- Replace with 'the'.",
+            r"\item \textbf{Eq. 2} --- Use $x_1$.",
+            r"\end{enumerate}",
+            "Good.",
+        ]
+    )
+    assert math == ["$x_1$"]
+
+    # reports with math are validated by the LaTeX guard
+    assert not isinstance(trusted_if_without_math(report, math), RenderedLatex)
+    assert isinstance(trusted_if_without_math("Good.", []), RenderedLatex)
+    # non-ASCII characters may fail under pdflatex
+    for text in ["Use \u2192 instead.", "Use \u2264.", "\u8bba\u6587"]:
+        latex, math = render_text(text)
+        assert not isinstance(trusted_if_without_math(latex, math), RenderedLatex)
+
+    assert render_issues([], "") == ("", [])
+
+
+def test_format_rendered_report_escapes_title():
+    task = r"Proofread 'Section 'Proof\footnote{x}\label{y}'' of paper"
+    content = r"Section 'Proof\footnote{x}\label{y}'"
+
+    # the title (in the label, task and content) of a trusted report is escaped
+    report = format_rendered_report("Good.", [], "Expert", task, content)
+    assert isinstance(report, RenderedLatex)
+    assert r"\footnote" not in report and r"\label" not in report
+    assert report.count(r"Proof\textbackslash{}footnote\{x\}") == 4
+
+    # a report with math is validated by the LaTeX guard (with the title as is)
+    report = format_rendered_report("Use $x$.", ["$x$"], "Expert", task, content)
+    assert not isinstance(report, RenderedLatex)
+    assert report.count(r"Proof\footnote{x}\label{y}") == 4
@@ -0,0 +1,74 @@
+from dataclasses import replace
+
+from genai_latex_proofreader.latex_interface.data_model import (
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+    clear_render_cache,
+    render_content_dict,
+    to_latex,
+)
+from genai_latex_proofreader.proofread_comments.add_comments import CommentOverlay
+
+
+def _section_ref(idx: int, in_appendix: bool) -> SectionRef:
+    return SectionRef(
+        in_appendix=in_appendix,
+        title=f"Section {idx}",
+        label=None,
+        generated_label=f"label:{idx}",
+    )
+
+
+DOC = LatexDocument(
+    pre_matter=[r"\documentclass{article}"],
+    begin_document=[],
+    content_dict={
+        PreSectionRef(in_appendix=False): [],
+        _section_ref(0, False): ["First line", "", "Last line"],
+        _section_ref(1, False): [""],
+        PreSectionRef(in_appendix=True): ["Before appendix section"],
+        _section_ref(2, True): ["Appendix"],
+    },
+    bibliography=[r"\bibliography{refs}"],
+)
+
+
+def _uncached_to_latex(doc: LatexDocument) -> str:
+    return "\n".join(
+        [
+            *doc.pre_matter,
+            r"\begin{document}",
+            *doc.begin_document,
+            r"\maketitle",
+            *render_content_dict(doc.filter_content_dict(is_appendix=False)),
+            r"\appendix",
+            *render_content_dict(doc.filter_content_dict(is_appendix=True)),
+            *doc.bibliography,
+            r"\end{document}",
+        ]
+    )
+
+
+def test_to_latex_is_cached():
+    clear_render_cache()
+    latex = to_latex(DOC)
+    assert latex == _uncached_to_latex(DOC)
+    assert to_latex(DOC) is latex
+
+    # an equal (but new) document is rendered to the same string
+    assert to_latex(replace(DOC)) == latex
+
+
+def test_to_latex_of_derived_documents():
+    clear_render_cache()
+    to_latex(DOC)
+
+    overlay = CommentOverlay(DOC)
+    for idx, section_ref in enumerate(DOC.content_dict.keys()):
+        overlay = overlay.add(section_ref, [f"Comment {idx}"])
+        doc = overlay.materialize()
+        assert to_latex(doc) == _uncached_to_latex(doc)
+
+    # rendering the derived documents did not change the base document
+    assert to_latex(DOC) == _uncached_to_latex(DOC)
@@ -0,0 +1,143 @@
+from pathlib import Path
+
+import pytest
+
+from genai_latex_proofreader.latex_interface.data_model import SectionRef, to_latex
+from genai_latex_proofreader.latex_interface.includes import (
+    TokenizedFileCache,
+    expand_includes,
+)
+from genai_latex_proofreader.latex_interface.parser import parse_latex_from_files
+
+MAIN_FILE = Path("paper") / "main.tex"
+
+MAIN_TEX = r"""\documentclass{amsart}
+\begin{document}
+\maketitle
+\input{sections/intro}
+\include{sections/method.tex}
+\end{document}"""
+
+INTRO_TEX = r"""\section{Introduction}
+\label{sec:intro}
+Some text.
+\input{sections/details}"""
+
+DETAILS_TEX = r"""Some details."""
+
+METHOD_TEX = r"""\section{Method}
+Method text."""
+
+
+def _files(**overrides: str) -> dict[Path, bytes]:
+    files: dict[str, str] = {
+        "main.tex": MAIN_TEX,
+        "sections/intro.tex": INTRO_TEX,
+        "sections/details.tex": DETAILS_TEX,
+        "sections/method.tex": METHOD_TEX,
+        **overrides,
+    }
+    return {
+        MAIN_FILE.parent / name: content.encode("utf-8")
+        for name, content in files.items()
+    }
+
+
+def test_expand_nested_includes():
+    files = _files()
+    doc = parse_latex_from_files(files, MAIN_FILE, cache=TokenizedFileCache())
+
+    assert to_latex(doc).replace(
+        r"\label{sec:genai:generated:label:0}" + "\n", ""
+    ).replace(r"\label{sec:genai:generated:label:1}" + "\n", "") == "\n".join(
+        [
+            r"\documentclass{amsart}",
+            r"\begin{document}",
+            r"\maketitle",
+            r"\section{Introduction}",
+            r"\label{sec:intro}",
+            "Some text.",
+            "Some details.",
+            r"\section{Method}",
+            "Method text.",
+            r"\end{document}",
+        ]
+    )
+
+    # section source files
+    assert doc.source_index is not None
+    files_by_title = {
+        ref.title: path
+        for ref, path in doc.source_index.section_files.items()
+        if isinstance(ref, SectionRef)
+    }
+    assert files_by_title == {
+        "Introduction": MAIN_FILE.parent / "sections" / "intro.tex",
+        "Method": MAIN_FILE.parent / "sections" / "method.tex",
+    }
+
+    # file graph
+    graph = doc.source_index.file_graph
+    assert graph is not None
+    assert graph.includes[MAIN_FILE] == (
+        MAIN_FILE.parent / "sections" / "intro.tex",
+        MAIN_FILE.parent / "sections" / "method.tex",
+    )
+    assert graph.includes[MAIN_FILE.parent / "sections" / "intro.tex"] == (
+        MAIN_FILE.parent / "sections" / "details.tex",
+    )
+
+
+def test_no_expansion():
+    doc = parse_latex_from_files(_files(), MAIN_FILE, expand_includes=False)
+    assert r"\input{sections/intro}" in to_latex(doc)
+
+
+def test_subfile_and_missing_file():
+    files = _files(
+        **{
+            "main.tex": MAIN_TEX.replace(
+                r"\include{sections/method.tex}",
+                "\\subfile{sections/method}\n\\input{not/provided}",
+            ),
+            "sections/method.tex": "\n".join(
+                [
+                    r"\documentclass[../main.tex]{subfiles}",
+                    r"\begin{document}",
+                    METHOD_TEX,
+                    r"\end{document}",
+                ]
+            ),
+        }
+    )
+    doc = parse_latex_from_files(files, MAIN_FILE, cache=TokenizedFileCache())
+
+    latex = to_latex(doc)
+    assert r"\documentclass[../main.tex]{subfiles}" not in latex
+    assert "Method text." in latex
+    assert r"\input{not/provided}" in latex
+    assert latex.count(r"\begin{document}") == 1
+
+
+def test_cyclic_includes():
+    files = _files(**{"sections/details.tex": r"\input{sections/intro}"})
+    with pytest.raises(Exception, match="Cyclic inclusion"):
+        expand_includes(files, MAIN_FILE, TokenizedFileCache())
+
+
+def test_cache_and_changed_files():
+    cache = TokenizedFileCache()
+    first = expand_includes(_files(), MAIN_FILE, cache)
+    assert (cache.hits, cache.misses) == (0, 4)
+
+    # only the modified file is tokenized again
+    second = expand_includes(
+        _files(**{"sections/details.tex": "Other details."}), MAIN_FILE, cache
+    )
+    assert (cache.hits, cache.misses) == (3, 5)
+    assert "Other details." in second.tokenized.text
+
+    assert second.file_graph.changed_files(first.file_graph) == {
+        MAIN_FILE.parent / "sections" / "details.tex"
+    }
+    assert first.file_graph.changed_files(first.file_graph) == set()
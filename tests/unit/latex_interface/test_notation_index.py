@@ -0,0 +1,101 @@
+from genai_latex_proofreader.latex_interface.data_model import SectionRef
+from genai_latex_proofreader.latex_interface.notation_index import (
+    MacroDefinition,
+    build_notation_index,
+    replace_unknown_references,
+    to_prompt,
+    unknown_references,
+)
+from genai_latex_proofreader.latex_interface.parser import parse_from_latex
+
+TEST_DOC = r"""\documentclass{amsart}
+\newcommand{\R}{\mathbb{R}}
+\newcommand\norm[1]{\left\| #1 \right\|}
+\def\eps{\varepsilon}
+\DeclareMathOperator{\tr}{tr}
+\newtheorem{axiom}{Axiom}
+
+\begin{document}
+
+\begin{abstract}
+My abstract
+\end{abstract}
+
+\maketitle
+
+\section{Introduction}
+\label{sec:introduction}
+A \emph{pseudo-Riemann metric} is a symmetric tensor.
+
+\begin{definition}[Metric]
+\label{def:metric}
+A \emph{metric} on $N$ is ...
+\end{definition}
+
+\section{Main result}
+The \emph{Metric} is used in
+\begin{equation}
+\label{eq:main}
+\tr g = 0.
+\end{equation}
+
+\begin{axiom}
+\label{ax:one}
+Some axiom.
+\end{axiom}
+
+\end{document}"""
+
+
+def test_notation_index():
+    doc = parse_from_latex(TEST_DOC)
+    index = build_notation_index(doc)
+    section_refs = [ref for ref in doc.content_dict if isinstance(ref, SectionRef)]
+
+    assert index.macros == [
+        MacroDefinition(name=r"\R", nr_args=0, definition=r"\mathbb{R}"),
+        MacroDefinition(name=r"\norm", nr_args=1, definition=r"\left\| #1 \right\|"),
+        MacroDefinition(name=r"\eps", nr_args=0, definition=r"\varepsilon"),
+        MacroDefinition(name=r"\tr", nr_args=0, definition="tr"),
+    ]
+
+    assert [
+        (statement.kind, statement.title, statement.label)
+        for statement in index.statements
+    ] == [("definition", "Metric", "def:metric"), ("axiom", None, "ax:one")]
+
+    assert {label: entry.environment for label, entry in index.labels.items()} == {
+        "sec:introduction": None,
+        "sec:genai:generated:label:0": None,
+        "def:metric": "definition",
+        "sec:genai:generated:label:1": None,
+        "eq:main": "equation",
+        "ax:one": "axiom",
+    }
+    assert index.labels["eq:main"].excerpt == (
+        r"\begin{equation} \label{eq:main} \tr g = 0. \end{equation}"
+    )
+    assert index.labels["eq:main"].section_ref == section_refs[1]
+
+    # terms are only included at their first use
+    assert [(term.term, term.section_ref) for term in index.terms] == [
+        ("pseudo-Riemann metric", section_refs[0]),
+        ("metric", section_refs[0]),
+    ]
+
+    prompt = to_prompt(index)
+    assert r" - \norm (with 1 arguments): \left\| #1 \right\|" in prompt
+    assert " - eq:main (equation in section 'Main result'): " in prompt
+    assert " - sec:introduction: section 'Introduction'" in prompt
+    assert " - pseudo-Riemann metric (section 'Introduction')" in prompt
+
+
+def test_unknown_references():
+    index = build_notation_index(parse_from_latex(TEST_DOC))
+
+    latex = r"See \ref{sec:introduction}, \eqref{eq:typo} and \cref{eq:main,ax:two}."
+    assert unknown_references(index, latex) == ["eq:typo", "ax:two"]
+    assert replace_unknown_references(index, latex) == (
+        r"See \ref{sec:introduction}, \textbf{[?~\detokenize{eq:typo}]} and "
+        r"\textbf{[?~\detokenize{eq:main,ax:two}]}."
+    )
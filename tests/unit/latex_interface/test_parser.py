@@ -3,7 +3,11 @@ from typing import Iterable
 
 import pytest
 
-from genai_latex_proofreader.latex_interface.data_model import to_latex, to_summary
+from genai_latex_proofreader.latex_interface.data_model import (
+    SectionRef,
+    to_latex,
+    to_summary,
+)
 from genai_latex_proofreader.latex_interface.parser import (
     BIBLIOGRAPHY_STARTS,
     parse_from_latex,
@@ -224,3 +228,64 @@ My abstract
                 )
 
                 validate_parser(latex_doc)
+
+
+def test_latex_parser_section_commands_with_optional_and_multiline_arguments():
+    latex_doc = r"""\documentclass{article}
+\begin{document}
+\maketitle
+Before first section. \section[Short]{Introduction} % A comment
+\label{sec:intro}
+Text with 50\% of a \label{eq:in:text}.
+\begin{equation}
+\label{eq:1}
+\end{equation}
+\section{A title
+spanning two lines}
+\begin{equation}\label{eq:2}\end{equation}
+\end{document}"""
+    doc = parse_from_latex(latex_doc)
+    pre_section, intro, second = doc.content_dict.keys()
+
+    assert doc.content_dict[pre_section] == ["Before first section."]
+    assert isinstance(intro, SectionRef)
+    assert (intro.title, intro.short_title, intro.label) == (
+        "Introduction",
+        "Short",
+        "sec:intro",
+    )
+    assert doc.content_dict[intro][1] == r"Text with 50\% of a \label{eq:in:text}."
+
+    # labels in equations are not section labels
+    assert isinstance(second, SectionRef)
+    assert (second.title, second.short_title, second.label) == (
+        "A title\nspanning two lines",
+        None,
+        None,
+    )
+
+    assert r"\section[Short]{Introduction}" in to_latex(doc)
+
+
+def test_latex_parser_source_index():
+    doc = parse_from_latex(TEST_DOC)
+    assert doc.source_index is not None
+
+    lines = TEST_DOC.split("\n")
+    for section_ref, span in doc.source_index.sections.items():
+        if isinstance(section_ref, SectionRef):
+            assert lines[span.start_line] == rf"\section{{{section_ref.title}}}"
+            assert TEST_DOC[span.start : span.end].startswith(r"\section")
+
+    assert set(doc.source_index.labels.keys()) == {
+        "sec:introduction",
+        "sec:main:theorem",
+        "sec:conclusions",
+        "sec:more:conclusions",
+        "sec:app1",
+    }
+    assert [env.name for env in doc.source_index.environments] == [
+        "document",
+        "abstract",
+        "proof",
+    ]
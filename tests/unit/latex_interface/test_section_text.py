@@ -0,0 +1,79 @@
+import pytest
+
+from genai_latex_proofreader.latex_interface.data_model import (
+    LatexDocument,
+    PreSectionRef,
+    SectionRef,
+)
+from genai_latex_proofreader.latex_interface.section_text import (
+    SectionText,
+    section_text,
+)
+
+
+@pytest.mark.parametrize(
+    "lines",
+    [
+        [],
+        [""],
+        ["", ""],
+        ["One line"],
+        ["First", "", "Last ∑"],
+        ["A multi-line\ncomment", "Next line"],
+    ],
+)
+def test_section_text_is_a_list_view(lines: list[str]):
+    text = SectionText(lines)
+
+    assert text == lines
+    assert list(text) == lines
+    assert len(text) == text.nr_lines == len(lines)
+    assert text[:] == lines
+    assert [text[idx] for idx in range(-len(lines), len(lines))] == lines + lines
+    assert all(line in text for line in lines)
+    assert "Not a line" not in text
+    assert text.text == "\n".join(lines)
+    assert text.nr_bytes == len("\n".join(lines).encode("utf-8"))
+
+    with pytest.raises(IndexError):
+        text[len(lines)]
+
+    # equal lines give equal (and equally hashed) section texts
+    assert SectionText(list(lines)) == text
+    assert hash(SectionText(list(lines))) == hash(text)
+    assert SectionText(list(lines)).content_hash == text.content_hash
+    assert section_text(text) is text
+
+
+def test_section_text_hashes_depend_on_lines():
+    texts = [
+        SectionText([]),
+        SectionText([""]),
+        SectionText(["a", "b"]),
+        SectionText(["a\nb"]),
+        SectionText(["a\nb", "c"]),
+        SectionText(["a", "b\nc"]),
+    ]
+    assert len(set(t.content_hash for t in texts)) == len(texts)
+    assert len(set(texts)) == len(texts)
+
+
+def test_document_parts_are_section_texts():
+    section_ref = SectionRef(
+        in_appendix=False, title="Intro", label=None, generated_label="label:0"
+    )
+    doc = LatexDocument(
+        pre_matter=[r"\documentclass{article}"],
+        begin_document=[],
+        content_dict={PreSectionRef(in_appendix=False): [], section_ref: ["Hello"]},
+        bibliography=[],
+    )
+    assert isinstance(doc.pre_matter, SectionText)
+    assert isinstance(doc.content_dict[section_ref], SectionText)
+    assert doc.content_dict[section_ref] == ["Hello"]
+    assert doc.section_text(section_ref).nr_bytes == 5
+    assert (doc.nr_lines, doc.nr_bytes) == (2, len(r"\documentclass{article}") + 5)
+
+    # refs are slotted
+    assert not hasattr(section_ref, "__dict__")
+    assert not hasattr(PreSectionRef(in_appendix=False), "__dict__")
@@ -0,0 +1,66 @@
+import pytest
+
+from genai_latex_proofreader.latex_interface.stream_check import (
+    IncrementalLatexChecker,
+    OffFormatOutput,
+)
+
+REPORT: str = r"""
+\begin{enumerate}
+\item Replace \emph{teh} by \emph{the} (eg. in $\{x\} \cup \{y\}$). % a comment {
+\item Use \textbf{consistent} notation, see Section~\ref{sec:intro}. \\
+\end{enumerate}
+Summary: a {\bf good} section.
+"""
+
+
+def _feed(text: str, chunk_size: int) -> IncrementalLatexChecker:
+    checker = IncrementalLatexChecker()
+    for idx in range(0, len(text), chunk_size):
+        checker.feed(text[idx : idx + chunk_size])
+    return checker
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1000])
+def test_valid_report(chunk_size: int):
+    assert _feed(REPORT, chunk_size).finish() == REPORT
+
+
+@pytest.mark.parametrize(
+    "text, error",
+    [
+        ("Here is my report:\n" + REPORT, "does not start with"),
+        (r"\begin{itemize}", "does not start with"),
+        (r"\begin{enumerate} \item a \section{Typos}", "Sectioning command"),
+        (r"\begin{enumerate} \item a \subsection*{Typos}", "Sectioning command"),
+        (r"\begin{enumerate} \item a \end{itemize}", "does not match"),
+        (r"\begin{enumerate} \item a} b", "Unbalanced closing brace"),
+        (r"\begin{enumerate} \end{enumerate} \end{enumerate}", "without"),
+    ],
+)
+def test_off_format_output_is_detected_early(text: str, error: str):
+    for chunk_size in [1, 5]:
+        with pytest.raises(OffFormatOutput, match=error):
+            # the error is raised before the end of the output (no finish)
+            _feed(text + " more text", chunk_size)
+
+
+def test_incomplete_output():
+    checker = _feed(r"\begin{enumerate} \item {a", 4)
+    with pytest.raises(OffFormatOutput, match="unclosed brace"):
+        checker.finish()
+
+    checker = _feed(r"\begin{enumerate} \item a", 4)
+    with pytest.raises(OffFormatOutput, match="Unclosed environments"):
+        checker.finish()
+
+    with pytest.raises(OffFormatOutput, match="does not start with"):
+        _feed(r"\begin{enum", 4).finish()
+
+
+def test_commands_split_across_parts_are_not_checked_early():
+    checker = IncrementalLatexChecker(required_prefix=None)
+    checker.feed(r"\sec")
+    checker.feed(r"tionmark{x} \subsec")
+    with pytest.raises(OffFormatOutput, match="Sectioning"):
+        checker.feed("tion{x}")
@@ -0,0 +1,77 @@
+from genai_latex_proofreader.latex_interface.tokenizer import TokenKind, tokenize
+
+
+def test_tokenize_commands_with_arguments():
+    text = "\n".join(
+        [
+            r"\section[Short]{A long",
+            r"  title} % comment",
+            r"Text with \label{sec:foo} and 50\% of \emph{this}.",
+        ]
+    )
+    tokens = tokenize(text).tokens
+
+    assert [(t.kind, t.name) for t in tokens] == [
+        (TokenKind.COMMAND, "section"),
+        (TokenKind.COMMENT, "% comment"),
+        (TokenKind.COMMAND, "label"),
+    ]
+
+    section, comment, label = tokens
+    assert section.optional_args == ("Short",)
+    assert section.args == ("A long\n  title",)
+    assert (section.span.start_line, section.span.end_line) == (0, 1)
+    assert text[section.span.start : section.span.end] == (
+        "\\section[Short]{A long\n  title}"
+    )
+
+    assert comment.span.start_line == comment.span.end_line == 1
+    assert label.args == ("sec:foo",)
+    assert label.span.start_line == 2
+
+
+def test_tokenize_environments():
+    text = "\n".join(
+        [
+            r"\begin{document}",
+            r"\begin{equation}\label{eq:1}",
+            r"x = 1",
+            r"\end{equation}",
+            r"\begin{verbatim}",
+            r"\section{Not a section} % not a comment",
+            r"\end{verbatim}",
+            r"\end{document}",
+        ]
+    )
+    tokenized = tokenize(text)
+
+    [label] = [t for t in tokenized.tokens if t.name == "label"]
+    assert label.environments == ("document", "equation")
+
+    # content in verbatim environment is not tokenized
+    assert all(t.name != "section" for t in tokenized.tokens)
+    assert all(t.kind != TokenKind.COMMENT for t in tokenized.tokens)
+
+    assert [
+        (e.name, e.span.start_line, e.span.end_line) for e in tokenized.environments
+    ] == [
+        ("document", 0, 7),
+        ("equation", 1, 3),
+        ("verbatim", 4, 6),
+    ]
+
+
+def test_tokenize_byte_offsets():
+    text = "Ärger ∂x\n\\label{ü}"
+    [label] = tokenize(text).tokens
+
+    assert label.args == ("ü",)
+    assert label.span.start == text.index("\\label")
+    assert label.span.start_byte == len("Ärger ∂x\n".encode("utf-8"))
+    assert label.span.end_byte == len(text.encode("utf-8"))
+
+
+def test_tokenize_unclosed_arguments():
+    # missing arguments are not included, and do not crash tokenizer
+    tokens = tokenize("\\section\n\n{Not an argument}\n\\label{unclosed").tokens
+    assert [(t.name, t.args) for t in tokens] == [("section", ()), ("label", ())]
@@ -6,7 +6,10 @@ from genai_latex_proofreader.latex_interface.data_model import (
     to_latex,
 )
 from genai_latex_proofreader.latex_interface.parser import parse_from_latex
-from genai_latex_proofreader.proofread_comments.add_comments import add_comments
+from genai_latex_proofreader.proofread_comments.add_comments import (
+    CommentOverlay,
+    add_comments,
+)
 
 
 def test_add_comments_fails_if_reference_is_invalid():
@@ -71,3 +74,53 @@ We are proofreading this section, and ir has a typo.
         < modified_latex.index(proofreading_comment)
         < modified_latex.index("We are proofreading this section, and ir has a typo.")
     )
+
+
+def test_comment_overlay():
+    input_latex = r"""\documentclass{article}
+
+\begin{document}
+\maketitle
+
+\section{Introduction}
+An introduction.
+
+\section{Method}
+A method.
+\end{document}"""
+
+    doc = parse_from_latex(input_latex)
+    _, intro_ref, method_ref = list(doc.content_dict.keys())
+
+    overlay = CommentOverlay(doc)
+    assert overlay.materialize() is doc
+
+    updates = [(intro_ref, "comment 1"), (method_ref, "comment 2")]
+    updates += [(intro_ref, "comment 3")]
+
+    expected_doc = doc
+    for section_ref, comment in updates:
+        overlay = overlay.add(section_ref, [comment])
+        expected_doc = add_comments(expected_doc, section_ref, [comment])
+
+    assert to_latex(overlay.materialize()) == to_latex(expected_doc)
+    assert overlay.comments() == {
+        intro_ref: ["comment 3", "comment 1"],
+        method_ref: ["comment 2"],
+    }
+
+    # base document is not modified, and content without comments is shared
+    assert "comment" not in to_latex(doc)
+    assert overlay.base is doc
+    materialized = overlay.materialize()
+    assert materialized.content_dict[PreSectionRef(in_appendix=False)] is (
+        doc.content_dict[PreSectionRef(in_appendix=False)]
+    )
+
+    with pytest.raises(ValueError):
+        overlay.add(
+            SectionRef(
+                in_appendix=True, title="Method", label=None, generated_label="xx"
+            ),
+            ["..."],
+        )
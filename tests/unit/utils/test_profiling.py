@@ -0,0 +1,63 @@
+from pathlib import Path
+
+import pytest
+
+from genai_latex_proofreader.compile_latex import compile_latex
+from genai_latex_proofreader.utils import profiling
+from genai_latex_proofreader.utils.io import read_directory, write_directory
+from genai_latex_proofreader.utils.profiling import (
+    RunProfiler,
+    stage,
+    start_profiling,
+    stop_profiling,
+)
+
+
+@pytest.fixture
+def profiler():
+    yield start_profiling(RunProfiler(top_functions=5))
+    stop_profiling()
+
+
+def test_profiling_disabled(tmp_path: Path):
+    stop_profiling()
+    with stage("stage"):
+        write_directory({Path("a.txt"): b"abc"}, tmp_path)
+    assert profiling._profiler is None
+
+
+def test_stages_and_counters(profiler: RunProfiler, tmp_path: Path):
+    files = {Path("a.txt"): 1000 * b"a", Path("sub/b.txt"): 500 * b"b"}
+
+    with stage("write"):
+        write_directory(files, tmp_path)
+    with stage("allocate"):
+        data = [bytearray(1024) for _ in range(1000)]
+    with stage("read"):
+        assert read_directory(tmp_path) == files
+    with stage("compile"):
+        compile_latex(files, Path("a.txt"), compile_commands=lambda path: ["true"] * 3)
+    stop_profiling()
+
+    assert [stage.name for stage in profiler.stages] == [
+        "write",
+        "allocate",
+        "read",
+        "compile",
+    ]
+    allocate = profiler.stages[1]
+    assert allocate.growth_bytes >= 1000 * 1024
+    assert allocate.peak_bytes >= allocate.growth_bytes
+    assert len(allocate.top_allocations) > 0
+    del data
+
+    assert profiler.tex_invocations == 3
+    # files are copied to the temporary compile directory, and the output files are
+    # read after each of the 3 commands
+    assert (profiler.write_calls, profiler.bytes_written) == (2, 3000)
+    assert (profiler.read_calls, profiler.bytes_read) == (4, 6000)
+
+    summary = profiler.summary()
+    assert " - allocate: " in summary
+    assert "TeX invocations: 3" in summary
+    assert "cumulative" in summary
@@ -1,8 +1,14 @@
+import time
 from pathlib import Path
 
 import pytest
 
-from genai_latex_proofreader.utils.run_commands import CommandResult, run_commands
+from genai_latex_proofreader.utils.run_commands import (
+    CommandLimits,
+    CommandResult,
+    CommandStatus,
+    run_commands,
+)
 
 
 def test_run_commands_all_success():
@@ -51,3 +57,55 @@ def test_run_commands_fail_with_no_commands():
     with pytest.raises(Exception) as e:
         run_commands(files={}, commands=[])
     assert str(e.value) == "No compile commands provided"
+
+
+def test_run_commands_stops_command_after_wall_clock_limit():
+    started = time.monotonic()
+    results = run_commands(
+        {},
+        ["sleep 10", "echo 'not executed'"],
+        limits=CommandLimits(wall_clock_seconds=0.5),
+    )
+    assert time.monotonic() - started < 5
+
+    [result] = results
+    assert result.status == CommandStatus.TIMED_OUT
+    assert result.returncode != 0
+    assert not result.succeeded
+
+
+def test_run_commands_stops_command_after_cpu_time_limit():
+    [result] = run_commands(
+        {}, ["while :; do :; done"], limits=CommandLimits(cpu_seconds=1)
+    )
+    assert result.status == CommandStatus.CPU_LIMIT_EXCEEDED
+    assert result.returncode != 0
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        # same line repeated to stdout
+        "yes 'Overfull hbox in paragraph'",
+        # log file that keeps growing without any output to stdout
+        "while :; do echo 'Overfull hbox in paragraph' >> main.log; done",
+    ],
+)
+def test_run_commands_stops_command_stuck_in_loop(command: str):
+    [result] = run_commands(
+        {},
+        [command],
+        limits=CommandLimits(max_repeated_lines=100, max_output_bytes=100_000),
+    )
+    assert result.status == CommandStatus.LOOP_DETECTED
+    assert result.returncode != 0
+
+
+def test_run_commands_limits_do_not_affect_normal_commands():
+    [result] = run_commands(
+        {},
+        ["for i in 1 2 3; do echo 'same line'; done"],
+        limits=CommandLimits(max_repeated_lines=10),
+    )
+    assert result.status == CommandStatus.COMPLETED
+    assert result.succeeded
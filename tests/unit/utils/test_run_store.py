@@ -0,0 +1,153 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from genai_latex_proofreader.genai_interface.query_log import query_log_text
+from genai_latex_proofreader.utils.run_store import (
+    CompileRecord,
+    QueryRecord,
+    RunStore,
+    export_text_logs,
+    persona_of_label,
+)
+
+
+def _query(
+    call_id: int,
+    label: str,
+    response: str = "response",
+    section: Optional[str] = None,
+) -> QueryRecord:
+    return QueryRecord(
+        call_id=call_id,
+        label=label,
+        system_prompt="system prompt",
+        user_prompt="user prompt " * 100,
+        response=response,
+        model="model-a",
+        input_tokens=100,
+        output_tokens=10 * call_id,
+        latency_seconds=0.5,
+        section=section,
+    )
+
+
+def test_persona_of_label():
+    assert (
+        persona_of_label(
+            """English language expert: Proofread "Section 'Methods'" of paper"""
+        )
+        == "English language expert"
+    )
+    assert (
+        persona_of_label(
+            "Domain expert: Check that the title, abstract and introduction match"
+        )
+        == "Domain expert"
+    )
+    assert persona_of_label("latex-guard") is None
+
+
+def test_queries_and_compiles_are_stored(tmp_path: Path):
+    path = tmp_path / "runs.sqlite"
+    store = RunStore(path, run_id="run-1")
+
+    # records are queued from many threads
+    threads = [
+        threading.Thread(
+            target=store.record_query,
+            args=(
+                _query(
+                    idx,
+                    f"Expert: Proofread 'Section '{idx % 2}'' of paper",
+                    section=str(idx % 2),
+                ),
+            ),
+        )
+        for idx in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.record_compile(
+        CompileRecord(
+            label="latex-guard",
+            status="completed",
+            returncode=1,
+            succeeded=False,
+            seconds=1.5,
+            stdout="! Undefined control sequence.",
+            stderr="",
+        )
+    )
+    store.close()
+    assert store.queries == 20 and store.compiles == 1
+
+    # a second run in the same database
+    store = RunStore(path, run_id="run-2")
+    store.record_query(_query(0, "latex-guard"))
+    store.close()
+
+    connection = sqlite3.connect(path)
+    assert connection.execute(
+        "SELECT section, COUNT(*), SUM(output_tokens) FROM queries "
+        "WHERE run_id = 'run-1' GROUP BY section ORDER BY section"
+    ).fetchall() == [("0", 10, 900), ("1", 10, 1000)]
+    assert connection.execute(
+        "SELECT run_id, label, status, succeeded FROM compiles"
+    ).fetchall() == [("run-1", "latex-guard", "completed", 0)]
+
+    # prompts are compressed
+    (user_prompt,) = connection.execute(
+        "SELECT user_prompt FROM queries WHERE run_id = 'run-2'"
+    ).fetchone()
+    assert len(user_prompt) < len("user prompt " * 100)
+
+    # queries by persona use an index
+    plan = connection.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM queries WHERE persona = 'Expert'"
+    ).fetchall()
+    assert "queries_persona" in str(plan)
+
+
+def test_export_text_logs(tmp_path: Path):
+    path = tmp_path / "runs.sqlite"
+    for run_id in ["run-1", "run-2"]:
+        store = RunStore(path, run_id=run_id)
+        store.record_query(_query(0, "Expert", response=f"response of {run_id}"))
+        store.close()
+
+    logs = export_text_logs(path, tmp_path / "logs", run_id="run-2")
+    assert len(logs) == 1
+    assert logs[0].read_text() == query_log_text(
+        0, "system prompt", "user prompt " * 100, "response of run-2"
+    )
+
+    # queries with the same name (in different runs) are exported to separate logs
+    logs = export_text_logs(path, tmp_path / "all-logs")
+    assert len(set(logs)) == 2
+    assert {log.read_text().count("response of run-") for log in logs} == {1}
+
+
+def test_write_errors_are_reported(tmp_path: Path, monkeypatch):
+    store = RunStore(tmp_path / "runs.sqlite", run_id="run-1")
+
+    def _insert(connection: sqlite3.Connection, record: QueryRecord):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(store, "_insert", _insert)
+    for idx in range(3):
+        store.record_query(_query(idx, "Expert"))
+    with pytest.raises(Exception, match="3 records were not stored"):
+        store.close()
+
+    # the writer thread stopped, and later records are dropped
+    assert not store._writer.is_alive()
+    store.record_query(_query(3, "Expert"))
+    assert store._queue.empty()
+    assert store.dropped == 4
+    assert "Not stored: 4 records" in store.summary()
@@ -1,5 +1,7 @@
 from genai_latex_proofreader.utils.splitters import (
     split_at_first_lambda,
+    split_indices_at_lambda,
+    split_indices_at_lambdas,
     split_list_at_lambda,
     split_list_at_lambdas,
 )
@@ -124,3 +126,50 @@ def test_split_list_at_lambda():
 
     # match last element
     assert split_list_at_lambda([1, 3, 2], f) == ([1, 3], [("200", [])])
+
+
+# --- test index based splitters ---
+
+
+def test_split_indices_at_lambdas():
+    xs = [1, 2, 3, 4, 5, 6, 7, 9, 10, 11]
+    split_lambdas = [
+        lambda x: "match-3" if x == 3 else None,
+        lambda x: "match-8" if x == 8 else None,  # <- no match
+        lambda x: "match-10" if x == 10 else None,
+    ]
+    assert split_indices_at_lambdas(xs, split_lambdas) == (
+        range(0, 2),
+        [("match-3", range(3, 8)), ("match-10", range(9, 10))],
+    )
+
+    # no match
+    assert split_indices_at_lambdas(xs, [lambda _: None]) == (range(0, 10), [])
+
+
+def test_split_indices_at_lambda():
+    f = lambda x: "200" if x == 2 else None
+
+    assert split_indices_at_lambda([1, 2, 3, 3, 2, 1, 2], f) == (
+        range(0, 1),
+        [("200", range(2, 4)), ("200", range(5, 6)), ("200", range(7, 7))],
+    )
+    assert split_indices_at_lambda([1, 3], f) == (range(0, 2), [])
+    assert split_indices_at_lambda([], f) == (range(0, 0), [])
+
+
+def test_splitters_with_many_split_points():
+    # Earlier recursive implementations of the splitters exceeded Python's recursion
+    # limit for inputs with more than ~1000 split points.
+    xs = [f"line {idx}" if idx % 3 else r"\section{...}" for idx in range(30_000)]
+    is_section = lambda x: x if x.startswith(r"\section") else None
+
+    head, splits = split_list_at_lambda(xs, is_section)
+    assert head == []
+    assert len(splits) == 10_000
+    assert splits[0] == (r"\section{...}", ["line 1", "line 2"])
+    assert splits[-1] == (r"\section{...}", ["line 29998", "line 29999"])
+
+    head, splits = split_list_at_lambdas(xs, [is_section] * 5_000)
+    assert len(splits) == 5_000
+    assert splits[-1][1] == xs[(3 * 4_999) + 1 :]
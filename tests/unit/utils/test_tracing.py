@@ -0,0 +1,72 @@
+import json
+import threading
+from pathlib import Path
+
+import pytest
+
+from genai_latex_proofreader.utils import tracing
+from genai_latex_proofreader.utils.tracing import (
+    disable_tracing,
+    enable_tracing,
+    span,
+    traced,
+)
+
+
+@pytest.fixture
+def tracer():
+    yield enable_tracing()
+    disable_tracing()
+
+
+@traced()
+def _stage(value: int) -> int:
+    with span("inner", value=value) as inner:
+        inner.set(result=2 * value)
+    return 2 * value
+
+
+def test_tracing_disabled():
+    disable_tracing()
+    # no spans are created
+    assert span("stage", value=1) is span("other stage")
+    with span("stage") as stage_span:
+        stage_span.set(value=1)
+    assert _stage(2) == 4
+    assert tracing._tracer is None
+
+
+def test_nested_spans(tracer: tracing.Tracer, tmp_path: Path):
+    assert _stage(1) == 2
+    threads = [threading.Thread(target=_stage, args=(idx,)) for idx in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with pytest.raises(ValueError):
+        with span("failing stage", path=tmp_path):
+            raise ValueError("failed")
+
+    tracer.write_chrome_trace(tmp_path / "trace.json")
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    events = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    names = [event["name"] for event in events]
+    assert names.count("_stage") == 4 and names.count("inner") == 4
+    # thread names are included
+    assert "MainThread" in [
+        event["args"]["name"] for event in trace["traceEvents"] if event["ph"] == "M"
+    ]
+
+    # the inner span is nested in the outer span (of the same thread)
+    outer, inner = events[1], events[0]
+    assert (outer["name"], inner["name"]) == ("_stage", "inner")
+    assert outer["tid"] == inner["tid"]
+    assert outer["ts"] <= inner["ts"]
+    assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    assert inner["args"] == {"value": 1, "result": 2}
+
+    failing = events[-1]
+    assert failing["args"] == {"path": str(tmp_path), "error": "ValueError('failed')"}
+
+    assert "_stage" in tracer.summary()